@@ -0,0 +1,332 @@
+"""
+ASGI-точка входа (асинхронный режим):
+
+    uvicorn app.asgi:application --port 5500
+
+Потоковая генерация текста (Server-Sent Events) обрабатывается здесь
+корутиной на AsyncOpenAI: пока модель отвечает, поток не занят, поэтому
+один процесс держит сотни одновременных потоков. JSON-запросы к статистике
+тоже обрабатываются корутиной (запрос к базе выполняется в потоке).
+Остальные запросы передаются обычному Flask-приложению через
+asgiref.wsgi.WsgiToAsgi. Генерация изображений и публикация, как и в
+синхронном режиме, идут через очередь задач (маршрут smm.post_generator
+отвечает 202 с ID задачи), поэтому учет задач одинаков в обоих режимах.
+
+Тело запроса больше MAX_CONTENT_LENGTH отклоняется с ответом 413 до того,
+как оно будет прочитано целиком.
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie
+
+from core import metrics
+
+
+class AsyncApp:
+    """
+    ASGI-приложение: асинхронные обработчики для потоковой генерации и
+    vk_stats и Flask-приложение для всего остального.
+
+    Обработчик vk_stats отвечает только клиентам, запросившим JSON
+    (Accept: application/json), — HTML-страницы отдает Flask.
+    """
+
+    def __init__(self, flask_app):
+        """
+        :param flask_app: Приложение из create_app()
+        """
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        # Маршрут -> (обработчик, тип из Accept, без которого запрос отдает Flask).
+        self.routes = {
+            ("GET", "/smm/vk-stats"): (self.vk_stats, b"application/json"),
+            ("GET", "/smm/post-generator/stream"): (
+                self.post_generator_stream,
+                None,
+            ),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] == "http":
+            body = await _read_body(
+                scope, receive, self.flask_app.config["MAX_CONTENT_LENGTH"]
+            )
+            if body is None:
+                await _send_json(send, 413, {"error": "Request body too large"})
+                return
+            handler, accept = self.routes.get(
+                (scope["method"], scope["path"]), (None, None)
+            )
+            if handler is not None and (accept is None or _accepts(scope, accept)):
+                # Тело уже прочитано: receive дальше сообщает только об
+                # отключении клиента.
+                await handler(scope, receive, send)
+                return
+            receive = _replay(body)
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        from core.clients import aclose_loop_clients
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await aclose_loop_clients()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def vk_stats(self, scope, receive, send):
+        """
+        Возвращает страницу сохраненной статистики постов группы в JSON —
+        тот же ответ, что у маршрута smm.vk_stats (данные из таблицы PostStat,
+        которую заполняет задача stats_sync; см. app.stats_sync).
+
+        Параметр запроса page — номер страницы (по STATS_PAGE_SIZE постов).
+        """
+        user = await self.load_user(scope)
+        if user is None:
+            await _send_json(send, 401, {"error": "Unauthorized"})
+            return
+        if not user.vk_group_id:
+            await _send_json(send, 400, {"error": "VK group is not configured"})
+            return
+
+        query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        try:
+            page = max(int(query.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+
+        with metrics.trace("asgi.vk_stats"):
+            # Запрос к базе выполняется в потоке, не блокируя цикл событий.
+            payload = await asyncio.to_thread(self._post_stats, user, page)
+        await _send_json(send, 200, payload)
+
+    async def post_generator_stream(self, scope, receive, send):
+        """
+        Генерирует текст поста потоково — те же события Server-Sent Events,
+        что у маршрута smm.post_generator_stream, но фрагменты приходят от
+        AsyncOpenAI в цикле событий. Если клиент отключился, генерация
+        прекращается.
+        """
+        from app.publishing import prompt_platform
+        from app.smm import post_stream_params, sse_event
+        from config import openai_key
+        from generators.text_gen import PostGenerator
+
+        user = await self.load_user(scope)
+        if user is None:
+            await _send_json(send, 401, {"error": "Unauthorized"})
+            return
+        query = scope.get("query_string", b"").decode("latin-1")
+        try:
+            params = post_stream_params(
+                MultiDict(parse_qsl(query, keep_blank_values=True))
+            )
+        except KeyError as e:
+            await _send_json(send, 400, {"error": f"Missing parameter: {e.args[0]}"})
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+
+        async def emit(event, data):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": sse_event(event, data).encode("utf-8"),
+                    "more_body": True,
+                }
+            )
+
+        with metrics.trace("asgi.post_generator_stream"):
+            post_gen = PostGenerator(
+                openai_key,
+                params["tone"],
+                params["topic"],
+                platform=prompt_platform(params["targets"]),
+            )
+            tokens = post_gen.astream_post(force=params["force_regenerate"])
+            parts = []
+            try:
+                async for token in tokens:
+                    if disconnected.done():
+                        return
+                    parts.append(token)
+                    await emit("token", {"token": token})
+            except Exception as e:
+                await emit("error", {"error": str(e)})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            finally:
+                await tokens.aclose()
+                disconnected.cancel()
+
+            done = {"post_content": "".join(parts), "job_id": None}
+            if params["generate_image"] or params["auto_post"]:
+                job_params = dict(params, post_content=done["post_content"])
+                done["job_id"] = await asyncio.to_thread(
+                    self._enqueue_job, user.id, "post", job_params
+                )
+            await emit("done", done)
+        await send({"type": "http.response.body", "body": b""})
+
+    def _enqueue_job(self, user_id, kind, params):
+        from app.jobs import enqueue_job
+
+        with self.flask_app.app_context():
+            return enqueue_job(user_id, kind, params).id
+
+    def _post_stats(self, user, page):
+        from app.jobs import enqueue_job
+        from app.stats_sync import post_stats_json, post_stats_page
+
+        with self.flask_app.app_context():
+            pagination, stats = post_stats_page(
+                user.vk_group_id, page, self.flask_app.config["STATS_PAGE_SIZE"]
+            )
+            sync_started = pagination.total == 0
+            if sync_started:
+                enqueue_job(user.id, "stats_sync", {})
+            return post_stats_json(user.vk_group_id, pagination, stats, sync_started)
+
+    async def load_user(self, scope):
+        """
+        Определяет пользователя по cookie сессии Flask.
+
+        :return: CurrentUser (см. app.users) или None
+        """
+        headers = dict(scope["headers"])
+        cookies = parse_cookie(headers.get(b"cookie", b"").decode("latin-1"))
+        value = cookies.get(self.flask_app.config["SESSION_COOKIE_NAME"])
+        if not value:
+            return None
+        serializer = self.flask_app.session_interface.get_signing_serializer(
+            self.flask_app
+        )
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            user_id = serializer.loads(value, max_age=max_age).get("user_id")
+        except Exception:
+            return None
+        if user_id is None:
+            return None
+        # Кэш пользователей почти всегда отвечает из памяти; при промахе
+        # запрос к базе выполняется в потоке, не блокируя цикл событий.
+        return await asyncio.to_thread(self._load_user, user_id)
+
+    def _load_user(self, user_id):
+        from app.users import get_user_cache
+
+        with self.flask_app.app_context():
+            return get_user_cache().get(user_id)
+
+
+def create_asgi_app(flask_app=None):
+    """
+    :param flask_app: Приложение из create_app(); по умолчанию создается новое
+    :return: ASGI-приложение
+    """
+    if flask_app is None:
+        from app import create_app
+
+        flask_app = create_app()
+    return AsyncApp(flask_app)
+
+
+def _accepts(scope, mimetype):
+    for name, value in scope["headers"]:
+        if name == b"accept":
+            return mimetype in value
+    return False
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _read_body(scope, receive, max_length=None):
+    """
+    :return: Тело запроса или None, если оно длиннее max_length байт
+    """
+    for name, value in scope["headers"]:
+        if name == b"content-length" and max_length is not None:
+            try:
+                if int(value) > max_length:
+                    return None
+            except ValueError:
+                return None
+    chunks = []
+    length = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        length += len(chunk)
+        if max_length is not None and length > max_length:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _replay(body):
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+_application = None
+
+
+def __getattr__(name):
+    # Приложение для uvicorn app.asgi:application создается при первом
+    # обращении, а не при импорте модуля (например, в бенчмарках).
+    global _application
+    if name == "application":
+        if _application is None:
+            _application = create_asgi_app()
+        return _application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,14 @@
+import math
+
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
 from flask_wtf import FlaskForm
 from wtforms import PasswordField, StringField, SubmitField
 from wtforms.validators import EqualTo, InputRequired, Length, ValidationError
 
-from app import bcrypt, db
+from app import db
 from app.models import User
+from core import metrics
+from core.passwords import get_login_throttle, get_password_hasher
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -76,16 +80,15 @@ def register():
     Обрабатывает регистрацию новых пользователей.
 
     - GET: Отображает страницу регистрации с формой.
-    - POST: Проверяет данные формы, хэширует пароль и сохраняет нового пользователя в базу данных.
+    - POST: Проверяет данные формы, хэширует пароль (в пуле процессов, см. core.passwords)
+      и сохраняет нового пользователя в базу данных.
 
     Возвращает:
         render_template: Страницу с формой регистрации или перенаправление на страницу входа после успешной регистрации.
     """
     form = RegisterForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        hashed_password = get_password_hasher().hash(form.password.data)
         user = User(username=form.username.data, password=hashed_password)
         db.session.add(user)
         db.session.commit()
@@ -100,19 +103,45 @@ def login():
     Обрабатывает вход существующих пользователей.
 
     - GET: Отображает страницу входа с формой.
-    - POST: Проверяет данные формы и аутентифицирует пользователя.
+    - POST: Проверяет данные формы и аутентифицирует пользователя. Хэш пароля,
+      посчитанный с устаревшей стоимостью, заменяется новым. После
+      LOGIN_MAX_ATTEMPTS неудачных попыток вход под этим именем временно
+      отклоняется без проверки пароля (ответ 429).
 
     Возвращает:
         render_template: Страницу с формой входа или перенаправление на панель управления после успешного входа.
     """
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        username = form.username.data
+        throttle = get_login_throttle()
+        retry_after = throttle.retry_after(username)
+        if retry_after:
+            metrics.record_login("throttled")
+            flash(
+                f"Too many login attempts. Try again in {math.ceil(retry_after)} seconds.",
+                "danger",
+            )
+            return render_template("login.html", form=form), 429
+
+        user = User.query.filter_by(username=username).first()
+        valid, new_hash = False, None
+        if user:
+            valid, new_hash = get_password_hasher().verify(
+                user.password, form.password.data
+            )
+        if valid:
+            if new_hash:
+                user.password = new_hash
+                db.session.commit()
+            throttle.reset(username)
+            metrics.record_login("ok")
             session["user_id"] = user.id
             flash("Logged in successfully!", "success")
             return redirect(url_for("smm.dashboard"))
         else:
+            throttle.failure(username)
+            metrics.record_login("failed")
             flash("Invalid credentials", "danger")
     return render_template("login.html", form=form)
 
@@ -0,0 +1,122 @@
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+
+# Диалекты с INSERT ... ON CONFLICT DO UPDATE.
+UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+# Сколько строк отправлять одним INSERT: у SQLite есть лимит на число
+# параметров в запросе (32766), у остальных баз — на размер пакета.
+BULK_CHUNK_SIZE = 500
+
+
+def engine_options(config):
+    """
+    Собирает параметры движка SQLAlchemy из настроек приложения.
+
+    Для SQLite пул соединений не настраивается (у файловой базы он не
+    ограничивает параллельную запись), для PostgreSQL и других баз
+    используются DB_POOL_SIZE, DB_MAX_OVERFLOW и DB_POOL_RECYCLE.
+
+    :param config: Конфигурация Flask-приложения
+    :return: Словарь для SQLALCHEMY_ENGINE_OPTIONS
+    """
+    options = {"pool_pre_ping": config["DB_POOL_PRE_PING"]}
+    if not config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        options["pool_size"] = config["DB_POOL_SIZE"]
+        options["max_overflow"] = config["DB_MAX_OVERFLOW"]
+        options["pool_recycle"] = config["DB_POOL_RECYCLE"]
+    options.update(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    return options
+
+
+def init_database(app):
+    """
+    Настраивает движок базы данных приложения.
+
+    Для SQLite на каждом новом соединении включаются WAL (читатели не
+    блокируют писателя), busy_timeout (писатели ждут блокировку вместо
+    ошибки "database is locked") и synchronous=NORMAL.
+
+    :param app: Flask-приложение (после db.init_app)
+    """
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != "sqlite":
+        return
+
+    wal = app.config["SQLITE_WAL"]
+    busy_timeout = int(app.config["SQLITE_BUSY_TIMEOUT"])
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(connection, record):
+        cursor = connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+        if wal:
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+
+def chunked(rows, size=BULK_CHUNK_SIZE):
+    """
+    Разбивает список строк на части не длиннее size.
+    """
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def bulk_insert(model, rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Вставляет много строк пакетами без создания объектов модели.
+
+    Коммит не выполняется: строки попадают в текущую транзакцию сессии.
+
+    :param model: Модель SQLAlchemy
+    :param rows: Список словарей со значениями колонок
+    :param chunk_size: Размер одного пакета
+    :return: Количество вставленных строк
+    """
+    for chunk in chunked(rows, chunk_size):
+        db.session.execute(db.insert(model), chunk)
+    return len(rows)
+
+
+def bulk_upsert(
+    model, rows, index_elements, update_columns, chunk_size=BULK_CHUNK_SIZE
+):
+    """
+    Вставляет строки или обновляет существующие (по уникальному ключу) пакетами.
+
+    Для баз без ON CONFLICT строки обновляются по одной.
+    Коммит не выполняется.
+
+    :param model: Модель SQLAlchemy
+    :param rows: Список словарей со значениями колонок
+    :param index_elements: Колонки уникального ключа
+    :param update_columns: Колонки, которые обновляются при конфликте
+    :param chunk_size: Размер одного пакета
+    :return: Количество обработанных строк
+    """
+    insert = UPSERT_DIALECTS.get(db.engine.dialect.name)
+    if insert is None:
+        for row in rows:
+            instance = model.query.filter_by(
+                **{column: row[column] for column in index_elements}
+            ).first()
+            if instance is None:
+                db.session.add(model(**row))
+            else:
+                for column in update_columns:
+                    setattr(instance, column, row[column])
+        return len(rows)
+
+    for chunk in chunked(rows, chunk_size):
+        statement = insert(model).values(chunk)
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: statement.excluded[column] for column in update_columns},
+        )
+        db.session.execute(statement)
+    return len(rows)
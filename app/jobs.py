@@ -0,0 +1,503 @@
+import datetime
+import threading
+import traceback
+
+from flask import current_app
+
+from app import db
+from app.models import Batch, Job, User
+from app.publishing import (
+    apublish_carousel,
+    create_user_publishers,
+    get_dispatcher,
+    prompt_platform,
+)
+from app.scheduler import schedule_post
+from core import metrics
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Максимум изображений в посте-карусели: VK принимает до 10 вложений,
+# DALL-E 2 генерирует до 10 изображений за запрос.
+MAX_POST_IMAGES = 10
+
+
+def enqueue_job(user_id, kind, params):
+    """
+    Ставит задачу в очередь и будит обработчик очереди.
+
+    :param user_id: ID пользователя, от имени которого выполняется задача
+    :param kind: Тип задачи (ключ в JOB_HANDLERS)
+    :param params: Параметры задачи (JSON-совместимый словарь)
+    :return: Созданная задача Job
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    job = Job(user_id=user_id, kind=kind, params=params, status=STATUS_QUEUED)
+    db.session.add(job)
+    db.session.commit()
+
+    current_app.extensions["job_queue"].notify()
+    return job
+
+
+def claim_job():
+    """
+    Атомарно забирает самую старую задачу из очереди.
+
+    Статус меняется через UPDATE ... WHERE status = 'queued', поэтому
+    одну и ту же задачу не заберут два воркера одновременно. Задача
+    берется в аренду на JOBS_LEASE_SECONDS секунд; перед выбором в очередь
+    возвращаются задачи с истекшей арендой (см. requeue_expired_jobs).
+
+    :return: Задача Job в статусе running или None, если очередь пуста
+    """
+    requeue_expired_jobs()
+    while True:
+        job_id = (
+            db.session.query(Job.id)
+            .filter_by(status=STATUS_QUEUED)
+            .order_by(Job.id)
+            .limit(1)
+            .scalar()
+        )
+        if job_id is None:
+            return None
+
+        claimed = Job.query.filter_by(id=job_id, status=STATUS_QUEUED).update(
+            {
+                "status": STATUS_RUNNING,
+                "attempts": Job.attempts + 1,
+                "lease_expires_at": _lease_expires_at(),
+            },
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+
+def requeue_expired_jobs():
+    """
+    Возвращает в очередь задачи в статусе running, аренда которых истекла:
+    процесс, забравший задачу, завершился, не сохранив результат. Задача,
+    прерванная JOBS_MAX_ATTEMPTS раз, помечается как failed.
+
+    :return: Количество возвращенных в очередь задач
+    """
+    now = datetime.datetime.utcnow()
+    expired = Job.query.filter(
+        Job.status == STATUS_RUNNING,
+        db.or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < now),
+    )
+    max_attempts = current_app.config.get("JOBS_MAX_ATTEMPTS", 3)
+    expired.filter(Job.attempts >= max_attempts).update(
+        {
+            "status": STATUS_FAILED,
+            "error": "Job was interrupted too many times",
+            "lease_expires_at": None,
+        },
+        synchronize_session=False,
+    )
+    count = expired.update(
+        {"status": STATUS_QUEUED, "lease_expires_at": None},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return count
+
+
+def _lease_expires_at():
+    lease = current_app.config.get("JOBS_LEASE_SECONDS", 900)
+    return datetime.datetime.utcnow() + datetime.timedelta(seconds=lease)
+
+
+def parse_image_count(value):
+    """
+    :param value: Значение параметра image_count из формы или запроса
+    :return: Количество изображений поста от 1 до MAX_POST_IMAGES
+    """
+    try:
+        count = int(value or 1)
+    except (TypeError, ValueError):
+        return 1
+    return min(max(count, 1), MAX_POST_IMAGES)
+
+
+def set_progress(job, progress):
+    """
+    Сохраняет текстовое описание текущего шага задачи и продлевает ее аренду.
+
+    :param job: Задача Job
+    :param progress: Описание шага
+    """
+    job.progress = progress
+    job.lease_expires_at = _lease_expires_at()
+    db.session.commit()
+
+
+def run_job(job):
+    """
+    Выполняет задачу и сохраняет результат или ошибку.
+
+    :param job: Задача Job в статусе running
+    """
+    handler = JOB_HANDLERS[job.kind]
+    with metrics.trace(f"job.{job.kind}"):
+        try:
+            job.result = handler(job)
+            job.status = STATUS_DONE
+            job.progress = None
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(traceback.format_exc())
+            job.status = STATUS_FAILED
+            job.error = str(e)
+        job.lease_expires_at = None
+        db.session.commit()
+
+
+def run_post_job(job):
+    """
+    Генерирует пост (и изображения при необходимости) и публикует его
+    на выбранных площадках.
+
+    :param job: Задача Job с параметрами tone, topic, generate_image,
+        (необязательно) image_count, auto_post, targets (площадки, по
+        умолчанию VK), force_regenerate, publish_at для отложенной публикации
+        и готовым текстом post_content
+    :return: Словарь с результатами: post_content, image_url, image_urls,
+        published, targets (результат каждой площадки)
+    :raises Exception: Если пост не опубликован ни на одной площадке
+    """
+    from config import openai_key
+    from core.clients import run_async
+    from generators.image_gen import ImageGenerator
+    from generators.text_gen import PostGenerator
+    from social_publishers.dispatcher import failure_message, published
+
+    params = job.params
+    user = db.session.get(User, job.user_id)
+    targets = params.get("targets") or ["vk"]
+
+    post_gen = PostGenerator(
+        openai_key,
+        params["tone"],
+        params["topic"],
+        platform=prompt_platform(targets),
+    )
+    force = params.get("force_regenerate", False)
+    image_count = params.get("image_count") or 1
+    if params.get("auto_post") and params.get("publish_at") and targets != ["vk"]:
+        raise ValueError("Scheduled posts can only be published to VK")
+    # Изображения карусели, которая публикуется сразу, генерируются вместе
+    # с публикацией (см. apublish_carousel), а не заранее.
+    carousel = (
+        params.get("generate_image")
+        and image_count > 1
+        and params.get("auto_post")
+        and not params.get("publish_at")
+    )
+    image_generator = None
+    if params.get("generate_image") and not carousel:
+        image_generator = ImageGenerator(openai_key)
+
+    if params.get("post_content") is not None:
+        # Текст уже сгенерирован (например, потоковым маршрутом).
+        post_content = params["post_content"]
+        image_prompt = None
+        image_urls = []
+        if params.get("generate_image"):
+            set_progress(job, "Generating image")
+            image_prompt = post_gen.generate_post_image_description(force=force)
+        if image_generator is not None and image_count > 1:
+            image_urls = image_generator.generate_images(
+                image_prompt, image_count, force=force
+            )
+        elif image_generator is not None:
+            image_urls = [image_generator.generate_image(image_prompt, force=force)]
+        image_urls = [url for url in image_urls if url]
+    else:
+        if params.get("generate_image"):
+            set_progress(job, "Generating post text and image")
+        else:
+            set_progress(job, "Generating post text")
+        bundle = post_gen.generate_bundle(
+            with_image=bool(params.get("generate_image")),
+            image_generator=image_generator,
+            force=force,
+            image_count=image_count,
+        )
+        post_content = bundle["post_content"]
+        image_prompt = bundle["image_prompt"]
+        image_urls = bundle["image_urls"]
+
+    results = {}
+    scheduled_post_id = None
+    if params.get("auto_post") and params.get("publish_at"):
+        set_progress(job, "Scheduling VK post")
+        scheduled = schedule_post(
+            user,
+            post_content,
+            # Время из формы (datetime-local) — локальное время сервера.
+            datetime.datetime.fromisoformat(params["publish_at"]).astimezone(),
+            image_url=image_urls[0] if image_urls else None,
+            idempotency_key=f"job-{job.id}",
+            image_urls=image_urls,
+        )
+        scheduled_post_id = scheduled.id
+    elif params.get("auto_post"):
+        set_progress(job, f"Publishing to {', '.join(targets)}")
+        publishers = create_user_publishers(user, targets, current_app.config)
+        dispatcher = get_dispatcher(current_app.config)
+        if carousel:
+            results, image_urls = run_async(
+                apublish_carousel(
+                    dispatcher,
+                    publishers,
+                    post_content,
+                    ImageGenerator(openai_key),
+                    image_prompt,
+                    image_count,
+                    force=force,
+                    guid=f"job-{job.id}",
+                )
+            )
+        else:
+            results = dispatcher.publish(
+                publishers, post_content, images=image_urls, guid=f"job-{job.id}"
+            )
+        if not published(results):
+            raise Exception(failure_message(results))
+
+    return {
+        "post_content": post_content,
+        "image_url": image_urls[0] if image_urls else None,
+        "image_urls": image_urls,
+        "published": published(results),
+        "targets": results,
+        "scheduled_post_id": scheduled_post_id,
+    }
+
+
+def run_bulk_job(job):
+    """
+    Генерирует все посты пакета (контент-плана) с ограниченной параллельностью.
+
+    Результат каждой строки сохраняется в BatchItem сразу по готовности,
+    поэтому страницу пакета можно просматривать во время генерации.
+
+    :param job: Задача Job с параметрами batch_id и force_regenerate
+    :return: Словарь с ключами batch_id, done, failed
+    """
+    from config import openai_key
+    from generators.bulk import BulkGenerator
+
+    batch = db.session.get(Batch, job.params["batch_id"])
+    items = list(batch.items)
+    rows = [
+        {"topic": item.topic, "tone": item.tone, "generate_image": item.generate_image}
+        for item in items
+    ]
+
+    batch.status = STATUS_RUNNING
+    set_progress(job, f"0/{len(rows)}")
+
+    generator = BulkGenerator(
+        openai_key,
+        max_concurrency=current_app.config.get("BULK_MAX_CONCURRENCY", 4),
+    )
+    done = failed = 0
+    for index, result in generator.iter_results(
+        rows, force=job.params.get("force_regenerate", False)
+    ):
+        item = items[index]
+        item.post_content = result["post_content"]
+        item.image_url = result["image_url"]
+        item.error = result["error"]
+        item.status = STATUS_FAILED if result["error"] else STATUS_DONE
+        done += 1
+        failed += bool(result["error"])
+        set_progress(job, f"{done}/{len(rows)}")
+
+    batch.status = STATUS_DONE
+    db.session.commit()
+    return {"batch_id": batch.id, "done": done, "failed": failed}
+
+
+def run_stats_sync_job(job):
+    """
+    Синхронизирует статистику стен всех групп пользователя с локальной базой.
+
+    :param job: Задача Job (параметр recent_days необязателен)
+    :return: Словарь с ключами fetched, changed и errors (по группам)
+    """
+    from app.response_cache import invalidate_responses
+    from app.stats_sync import sync_group_stats
+    from social_stats.vk_stats import VKStats
+
+    user = db.session.get(User, job.user_id)
+    recent_days = job.params.get(
+        "recent_days", current_app.config.get("STATS_SYNC_RECENT_DAYS", 7)
+    )
+    result = {"fetched": 0, "changed": 0, "errors": {}}
+    for group in user.stats_groups():
+        set_progress(job, f"Syncing VK wall statistics: {group['name']}")
+        vk_stats = VKStats(
+            group["vk_api_key"],
+            group["group_id"],
+            api_url=current_app.config.get("VK_API_URL"),
+        )
+        try:
+            synced = sync_group_stats(vk_stats, recent_days=recent_days)
+        except Exception as e:
+            db.session.rollback()
+            result["errors"][group["group_id"]] = str(e)
+            continue
+        result["fetched"] += synced["fetched"]
+        result["changed"] += synced["changed"]
+        if synced["changed"]:
+            invalidate_responses(group_id=group["group_id"])
+    return result
+
+
+JOB_HANDLERS = {
+    "post": run_post_job,
+    "bulk": run_bulk_job,
+    "stats_sync": run_stats_sync_job,
+}
+
+
+class JobWorker:
+    """
+    Пул потоков, выполняющий задачи из очереди в базе данных.
+
+    Потоки запускаются лениво, при первом вызове notify() или start().
+    Между проверками очереди поток ждет poll_interval секунд либо
+    сигнала notify() о новой задаче.
+    """
+
+    def __init__(self, app, workers=2, poll_interval=1.0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._loop, name=f"job-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_forever(self):
+        """Запускает потоки и блокирует вызывающий поток (для worker.py)."""
+        self.start()
+        try:
+            while not self._stopped.is_set():
+                self._stopped.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            with self.app.app_context():
+                job = claim_job()
+                if job is not None:
+                    run_job(job)
+                    db.session.remove()
+                    continue
+                db.session.remove()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+class InlineJobRunner:
+    """
+    Локальный обработчик очереди: выполняет задачи сразу в текущем потоке.
+
+    Подходит для тестов и отладки, когда фоновые потоки не нужны.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def start(self):
+        pass
+
+    def notify(self):
+        while True:
+            job = claim_job()
+            if job is None:
+                return
+            run_job(job)
+
+    def stop(self, timeout=None):
+        pass
+
+
+class ExternalJobQueue:
+    """
+    Очередь без локальных воркеров: задачи забирает отдельный процесс worker.py.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def start(self):
+        pass
+
+    def notify(self):
+        pass
+
+    def stop(self, timeout=None):
+        pass
+
+
+def init_jobs(app):
+    """
+    Подключает обработчик очереди задач к приложению.
+
+    Бэкенд выбирается параметром JOBS_BACKEND:
+        - "thread": пул потоков внутри процесса веб-приложения (по умолчанию);
+        - "inline": выполнение задач сразу при постановке в очередь;
+        - "external": задачи выполняет отдельный процесс worker.py.
+    """
+    backend = app.config.get("JOBS_BACKEND", "thread")
+    if backend == "thread":
+        queue = JobWorker(
+            app,
+            workers=app.config.get("JOBS_WORKERS", 2),
+            poll_interval=app.config.get("JOBS_POLL_INTERVAL", 1.0),
+        )
+    elif backend == "inline":
+        queue = InlineJobRunner(app)
+    elif backend == "external":
+        queue = ExternalJobQueue(app)
+    else:
+        raise ValueError(f"Unknown JOBS_BACKEND: {backend}")
+
+    app.extensions["job_queue"] = queue
+    return queue
@@ -0,0 +1,99 @@
+import hmac
+import time
+
+from flask import Response, abort, g, request, template_rendered
+from flask.signals import before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core import metrics
+
+
+def init_metrics(app):
+    """
+    Подключает сбор метрик к приложению и регистрирует маршрут /metrics.
+
+    Каждый HTTP-запрос становится трейсом; в него попадают спаны SQL-запросов,
+    рендера шаблонов и вызовов внешних API, сделанных при обработке запроса.
+
+    Метрики раскрывают маршруты, объем запросов и ошибки, поэтому /metrics
+    отвечает только с заголовком "Authorization: Bearer <METRICS_TOKEN>".
+    Без METRICS_TOKEN маршрут регистрируется, только если METRICS_PUBLIC
+    включен (например, порт приложения закрыт от внешней сети).
+    """
+    metrics.configure(
+        samples=app.config["METRICS_SAMPLES"],
+        slow_threshold=app.config["METRICS_SLOW_REQUEST_SECONDS"],
+    )
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    @app.before_request
+    def start_request_trace():
+        g.metrics_trace = metrics.start_trace(request.endpoint or "unknown")
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def end_request_trace(exc):
+        started = g.pop("metrics_trace", None)
+        if started is not None:
+            metrics.end_trace(
+                *started,
+                method=request.method,
+                status=g.pop("metrics_status", 500),
+            )
+
+    template_rendered.connect(_template_rendered, app)
+    before_render_template.connect(_before_render_template, app)
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    token = app.config["METRICS_TOKEN"]
+    if not token and not app.config["METRICS_PUBLIC"]:
+        return
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        if token and not _authorized(token):
+            abort(401)
+        return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _authorized(token):
+    scheme, _, value = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        value.strip().encode(), token.encode()
+    )
+
+
+def _before_render_template(sender, template, context, **extra):
+    g.setdefault("metrics_templates", []).append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    started = g.get("metrics_templates")
+    if started:
+        metrics.record_span(
+            "template",
+            time.perf_counter() - started.pop(),
+            template=template.name or "string",
+        )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_queries", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_queries")
+    if started:
+        operation = statement.lstrip().split(None, 1)[0].upper()
+        metrics.record_span(
+            "db.query", time.perf_counter() - started.pop(), operation=operation
+        )
@@ -0,0 +1,266 @@
+import datetime
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+
+from app import db
+
+# Применённые миграции записываются в таблицу schema_version. Новая база
+# создается сразу по текущим моделям и помечается последней версией;
+# существующая база получает только недостающие миграции по порядку.
+#
+# Чтобы изменить схему, поменяйте модель и добавьте в MIGRATIONS функцию,
+# которая приводит к тому же результату уже созданную базу.
+
+schema_version = sa.Table(
+    "schema_version",
+    sa.MetaData(),
+    sa.Column("version", sa.Integer, primary_key=True),
+    sa.Column("description", sa.String(250), nullable=False),
+    sa.Column("applied_at", sa.DateTime, nullable=False),
+)
+
+
+def create_missing_tables(connection):
+    """
+    Создает таблицы, которых еще нет (базы, созданные до появления миграций).
+    """
+    db.metadata.create_all(connection)
+
+
+def add_indexes(connection):
+    """
+    Добавляет индексы очереди задач, пакетов, расписания и статистики.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def add_scheduled_post_images(connection):
+    """
+    Добавляет колонку image_urls (изображения поста-карусели) в scheduled_post.
+    """
+    columns = {
+        column["name"]
+        for column in sa.inspect(connection).get_columns("scheduled_post")
+    }
+    if "image_urls" in columns:
+        return
+    column_type = db.metadata.tables["scheduled_post"].c.image_urls.type.compile(
+        dialect=connection.dialect
+    )
+    connection.execute(
+        sa.text(f"ALTER TABLE scheduled_post ADD COLUMN image_urls {column_type}")
+    )
+
+
+def add_user_telegram(connection):
+    """
+    Добавляет в user колонки telegram_bot_token и telegram_chat_id.
+    """
+    columns = {column["name"] for column in sa.inspect(connection).get_columns("user")}
+    table = db.metadata.tables["user"]
+    # user — зарезервированное слово в PostgreSQL, поэтому имя экранируется.
+    table_name = connection.dialect.identifier_preparer.quote_identifier("user")
+    for name in ("telegram_bot_token", "telegram_chat_id"):
+        if name in columns:
+            continue
+        column_type = table.c[name].type.compile(dialect=connection.dialect)
+        connection.execute(
+            sa.text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}")
+        )
+
+
+def add_job_lease(connection):
+    """
+    Добавляет в job колонки attempts и lease_expires_at (аренда задачи воркером).
+    """
+    columns = {column["name"] for column in sa.inspect(connection).get_columns("job")}
+    table = db.metadata.tables["job"]
+    if "attempts" not in columns:
+        column_type = table.c.attempts.type.compile(dialect=connection.dialect)
+        connection.execute(
+            sa.text(
+                f"ALTER TABLE job ADD COLUMN attempts {column_type} NOT NULL DEFAULT 0"
+            )
+        )
+    if "lease_expires_at" not in columns:
+        column_type = table.c.lease_expires_at.type.compile(dialect=connection.dialect)
+        connection.execute(
+            sa.text(f"ALTER TABLE job ADD COLUMN lease_expires_at {column_type}")
+        )
+
+
+def add_cache_version(connection):
+    """
+    Создает таблицу cache_version (версии данных для кэша страниц).
+    """
+    db.metadata.tables["cache_version"].create(connection, checkfirst=True)
+
+
+def post_stat_posted_at_utc(connection):
+    """
+    Переводит post_stat.posted_at из локального времени сервера в UTC.
+
+    Раньше дата поста сохранялась в локальном времени, а аналитика считает
+    ее UTC. Миграцию нужно применять на сервере с тем же часовым поясом,
+    на котором синхронизировалась статистика; на сервере в UTC она ничего
+    не меняет.
+    """
+    _local_to_utc(connection, "post_stat", ["posted_at"])
+
+
+def add_scheduled_post_claim(connection):
+    """
+    Добавляет в scheduled_post колонку claimed_at (когда планировщик забрал
+    пост) и переводит время публикации из локального времени сервера в UTC
+    (см. post_stat_posted_at_utc).
+    """
+    columns = {
+        column["name"]
+        for column in sa.inspect(connection).get_columns("scheduled_post")
+    }
+    if "claimed_at" not in columns:
+        column_type = db.metadata.tables["scheduled_post"].c.claimed_at.type.compile(
+            dialect=connection.dialect
+        )
+        connection.execute(
+            sa.text(f"ALTER TABLE scheduled_post ADD COLUMN claimed_at {column_type}")
+        )
+    _local_to_utc(connection, "scheduled_post", ["publish_at", "next_attempt_at"])
+
+
+def _local_to_utc(connection, table_name, column_names):
+    """
+    Переводит колонки DateTime таблицы из локального времени процесса в UTC.
+    """
+    table = db.metadata.tables[table_name]
+    columns = [table.c[name] for name in column_names]
+    rows = connection.execute(sa.select(table.c.id, *columns)).all()
+    updates = []
+    for row_id, *values in rows:
+        utc = [
+            datetime.datetime.fromtimestamp(
+                value.timestamp(), tz=datetime.timezone.utc
+            ).replace(tzinfo=None)
+            for value in values
+        ]
+        if utc != values:
+            updates.append({"row_id": row_id, **dict(zip(column_names, utc))})
+    if updates:
+        connection.execute(
+            table.update()
+            .where(table.c.id == sa.bindparam("row_id"))
+            .values({name: sa.bindparam(name) for name in column_names}),
+            updates,
+        )
+
+
+MIGRATIONS = [
+    (1, "Initial schema", create_missing_tables),
+    (2, "Indexes for jobs, batches, schedule and post stats", add_indexes),
+    (3, "Multiple images for scheduled posts", add_scheduled_post_images),
+    (4, "Telegram publishing settings", add_user_telegram),
+    (5, "Job leases for requeueing interrupted jobs", add_job_lease),
+    (6, "Page cache versions shared between processes", add_cache_version),
+    (7, "Post dates in UTC", post_stat_posted_at_utc),
+    (8, "Scheduled post claims and UTC publish times", add_scheduled_post_claim),
+]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    """
+    :return: Номер последней примененной миграции или None, если таблицы нет
+    """
+    if not sa.inspect(connection).has_table("schema_version"):
+        return None
+    return connection.execute(sa.select(sa.func.max(schema_version.c.version))).scalar()
+
+
+def upgrade(engine, target=None):
+    """
+    Применяет недостающие миграции.
+
+    Каждая миграция выполняется в своей транзакции вместе с записью
+    в schema_version. Если миграцию одновременно применил другой процесс
+    (например, воркер, запущенный вместе с веб-сервером), она пропускается.
+
+    :param engine: Движок SQLAlchemy
+    :param target: Версия, до которой обновить базу (по умолчанию последняя)
+    :return: Список примененных версий
+    """
+    target = target or latest_version()
+    with engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+        version = current_version(connection) or 0
+        tables = set(sa.inspect(connection).get_table_names()) - {"schema_version"}
+        if version == 0 and not tables and target == latest_version():
+            db.metadata.create_all(connection)
+            _stamp(connection, MIGRATIONS)
+            return [number for number, _, _ in MIGRATIONS]
+
+    applied = []
+    for migration in MIGRATIONS:
+        number, _, apply = migration
+        if number <= version or number > target:
+            continue
+        try:
+            with engine.begin() as connection:
+                apply(connection)
+                _stamp(connection, [migration])
+        except sa.exc.SQLAlchemyError:
+            with engine.connect() as connection:
+                if (current_version(connection) or 0) < number:
+                    raise
+            continue
+        applied.append(number)
+    return applied
+
+
+def _stamp(connection, migrations):
+    now = datetime.datetime.utcnow()
+    connection.execute(
+        schema_version.insert(),
+        [
+            {"version": number, "description": description, "applied_at": now}
+            for number, description, _ in migrations
+        ],
+    )
+
+
+db_cli = AppGroup("db", help="Database schema migrations.")
+
+
+@db_cli.command("upgrade")
+@click.option("--to", "target", type=int, default=None, help="Target version.")
+def upgrade_command(target):
+    """Apply pending migrations."""
+    applied = upgrade(db.engine, target)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        click.echo("Database is up to date.")
+
+
+@db_cli.command("version")
+def version_command():
+    """Show the current schema version."""
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    click.echo(f"Current version: {version}, latest: {latest_version()}")
+
+
+@db_cli.command("history")
+def history_command():
+    """List migrations and whether they are applied."""
+    with db.engine.connect() as connection:
+        version = current_version(connection) or 0
+    for number, description, _ in MIGRATIONS:
+        mark = "x" if number <= version else " "
+        click.echo(f"[{mark}] {number:>3}  {description}")
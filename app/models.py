@@ -1,11 +1,253 @@
+import datetime
+
 from app import db
 
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(80), nullable=False)
     vk_api_id = db.Column(db.String(250), nullable=True)
     vk_group_id = db.Column(db.String(20), nullable=True)
+    telegram_bot_token = db.Column(db.String(250), nullable=True)
+    telegram_chat_id = db.Column(db.String(64), nullable=True)
+
+    def stats_groups(self):
+        """
+        Список групп пользователя для статистики: name, group_id, vk_api_key.
+
+        Если группы не добавлены, используется группа из настроек пользователя.
+        """
+        groups = [
+            {
+                "name": group.name,
+                "group_id": group.group_id,
+                "vk_api_key": group.vk_api_key or self.vk_api_id,
+            }
+            for group in VKGroup.query.filter_by(user_id=self.id).order_by(VKGroup.name)
+        ]
+        if not groups and self.vk_group_id:
+            groups.append(
+                {
+                    "name": self.vk_group_id,
+                    "group_id": self.vk_group_id,
+                    "vk_api_key": self.vk_api_id,
+                }
+            )
+        return groups
 
     def __repr__(self):
         return f"User('{self.username}')"
+
+
+class Job(db.Model):
+    """
+    Фоновая задача (например, генерация и публикация поста).
+
+    Состояние хранится в базе данных, поэтому задачу может забрать
+    любой процесс-воркер, подключенный к той же базе.
+    """
+
+    # claim_job() ищет самую старую задачу в статусе queued.
+    __table_args__ = (db.Index("ix_job_status_id", "status", "id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
+    kind = db.Column(db.String(50), nullable=False, default="post")
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    progress = db.Column(db.String(250), nullable=True)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    # Сколько раз задачу забирали воркеры и до какого времени ее держит
+    # текущий: задача процесса, который упал, возвращается в очередь
+    # после истечения аренды (см. app.jobs.requeue_expired_jobs).
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    def __repr__(self):
+        return f"Job('{self.id}', '{self.kind}', '{self.status}')"
+
+
+class Batch(db.Model):
+    """
+    Пакет постов, сгенерированных из контент-плана (bulk-режим).
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    items = db.relationship(
+        "BatchItem", backref="batch", order_by="BatchItem.position", lazy=True
+    )
+
+    def __repr__(self):
+        return f"Batch('{self.id}', '{self.status}')"
+
+
+class BatchItem(db.Model):
+    """
+    Одна строка контент-плана и результат её генерации.
+    """
+
+    __table_args__ = (db.Index("ix_batch_item_position", "batch_id", "position"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey("batch.id"), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    topic = db.Column(db.String(500), nullable=False)
+    tone = db.Column(db.String(250), nullable=False)
+    generate_image = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    post_content = db.Column(db.Text, nullable=True)
+    image_url = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f"BatchItem('{self.batch_id}', '{self.position}')"
+
+
+class ScheduledPost(db.Model):
+    """
+    Пост, запланированный к публикации в группе VK.
+
+    idempotency_key передается в VK как guid записи, поэтому повторная
+    попытка после сбоя или перезапуска не создает дубликат поста.
+    Все даты хранятся в UTC.
+    """
+
+    # Планировщик выбирает pending-посты, время попытки которых наступило.
+    __table_args__ = (db.Index("ix_scheduled_post_due", "status", "next_attempt_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
+    group_id = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    image_url = db.Column(db.Text, nullable=True)
+    # Все изображения поста-карусели (image_url — первое из них).
+    image_urls = db.Column(db.JSON, nullable=True)
+    publish_at = db.Column(db.DateTime, nullable=False, index=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default="pending", index=True)
+    # Когда планировщик перевел пост в publishing (см. recover_interrupted).
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=False)
+    vk_post_id = db.Column(db.Integer, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    @property
+    def images(self):
+        """
+        :return: Список изображений поста (пустой, если их нет)
+        """
+        if self.image_urls:
+            return list(self.image_urls)
+        return [self.image_url] if self.image_url else []
+
+    def __repr__(self):
+        return f"ScheduledPost('{self.id}', '{self.status}', '{self.publish_at}')"
+
+
+class PostStat(db.Model):
+    """
+    Последние известные лайки и просмотры поста группы VK (локальная копия).
+    """
+
+    # Страница статистики выбирает посты группы, новые сначала.
+    __table_args__ = (
+        db.UniqueConstraint("group_id", "post_id"),
+        db.Index("ix_post_stat_group_posted", "group_id", "posted_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.String(20), nullable=False)
+    post_id = db.Column(db.Integer, nullable=False)
+    posted_at = db.Column(db.DateTime, nullable=False, index=True)  # UTC
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"PostStat('{self.group_id}', '{self.post_id}')"
+
+
+class PostStatSnapshot(db.Model):
+    """
+    Снимок лайков и просмотров поста на момент синхронизации (временной ряд).
+    """
+
+    __table_args__ = (db.Index("ix_snapshot_post", "group_id", "post_id", "taken_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.String(20), nullable=False)
+    post_id = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    likes = db.Column(db.Integer, nullable=False)
+    views = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"PostStatSnapshot('{self.group_id}', '{self.post_id}', '{self.taken_at}')"
+        )
+
+
+class CacheVersion(db.Model):
+    """
+    Версия данных пользователя или группы для кэша страниц.
+
+    scope — "user:<id>" или "group:<group_id>". Версия увеличивается, когда
+    настройки пользователя или статистика группы меняются в любом процессе
+    (см. app.response_cache.invalidate_responses).
+    """
+
+    scope = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"CacheVersion('{self.scope}', '{self.version}')"
+
+
+class VKGroup(db.Model):
+    """
+    Сообщество VK, которым управляет пользователь (для агентств — много групп).
+
+    Если vk_api_key не указан, используется ключ из настроек пользователя.
+    """
+
+    __table_args__ = (db.UniqueConstraint("user_id", "group_id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
+    name = db.Column(db.String(100), nullable=False)
+    group_id = db.Column(db.String(20), nullable=False)
+    vk_api_key = db.Column(db.String(250), nullable=True)
+
+    def __repr__(self):
+        return f"VKGroup('{self.name}', '{self.group_id}')"
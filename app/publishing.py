@@ -0,0 +1,108 @@
+from social_publishers.base import create_publisher
+from social_publishers.dispatcher import FanOutDispatcher
+
+# Площадки, на которые можно опубликовать пост (ключи social_publishers.base.PUBLISHERS).
+PUBLISH_TARGETS = ("vk", "telegram")
+DEFAULT_TARGETS = ("vk",)
+
+
+def parse_targets(values):
+    """
+    :param values: Значения параметра targets из формы или запроса
+    :return: Список площадок в порядке PUBLISH_TARGETS; по умолчанию только VK
+    """
+    targets = [target for target in PUBLISH_TARGETS if target in values]
+    return targets or list(DEFAULT_TARGETS)
+
+
+def prompt_platform(targets):
+    """
+    :param targets: Список площадок
+    :return: Платформа для выбора шаблонов промтов (generators.prompts):
+        единственная площадка или None, если пост публикуется на нескольких
+    """
+    return targets[0] if len(targets) == 1 else None
+
+
+def create_user_publishers(user, targets, config):
+    """
+    Создает публикаторы площадок с учетными данными из настроек пользователя.
+
+    :param user: Пользователь (User или CurrentUser)
+    :param targets: Список площадок
+    :param config: Конфигурация приложения (адреса API)
+    :return: Словарь площадка -> Publisher
+    :raises ValueError: Если площадка не настроена в профиле пользователя
+    """
+    publishers = {}
+    for target in targets:
+        if target == "vk":
+            if not (user.vk_api_id and user.vk_group_id):
+                raise ValueError("VK is not configured: set API key and group ID")
+            publishers[target] = create_publisher(
+                "vk",
+                user.vk_api_id,
+                user.vk_group_id,
+                api_url=config.get("VK_API_URL"),
+            )
+        elif target == "telegram":
+            if not (user.telegram_bot_token and user.telegram_chat_id):
+                raise ValueError(
+                    "Telegram is not configured: set bot token and chat ID"
+                )
+            publishers[target] = create_publisher(
+                "telegram",
+                user.telegram_bot_token,
+                user.telegram_chat_id,
+                api_url=config.get("TELEGRAM_API_URL"),
+            )
+        else:
+            raise ValueError(f"Unknown publishing target: {target}")
+    return publishers
+
+
+def get_dispatcher(config):
+    """
+    :param config: Конфигурация приложения
+    :return: FanOutDispatcher с таймаутом и повторами из конфигурации
+    """
+    return FanOutDispatcher(
+        timeout=config.get("PUBLISH_TIMEOUT", 60),
+        max_attempts=config.get("PUBLISH_MAX_ATTEMPTS", 3),
+        backoff=config.get("PUBLISH_RETRY_BACKOFF", 2.0),
+    )
+
+
+async def apublish_carousel(
+    dispatcher,
+    publishers,
+    content,
+    image_generator,
+    image_prompt,
+    image_count,
+    force=False,
+    guid=None,
+):
+    """
+    Генерирует изображения поста-карусели и публикует пост конвейером:
+    цепочка загрузки каждого изображения в VK стартует, как только оно
+    сохранено, а не после генерации всех изображений.
+
+    :param dispatcher: FanOutDispatcher
+    :param publishers: Словарь площадка -> Publisher
+    :param content: Текст поста
+    :param image_generator: ImageGenerator
+    :param image_prompt: Описание изображений
+    :param image_count: Количество изображений
+    :param force: Сгенерировать изображения заново, даже если они есть в хранилище
+    :param guid: Уникальный идентификатор записи (см. VKPublisher.publish_post)
+    :return: Пара (результаты площадок, список URL изображений)
+    """
+    images = image_generator.aimages(image_prompt, image_count, force=force)
+    results = await dispatcher.apublish(publishers, content, images, guid)
+    urls = [
+        image.result()
+        for image in images
+        if image.done() and not image.cancelled() and image.exception() is None
+    ]
+    return results, [url for url in urls if url]
@@ -0,0 +1,443 @@
+import datetime
+import hashlib
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from flask import Response, current_app, g, request, session
+
+from app import db
+from app.database import UPSERT_DIALECTS
+from app.models import CacheVersion
+from core import metrics
+
+# Ключ окружения WSGI, которым помечается фоновое обновление записи кэша:
+# такой запрос выполняет маршрут заново, не читая кэш.
+REFRESH_ENVIRON_KEY = "smm.response_cache.refresh"
+
+
+class CachedPage:
+    """
+    Сохраненный ответ маршрута: тело, тип, ETag и время изменения.
+    """
+
+    __slots__ = (
+        "body",
+        "mimetype",
+        "etag",
+        "last_modified",
+        "groups",
+        "fresh_until",
+        "stale_until",
+    )
+
+    def __init__(self, body, mimetype, etag, last_modified, groups):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.last_modified = last_modified
+        self.groups = groups
+        self.fresh_until = 0.0
+        self.stale_until = 0.0
+
+
+class ResponseCache:
+    """
+    Кэш готовых ответов страниц только для чтения (статистика, дэшборд).
+
+    Запись свежая ttl секунд; еще stale_ttl секунд после этого она
+    отдается сразу, а маршрут выполняется заново в фоновом потоке
+    (stale-while-revalidate), поэтому пользователь не ждет VK API.
+
+    Кэш хранится в памяти процесса, а в ключ записи входят версии данных
+    пользователя и его групп из таблицы cache_version. Поэтому изменение
+    настроек или синхронизация статистики в другом процессе (воркер,
+    соседний процесс gunicorn) делает записи недоступными не позже чем
+    через version_ttl секунд: прочитанные версии запоминаются в процессе,
+    чтобы попадание в кэш не стоило запроса к базе. invalidate() сбрасывает
+    версии и записи текущего процесса сразу.
+    """
+
+    def __init__(
+        self, ttl=60, stale_ttl=600, max_entries=2000, refresh_workers=2, version_ttl=2
+    ):
+        """
+        :param ttl: Сколько секунд запись считается свежей
+        :param stale_ttl: Сколько секунд после ttl отдавать запись, обновляя ее в фоне
+        :param max_entries: Максимум записей в кэше (LRU-вытеснение)
+        :param refresh_workers: Потоков для фонового обновления
+        :param version_ttl: Сколько секунд доверять прочитанной версии данных
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.refresh_workers = refresh_workers
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()
+        # Версии данных из cache_version: scope -> (срок действия, версия).
+        self._versions = {}
+        self._refreshing = set()
+        self._executor = None
+        # Счетчик сбросов: ответ, собранный до invalidate(), не должен
+        # попасть в кэш после него.
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        """
+        :return: Пара (CachedPage или None, свежая ли запись)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry.stale_until:
+                self._counters["misses"] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            fresh = now < entry.fresh_until
+            self._counters["hits" if fresh else "stale_hits"] += 1
+            return entry, fresh
+
+    def peek(self, key):
+        """
+        :return: Запись (даже устаревшую) без учета в счетчиках или None
+        """
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, entry, generation):
+        """
+        Сохраняет запись, если с момента generation не было invalidate().
+        """
+        now = time.monotonic()
+        entry.fresh_until = now + self.ttl
+        entry.stale_until = entry.fresh_until + self.stale_ttl
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, key, func):
+        """
+        Запускает func() в фоновом потоке, если запись key еще не обновляется.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._counters["refreshes"] += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.refresh_workers,
+                    thread_name_prefix="response-cache",
+                )
+            executor = self._executor
+
+        def run():
+            try:
+                func()
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        executor.submit(run)
+
+    def versions(self, scopes):
+        """
+        :return: Словарь scope -> версия для еще действующих прочитанных версий
+        """
+        now = time.monotonic()
+        with self._lock:
+            known = {scope: self._versions.get(scope) for scope in scopes}
+        return {
+            scope: item[1]
+            for scope, item in known.items()
+            if item is not None and now < item[0]
+        }
+
+    def remember_versions(self, versions, generation):
+        """
+        Запоминает версии, прочитанные из cache_version, на version_ttl
+        секунд, если с момента generation не было invalidate(): версия,
+        прочитанная до сброса, могла устареть.
+        """
+        expires = time.monotonic() + self.version_ttl
+        with self._lock:
+            if generation != self._generation:
+                return
+            if len(self._versions) + len(versions) > self.max_entries:
+                now = time.monotonic()
+                self._versions = {
+                    scope: item
+                    for scope, item in self._versions.items()
+                    if now < item[0]
+                }
+            self._versions.update(
+                (scope, (expires, version)) for scope, version in versions.items()
+            )
+
+    def invalidate(self, user_id=None, group_id=None):
+        """
+        Удаляет записи пользователя и/или записи, построенные по данным группы.
+        Без аргументов очищает весь кэш.
+        """
+        group_id = str(group_id) if group_id is not None else None
+        with self._lock:
+            self._generation += 1
+            if user_id is None and group_id is None:
+                self._versions.clear()
+            if user_id is not None:
+                self._versions.pop(f"user:{user_id}", None)
+            if group_id is not None:
+                self._versions.pop(f"group:{group_id}", None)
+            for key in list(self._entries):
+                if user_id is not None and key[1] != user_id:
+                    continue
+                if group_id is not None and group_id not in self._entries[key].groups:
+                    continue
+                del self._entries[key]
+
+    def stats(self):
+        """
+        :return: Счетчики попаданий, промахов и фоновых обновлений, размер кэша
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def clear(self):
+        self.invalidate()
+
+
+def init_response_cache(app):
+    """
+    Подключает кэш ответов (RESPONSE_CACHE_TTL = 0 отключает его).
+
+    :param app: Flask-приложение
+    """
+    if not app.config["RESPONSE_CACHE_TTL"]:
+        return
+    app.extensions["response_cache"] = ResponseCache(
+        ttl=app.config["RESPONSE_CACHE_TTL"],
+        stale_ttl=app.config["RESPONSE_CACHE_STALE_TTL"],
+        max_entries=app.config["RESPONSE_CACHE_SIZE"],
+        refresh_workers=app.config["RESPONSE_CACHE_WORKERS"],
+        version_ttl=app.config["RESPONSE_CACHE_VERSION_TTL"],
+    )
+
+
+def get_response_cache():
+    """
+    :return: Кэш ответов текущего приложения или None, если он отключен
+    """
+    return current_app.extensions.get("response_cache")
+
+
+def invalidate_responses(user_id=None, group_id=None):
+    """
+    Сбрасывает сохраненные страницы пользователя и/или группы во всех
+    процессах: увеличивает их версии в cache_version (с коммитом) и удаляет
+    записи из кэша текущего процесса (см. ResponseCache.invalidate).
+    """
+    scopes = []
+    if user_id is not None:
+        scopes.append(f"user:{user_id}")
+    if group_id is not None:
+        scopes.append(f"group:{group_id}")
+    _bump_versions(scopes)
+    cache = get_response_cache()
+    if cache is not None:
+        cache.invalidate(user_id=user_id, group_id=group_id)
+
+
+def cached_response(view):
+    """
+    Декоратор GET-маршрута только для чтения: кэширует ответ по маршруту,
+    пользователю, его группе VK, параметрам запроса и формату (HTML/JSON).
+
+    Ответы получают ETag и Last-Modified, и повторный запрос с
+    If-None-Match/If-Modified-Since для неизменной страницы получает 304.
+    Параметр refresh в запросе выполняет маршрут заново. Ответы, которые
+    показывают или добавляют flash-сообщения, не кэшируются.
+
+    Применяется после login_required (нужен g.user).
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = get_response_cache()
+        if cache is None or request.method != "GET" or "_flashes" in session:
+            return view(*args, **kwargs)
+
+        groups = _user_groups()
+        refresh = request.environ.get(REFRESH_ENVIRON_KEY) or "refresh" in request.args
+        key = _cache_key(_data_version(cache, groups, force=refresh))
+        if not refresh:
+            entry, fresh = cache.get(key)
+            if entry is not None:
+                if not fresh:
+                    cache.refresh(key, _refresh_function())
+                return _conditional(entry, "hit" if fresh else "stale")
+
+        generation = cache.generation
+        with metrics.span("response_cache.render", endpoint=request.endpoint):
+            response = current_app.make_response(view(*args, **kwargs))
+        if (
+            response.status_code != 200
+            or response.is_streamed
+            or response.direct_passthrough
+            or session.modified
+        ):
+            return response
+
+        body = response.get_data()
+        etag = hashlib.sha1(body).hexdigest()
+        previous = cache.peek(key)
+        if previous is not None and previous.etag == etag:
+            # Данные не изменились: время изменения страницы остается прежним.
+            last_modified = previous.last_modified
+        else:
+            last_modified = datetime.datetime.now(datetime.timezone.utc).replace(
+                microsecond=0
+            )
+        entry = CachedPage(body, response.mimetype, etag, last_modified, groups)
+        cache.put(key, entry, generation)
+        if request.environ.get(REFRESH_ENVIRON_KEY):
+            return response
+        return _conditional(entry, "miss")
+
+    return wrapper
+
+
+def _cache_key(version):
+    args = tuple(
+        sorted(
+            (name, value)
+            for name, value in request.args.items(multi=True)
+            if name != "refresh"
+        )
+    )
+    return (
+        request.endpoint,
+        g.user.id,
+        str(g.user.vk_group_id),
+        tuple(sorted(request.view_args.items())) if request.view_args else (),
+        args,
+        request.accept_mimetypes.best,
+        version,
+    )
+
+
+def _user_groups():
+    groups = {str(group["group_id"]) for group in g.user.stats_groups()}
+    groups.add(str(g.user.vk_group_id))
+    return frozenset(groups)
+
+
+def _version_scopes(groups):
+    return [f"user:{g.user.id}"] + [f"group:{group}" for group in sorted(groups)]
+
+
+def _data_version(cache, groups, force=False):
+    """
+    :param force: Прочитать версии из базы, даже если они запомнены
+    :return: Версии данных пользователя и его групп из cache_version
+    """
+    scopes = _version_scopes(groups)
+    versions = {} if force else cache.versions(scopes)
+    missing = [scope for scope in scopes if scope not in versions]
+    if missing:
+        generation = cache.generation
+        loaded = dict.fromkeys(missing, 0)
+        loaded.update(
+            db.session.execute(
+                db.select(CacheVersion.scope, CacheVersion.version).where(
+                    CacheVersion.scope.in_(missing)
+                )
+            ).all()
+        )
+        cache.remember_versions(loaded, generation)
+        versions.update(loaded)
+    return tuple(versions[scope] for scope in scopes)
+
+
+def _bump_versions(scopes):
+    if not scopes:
+        return
+    insert = UPSERT_DIALECTS.get(db.engine.dialect.name)
+    for scope in scopes:
+        if insert is not None:
+            statement = insert(CacheVersion).values(scope=scope, version=1)
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["scope"],
+                    set_={"version": CacheVersion.version + 1},
+                )
+            )
+            continue
+        row = db.session.get(CacheVersion, scope)
+        if row is None:
+            db.session.add(CacheVersion(scope=scope, version=1))
+        else:
+            row.version = CacheVersion.version + 1
+    db.session.commit()
+
+
+def _conditional(entry, state):
+    response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    # Браузер хранит страницу, но перед показом проверяет ее (304, если
+    # не изменилась); общие прокси ее не кэшируют.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.headers["X-Cache"] = state
+    return response.make_conditional(request)
+
+
+def _refresh_function():
+    """
+    :return: Функция, которая выполняет маршрут текущего запроса в фоновом
+        потоке от имени того же пользователя и сохраняет новый ответ в кэш
+
+    Cookie сессии не передается: маршрут выполняется с сохраненным
+    снимком пользователя (g.user), поэтому истекшая или смененная сессия
+    не может подменить запись кэша страницей входа или чужими данными.
+    """
+    app = current_app._get_current_object()
+    user = g.user
+    path = request.full_path
+    base_url = request.root_url
+    headers = {
+        name: request.headers[name]
+        for name in ("Accept", "Accept-Language")
+        if name in request.headers
+    }
+
+    def refresh():
+        with app.test_request_context(
+            path,
+            base_url=base_url,
+            headers=headers,
+            environ_overrides={REFRESH_ENVIRON_KEY: True},
+        ):
+            g.user = user
+            try:
+                view = app.view_functions[request.endpoint]
+                app.ensure_sync(view)(**request.view_args)
+            except Exception:
+                app.logger.error(traceback.format_exc())
+
+    return refresh
@@ -0,0 +1,275 @@
+import datetime
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app import db
+from app.models import ScheduledPost, User
+
+STATUS_PENDING = "pending"
+STATUS_PUBLISHING = "publishing"
+STATUS_PUBLISHED = "published"
+STATUS_FAILED = "failed"
+# Через сколько секунд пост в статусе publishing считается брошенным
+# процессом, который его забрал (см. recover_interrupted).
+DEFAULT_CLAIM_TIMEOUT = 900
+
+
+def schedule_post(
+    user, content, publish_at, image_url=None, idempotency_key=None, image_urls=None
+):
+    """
+    Добавляет пост в расписание публикаций.
+
+    :param user: Пользователь User с настроенными VK API ID и Group ID
+    :param content: Текст поста
+    :param publish_at: Время публикации (datetime в UTC или с часовым поясом)
+    :param image_url: URL изображения или None
+    :param idempotency_key: Ключ идемпотентности; по умолчанию генерируется
+    :param image_urls: URL изображений поста-карусели вместо image_url
+    :return: Созданный ScheduledPost
+    """
+    if publish_at.tzinfo is not None:
+        publish_at = publish_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if image_urls and len(image_urls) > 1:
+        image_url = image_urls[0]
+    else:
+        image_urls = None
+    post = ScheduledPost(
+        user_id=user.id,
+        group_id=user.vk_group_id,
+        content=content,
+        image_url=image_url,
+        image_urls=image_urls,
+        publish_at=publish_at,
+        next_attempt_at=publish_at,
+        status=STATUS_PENDING,
+        idempotency_key=idempotency_key or uuid.uuid4().hex,
+    )
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def recover_interrupted(timeout=DEFAULT_CLAIM_TIMEOUT, now=None):
+    """
+    Возвращает в очередь посты, публикация которых прервалась: процесс,
+    забравший пост, не сохранил результат за timeout секунд (например,
+    упал или был перезапущен). Посты, которые публикует сейчас другой
+    процесс, не трогаются. Повторная отправка безопасна благодаря guid.
+
+    :param timeout: Сколько секунд пост может оставаться в статусе publishing
+    :param now: Текущее время (UTC)
+    :return: Количество возвращенных постов
+    """
+    now = now or datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(seconds=timeout)
+    count = ScheduledPost.query.filter(
+        ScheduledPost.status == STATUS_PUBLISHING,
+        db.or_(ScheduledPost.claimed_at.is_(None), ScheduledPost.claimed_at < cutoff),
+    ).update({"status": STATUS_PENDING, "claimed_at": None}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+class PublishScheduler:
+    """
+    Цикл публикации запланированных постов.
+
+    За один проход (run_once) из базы выбирается до batch_size постов,
+    время которых наступило. Посты разных групп публикуются параллельно,
+    посты одной группы — последовательно; частоту запросов к VK API
+    ограничивает общий лимит токена (core.ratelimit). При ошибке VK попытка
+    повторяется с экспоненциальной задержкой backoff_base * 2 ** (attempts - 1),
+    после max_attempts попыток пост помечается как failed. Все времена — UTC.
+    """
+
+    def __init__(
+        self,
+        app,
+        batch_size=50,
+        max_attempts=5,
+        backoff_base=30,
+        poll_interval=10.0,
+        api_url=None,
+        claim_timeout=DEFAULT_CLAIM_TIMEOUT,
+    ):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.poll_interval = poll_interval
+        self.api_url = api_url
+        self.claim_timeout = claim_timeout
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def claim_due(self, now=None):
+        """
+        Атомарно забирает посты, время публикации которых наступило.
+
+        :param now: Текущее время (UTC)
+        :return: Список ScheduledPost в статусе publishing
+        """
+        now = now or datetime.datetime.utcnow()
+        ids = [
+            post_id
+            for (post_id,) in db.session.query(ScheduledPost.id)
+            .filter(
+                ScheduledPost.status == STATUS_PENDING,
+                ScheduledPost.next_attempt_at <= now,
+            )
+            .order_by(ScheduledPost.next_attempt_at)
+            .limit(self.batch_size)
+        ]
+        claimed = []
+        for post_id in ids:
+            updated = ScheduledPost.query.filter_by(
+                id=post_id, status=STATUS_PENDING
+            ).update(
+                {"status": STATUS_PUBLISHING, "claimed_at": now},
+                synchronize_session=False,
+            )
+            if updated:
+                claimed.append(post_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return ScheduledPost.query.filter(ScheduledPost.id.in_(claimed)).all()
+
+    def run_once(self, now=None):
+        """
+        Публикует одну пачку наступивших постов.
+
+        :param now: Текущее время (UTC)
+        :return: Количество обработанных постов
+        """
+        now = now or datetime.datetime.utcnow()
+        posts = self.claim_due(now)
+        if not posts:
+            return 0
+
+        users = {
+            user.id: user
+            for user in User.query.filter(User.id.in_({post.user_id for post in posts}))
+        }
+        by_group = {}
+        orphaned = 0
+        for post in posts:
+            user = users.get(post.user_id)
+            if user is None:
+                # Пользователь удален: повторная попытка тоже не удастся.
+                post.status = STATUS_FAILED
+                post.claimed_at = None
+                post.last_error = "User not found"
+                orphaned += 1
+                continue
+            by_group.setdefault(post.group_id, []).append(
+                (
+                    post.id,
+                    user.vk_api_id,
+                    post.content,
+                    post.images,
+                    post.idempotency_key,
+                )
+            )
+
+        results = []
+        if by_group:
+            with ThreadPoolExecutor(max_workers=min(len(by_group), 8)) as executor:
+                outcomes = executor.map(self._publish_group, by_group.items())
+                results = [outcome for group in outcomes for outcome in group]
+
+        posts_by_id = {post.id: post for post in posts}
+        for post_id, vk_post_id, error in results:
+            post = posts_by_id[post_id]
+            post.attempts += 1
+            post.claimed_at = None
+            if error is None:
+                post.status = STATUS_PUBLISHED
+                post.vk_post_id = vk_post_id
+                post.last_error = None
+            elif post.attempts >= self.max_attempts:
+                post.status = STATUS_FAILED
+                post.last_error = error
+            else:
+                post.status = STATUS_PENDING
+                post.last_error = error
+                delay = self.backoff_base * 2 ** (post.attempts - 1)
+                post.next_attempt_at = now + datetime.timedelta(seconds=delay)
+        db.session.commit()
+        return len(results) + orphaned
+
+    def _publish_group(self, item):
+        from social_publishers.vk_publisher import VKPublisher
+
+        group_id, posts = item
+        results = []
+        for post_id, vk_api_key, content, images, guid in posts:
+            try:
+                publisher = VKPublisher(vk_api_key, group_id, api_url=self.api_url)
+                response = publisher.publish_post(content, guid=guid, images=images)
+                if "error" in response:
+                    raise Exception(response["error"]["error_msg"])
+                results.append((post_id, response["response"]["post_id"], None))
+            except Exception as e:
+                results.append((post_id, None, str(e)))
+        return results
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._loop, name="publish-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            with self.app.app_context():
+                try:
+                    # Посты, брошенные этим или другим процессом (воркером,
+                    # процессом gunicorn), возвращаются в очередь по истечении
+                    # claim_timeout, а не при каждом запуске планировщика.
+                    recover_interrupted(self.claim_timeout)
+                    processed = self.run_once()
+                except Exception:
+                    current_app.logger.error(traceback.format_exc())
+                    processed = 0
+                db.session.remove()
+            if processed < self.batch_size:
+                self._stopped.wait(self.poll_interval)
+
+
+def init_scheduler(app):
+    """
+    Создает планировщик публикаций с параметрами из конфигурации приложения.
+    """
+    scheduler = PublishScheduler(
+        app,
+        batch_size=app.config.get("SCHEDULER_BATCH_SIZE", 50),
+        max_attempts=app.config.get("SCHEDULER_MAX_ATTEMPTS", 5),
+        backoff_base=app.config.get("SCHEDULER_BACKOFF_BASE", 30),
+        poll_interval=app.config.get("SCHEDULER_POLL_INTERVAL", 10.0),
+        api_url=app.config.get("VK_API_URL"),
+        claim_timeout=app.config.get("SCHEDULER_CLAIM_TIMEOUT", DEFAULT_CLAIM_TIMEOUT),
+    )
+    app.extensions["publish_scheduler"] = scheduler
+    if app.config.get("SCHEDULER_ENABLED"):
+        # Поток стартует с первым запросом, как и пул очереди задач: запуск
+        # процесса и команды flask (например, db upgrade) его не создают.
+        app.before_request(scheduler.start)
+    return scheduler
@@ -1,126 +1,638 @@
-from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+import json
+import os
+
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    flash,
+    g,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    stream_with_context,
+    url_for,
+)
 
 from app import db
-from app.models import User
-from config import openai_key
-from generators.image_gen import ImageGenerator
-from generators.text_gen import PostGenerator
-from social_publishers.vk_publisher import VKPublisher
-from social_stats.vk_stats import VKStats
+from app.database import bulk_insert
+from app.jobs import enqueue_job, parse_image_count
+from app.publishing import parse_targets, prompt_platform
+from app.models import (
+    Batch,
+    BatchItem,
+    Job,
+    PostStat,
+    PostStatSnapshot,
+    ScheduledPost,
+    User,
+    VKGroup,
+)
+from app.response_cache import (
+    cached_response,
+    get_response_cache,
+    invalidate_responses,
+)
+from app.users import api_login_required, get_user_cache, login_required
+from generators.cache import get_cache
+from generators.image_store import get_image_store
+
+# Генераторы, публикатор и статистика VK (и SDK OpenAI за ними) импортируются
+# внутри маршрутов и задач при первом использовании, чтобы регистрация
+# блюпринта не замедляла запуск процесса.
 
 smm_bp = Blueprint("smm", __name__)
 
 
+def get_stats_aggregator():
+    """
+    Возвращает общий для процесса агрегатор статистики (с кэшем по группам).
+    """
+    aggregator = current_app.extensions.get("stats_aggregator")
+    if aggregator is None:
+        from social_stats.aggregator import StatsAggregator
+
+        aggregator = StatsAggregator(
+            max_workers=current_app.config["STATS_AGGREGATOR_WORKERS"],
+            cache_ttl=current_app.config["STATS_AGGREGATOR_CACHE_TTL"],
+            api_url=current_app.config.get("VK_API_URL"),
+        )
+        current_app.extensions["stats_aggregator"] = aggregator
+    return aggregator
+
+
 @smm_bp.route("/dashboard")
+@login_required
+@cached_response
 def dashboard():
     """
     Отображает главную страницу приложения (дэшборд).
 
-    Если пользователь не авторизован, перенаправляет на страницу входа.
+    Показывает сводную статистику по всем группам пользователя; группы
+    опрашиваются параллельно, результаты кэшируются по группам.
 
     Возвращает:
         render_template: Дэшборд HTML-страница.
     """
-    if "user_id" not in session:
-        return redirect(url_for("auth.login"))
-    return render_template("dashboard.html")
+    user = g.user
+    overview = get_stats_aggregator().aggregate(
+        user.stats_groups(), force="refresh" in request.args
+    )
+    return render_template("dashboard.html", overview=overview)
+
+
+@smm_bp.route("/groups", methods=["GET", "POST"])
+@login_required
+def groups():
+    """
+    Управление списком групп VK пользователя.
+
+    - GET: Отображает список групп и форму добавления.
+    - POST: Добавляет группу.
+
+    Возвращает:
+        render_template: Страница со списком групп.
+    """
+    if request.method == "POST":
+        group_id = request.form["group_id"].strip()
+        exists = VKGroup.query.filter_by(user_id=g.user.id, group_id=group_id).first()
+        if exists:
+            flash("Group is already added.", "danger")
+        else:
+            db.session.add(
+                VKGroup(
+                    user_id=g.user.id,
+                    name=request.form.get("name") or group_id,
+                    group_id=group_id,
+                    vk_api_key=request.form.get("vk_api_key") or None,
+                )
+            )
+            db.session.commit()
+            get_user_cache().invalidate(g.user.id)
+            invalidate_responses(user_id=g.user.id)
+            flash("Group added!", "success")
+
+    groups = VKGroup.query.filter_by(user_id=g.user.id).order_by(VKGroup.name).all()
+    return render_template("groups.html", groups=groups)
+
+
+@smm_bp.route("/groups/<int:group_pk>/delete", methods=["POST"])
+@login_required
+def delete_group(group_pk):
+    """
+    Удаляет группу из списка пользователя.
+
+    Возвращает:
+        redirect: На страницу списка групп.
+    """
+    group = VKGroup.query.filter_by(id=group_pk, user_id=g.user.id).first_or_404()
+    db.session.delete(group)
+    db.session.commit()
+    get_user_cache().invalidate(g.user.id)
+    invalidate_responses(user_id=g.user.id)
+    flash("Group removed.", "success")
+    return redirect(url_for("smm.groups"))
 
 
 @smm_bp.route("/settings", methods=["GET", "POST"])
+@login_required
 def settings():
     """
     Отображает и обрабатывает страницу настроек пользователя.
 
     - GET: Отображает текущие настройки.
-    - POST: Сохраняет новые значения VK API ID и VK Group ID.
+    - POST: Сохраняет VK API ID, VK Group ID и настройки бота Telegram.
 
     Возвращает:
         render_template: Страница настроек или перенаправление при неавторизации.
     """
-    if "user_id" not in session:
-        return redirect(url_for("auth.login"))
-
-    user = User.query.get(session["user_id"])
+    user = g.user
 
     if request.method == "POST":
+        user = db.session.get(User, g.user.id)
         user.vk_api_id = request.form["vk_api_id"]
         user.vk_group_id = request.form["vk_group_id"]
+        user.telegram_bot_token = request.form.get("telegram_bot_token") or None
+        user.telegram_chat_id = request.form.get("telegram_chat_id") or None
         db.session.commit()
+        get_user_cache().invalidate(user.id)
+        invalidate_responses(user_id=user.id)
         flash("Settings saved!", "success")
 
     return render_template("settings.html", user=user)
 
 
 @smm_bp.route("/post-generator", methods=["GET", "POST"])
+@login_required
 def post_generator():
     """
-    Генерирует пост и изображение при необходимости, и публикует их в VK.
+    Ставит в очередь задачу генерации поста (и изображения при необходимости)
+    с последующей публикацией на выбранных площадках (targets: vk, telegram).
 
     - GET: Отображает форму генерации поста.
-    - POST: Обрабатывает данные формы, генерирует текст и изображение, публикует пост в VK.
+    - POST: Создает фоновую задачу и сразу возвращает её ID. Ход выполнения
+      и результат страница получает через маршрут job_status.
 
     Возвращает:
-        render_template: Страница генерации поста с результатами или без.
+        render_template: Страница генерации поста с ID задачи или без.
+        JSON: ID задачи, если клиент запросил application/json.
     """
-    if "user_id" not in session:
-        return redirect(url_for("auth.login"))
-
     if request.method == "POST":
-        tone = request.form["tone"]
-        topic = request.form["topic"]
-        generate_image = "generate_image" in request.form
-        auto_post = "auto_post" in request.form
+        params = {
+            "tone": request.form["tone"],
+            "topic": request.form["topic"],
+            "generate_image": "generate_image" in request.form,
+            "image_count": parse_image_count(request.form.get("image_count")),
+            "auto_post": "auto_post" in request.form,
+            "targets": parse_targets(request.form.getlist("targets")),
+            "force_regenerate": "force_regenerate" in request.form,
+            "publish_at": request.form.get("publish_at") or None,
+        }
+        job = enqueue_job(g.user.id, "post", params)
+
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify(job.to_dict()), 202
+
+        return render_template("post_generator.html", job_id=job.id)
 
-        user = User.query.get(session["user_id"])
+    return render_template("post_generator.html")
 
-        post_gen = PostGenerator(openai_key, tone, topic)
-        post_content = post_gen.generate_post()
 
-        image_url = None
-        if generate_image:
-            image_gen = ImageGenerator(openai_key)
-            image_prompt = post_gen.generate_post_image_description()
-            image_url = image_gen.generate_image(image_prompt)
+@smm_bp.route("/post-generator/stream", methods=["GET"])
+@api_login_required
+def post_generator_stream():
+    """
+    Генерирует текст поста потоково и отдает его через Server-Sent Events.
 
-        if auto_post:
-            vk_publisher = VKPublisher(user.vk_api_id, user.vk_group_id)
-            vk_publisher.publish_post(post_content, image_url)
-            flash("Post published to VK successfully!", "success")
+    Параметры запроса: tone, topic, generate_image, image_count, auto_post,
+    targets, force_regenerate.
+    Каждый фрагмент текста отправляется событием "token". После завершения
+    отправляется событие "done" с итоговым текстом; если нужно изображение
+    или публикация, для них ставится фоновая задача и её ID передается
+    в том же событии.
 
-        return render_template(
-            "post_generator.html", post_content=post_content, image_url=image_url
+    Возвращает:
+        Response: Поток text/event-stream.
+    """
+    user_id = g.user.id
+    params = post_stream_params(request.args)
+
+    @stream_with_context
+    def events():
+        from config import openai_key
+        from generators.text_gen import PostGenerator
+
+        post_gen = PostGenerator(
+            openai_key,
+            params["tone"],
+            params["topic"],
+            platform=prompt_platform(params["targets"]),
         )
+        parts = []
+        try:
+            for token in post_gen.stream_post(force=params["force_regenerate"]):
+                parts.append(token)
+                yield sse_event("token", {"token": token})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+
+        done = {"post_content": "".join(parts), "job_id": None}
+        if params["generate_image"] or params["auto_post"]:
+            job_params = dict(params, post_content=done["post_content"])
+            done["job_id"] = enqueue_job(user_id, "post", job_params).id
+        yield sse_event("done", done)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def post_stream_params(args):
+    """
+    Разбирает параметры потоковой генерации (см. post_generator_stream).
 
-    return render_template("post_generator.html")
+    Аргументы:
+        args (MultiDict): Параметры запроса; tone и topic обязательны (KeyError).
+
+    Возвращает:
+        dict: Параметры задачи генерации поста.
+    """
+    return {
+        "tone": args["tone"],
+        "topic": args["topic"],
+        "generate_image": args.get("generate_image") == "1",
+        "image_count": parse_image_count(args.get("image_count")),
+        "auto_post": args.get("auto_post") == "1",
+        "targets": parse_targets(args.getlist("targets")),
+        "force_regenerate": args.get("force_regenerate") == "1",
+        "publish_at": args.get("publish_at") or None,
+    }
+
+
+def sse_event(event, data):
+    """
+    Возвращает событие Server-Sent Events с данными в JSON.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@smm_bp.route("/jobs/<int:job_id>", methods=["GET"])
+@api_login_required
+def job_status(job_id):
+    """
+    Возвращает состояние фоновой задачи текущего пользователя.
+
+    Возвращает:
+        JSON: Статус, текущий шаг, результат или ошибка задачи.
+    """
+    job = Job.query.filter_by(id=job_id, user_id=g.user.id).first()
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job.to_dict())
+
+
+@smm_bp.route("/bulk", methods=["GET", "POST"])
+@login_required
+def bulk():
+    """
+    Пакетная генерация постов по контент-плану.
+
+    - GET: Отображает форму для CSV (topic, tone, generate_image).
+    - POST: Создает пакет и ставит фоновую задачу его генерации.
+
+    Возвращает:
+        render_template: Страница с формой или перенаправление на страницу пакета.
+    """
+    if request.method == "POST":
+        from generators.bulk import parse_rows
+
+        csv_text = request.form.get("rows", "")
+        upload = request.files.get("file")
+        if upload and upload.filename:
+            csv_text = upload.read().decode("utf-8-sig")
+
+        try:
+            rows = parse_rows(csv_text)
+        except ValueError as e:
+            flash(str(e), "danger")
+            return render_template("bulk.html", rows=csv_text)
+        if not rows:
+            flash("Content plan is empty.", "danger")
+            return render_template("bulk.html", rows=csv_text)
+
+        batch = Batch(user_id=g.user.id)
+        db.session.add(batch)
+        db.session.flush()
+        bulk_insert(
+            BatchItem,
+            [
+                {"batch_id": batch.id, "position": position, **row}
+                for position, row in enumerate(rows)
+            ],
+        )
+        db.session.commit()
+
+        enqueue_job(
+            g.user.id,
+            "bulk",
+            {
+                "batch_id": batch.id,
+                "force_regenerate": "force_regenerate" in request.form,
+            },
+        )
+        return redirect(url_for("smm.bulk_batch", batch_id=batch.id))
+
+    return render_template("bulk.html")
+
+
+@smm_bp.route("/bulk/<int:batch_id>", methods=["GET"])
+@login_required
+def bulk_batch(batch_id):
+    """
+    Отображает пакет постов для просмотра результатов генерации.
+
+    Возвращает:
+        render_template: Страница пакета или 404.
+    """
+    batch = Batch.query.filter_by(id=batch_id, user_id=g.user.id).first_or_404()
+    return render_template("bulk_batch.html", batch=batch)
+
+
+@smm_bp.route("/schedule", methods=["GET"])
+@login_required
+def schedule():
+    """
+    Отображает расписание публикаций пользователя.
+
+    Возвращает:
+        render_template: Страница со списком запланированных постов.
+    """
+    posts = (
+        ScheduledPost.query.filter_by(user_id=g.user.id)
+        .order_by(ScheduledPost.publish_at.desc())
+        .limit(100)
+        .all()
+    )
+    return render_template("schedule.html", posts=posts)
+
+
+@smm_bp.route("/cache-stats", methods=["GET"])
+@api_login_required
+def cache_stats():
+    """
+    Возвращает счетчики попаданий и промахов кэша генераций.
+
+    Возвращает:
+        JSON: hits, memory_hits, disk_hits, misses, entries, images
+        (файлы, ключи и размер хранилища изображений) и responses
+        (счетчики кэша страниц).
+    """
+    stats = get_cache().stats()
+    store = get_image_store()
+    if store is not None:
+        stats["images"] = store.stats()
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        stats["responses"] = response_cache.stats()
+    return jsonify(stats)
+
+
+@smm_bp.route("/token-usage", methods=["GET"])
+@api_login_required
+def token_usage():
+    """
+    Возвращает расход токенов OpenAI по шаблонам промтов (см. generators.prompts).
+
+    Возвращает:
+        JSON: Для каждого шаблона — число запросов, токены промта, ответа
+        и взятые из кэша промтов провайдера, обрезанные max_tokens ответы,
+        размер общего префикса и бюджеты шаблона.
+    """
+    from generators.prompts import usage_report
+
+    return jsonify(usage_report())
+
+
+@smm_bp.route("/images/<digest>", methods=["GET"])
+@api_login_required
+def stored_image(digest):
+    """
+    Отдает изображение из локального хранилища.
+
+    Адрес изображения — хэш его содержимого, поэтому ответ неизменен
+    и кэшируется браузером надолго.
+
+    Возвращает:
+        Response: Файл изображения или 404.
+    """
+    store = get_image_store()
+    content_type = store.content_type(digest) if store is not None else None
+    if content_type is None or not os.path.exists(store.path(digest)):
+        abort(404)
+    return send_file(
+        store.path(digest),
+        mimetype=content_type,
+        etag=digest,
+        max_age=365 * 24 * 60 * 60,
+        conditional=True,
+    )
 
 
 @smm_bp.route("/vk-stats", methods=["GET"])
+@login_required
+@cached_response
 def vk_stats():
     """
-    Отображает статистику последних постов в группе VK.
+    Отображает статистику постов группы VK из локального хранилища.
 
-    Получает статистику (лайки и просмотры) для последних 5 постов и отображает её.
+    Данные читаются из таблицы PostStat, которую заполняет фоновая
+    синхронизация (маршрут vk_stats_sync), поэтому страница не обращается
+    к VK API и поддерживает историю глубже последних 100 постов.
+    Если данных для группы еще нет, синхронизация запускается автоматически.
 
     Возвращает:
         render_template: Страница со статистикой постов или перенаправление при неавторизации.
+        JSON: Та же страница (см. post_stats_json), если клиент запросил application/json.
     """
-    if "user_id" not in session:
-        return redirect(url_for("auth.login"))
+    from app.stats_sync import post_stats_json, post_stats_page
+
+    user = g.user
+    wants_json = request.accept_mimetypes.best == "application/json"
+    if not user.vk_group_id:
+        if wants_json:
+            return jsonify({"error": "VK group is not configured"}), 400
+        flash("Set VK group ID in settings to see statistics.", "danger")
+        return redirect(url_for("smm.settings"))
+    page = request.args.get("page", 1, type=int)
+
+    pagination, stats = post_stats_page(
+        user.vk_group_id, page, current_app.config["STATS_PAGE_SIZE"]
+    )
+    sync_started = pagination.total == 0
+    if sync_started:
+        enqueue_job(user.id, "stats_sync", {})
+
+    if wants_json:
+        return jsonify(
+            post_stats_json(user.vk_group_id, pagination, stats, sync_started)
+        )
+    if sync_started:
+        flash("Statistics sync started, refresh the page in a few seconds.", "info")
+    return render_template("vk_stats.html", stats=stats, pagination=pagination)
 
-    user = User.query.get(session["user_id"])
 
-    vk_stats = VKStats(user.vk_api_id, user.vk_group_id)
-    posts_stats = vk_stats.get_likes_and_views(count=5)
+@smm_bp.route("/vk-stats/sync", methods=["POST"])
+@login_required
+def vk_stats_sync():
+    """
+    Ставит в очередь инкрементальную синхронизацию статистики стены группы.
 
-    stats = []
-    for post in posts_stats:
-        stats.append(
+    Возвращает:
+        redirect: На страницу статистики.
+    """
+    if not g.user.vk_group_id:
+        flash("Set VK group ID in settings to see statistics.", "danger")
+        return redirect(url_for("smm.settings"))
+    enqueue_job(g.user.id, "stats_sync", {})
+    flash("Statistics sync started.", "info")
+    return redirect(url_for("smm.vk_stats"))
+
+
+@smm_bp.route("/vk-stats/<int:post_id>/history", methods=["GET"])
+@api_login_required
+@cached_response
+def vk_stats_history(post_id):
+    """
+    Возвращает историю лайков и просмотров поста.
+
+    Возвращает:
+        JSON: Список снимков taken_at, likes, views в хронологическом порядке.
+    """
+    user = g.user
+    snapshots = (
+        PostStatSnapshot.query.filter_by(
+            group_id=str(user.vk_group_id), post_id=post_id
+        )
+        .order_by(PostStatSnapshot.taken_at)
+        .all()
+    )
+    return jsonify(
+        [
             {
-                "post_id": post["post_id"],
-                "date": post["date"],
-                "likes": post["likes"],
-                "views": post["views"],
+                "taken_at": snapshot.taken_at.isoformat(),
+                "likes": snapshot.likes,
+                "views": snapshot.views,
             }
-        )
+            for snapshot in snapshots
+        ]
+    )
 
-    return render_template("vk_stats.html", stats=stats)
+
+@smm_bp.route("/analytics", methods=["GET"])
+@login_required
+@cached_response
+def analytics():
+    """
+    Аналитика по сохраненной статистике постов всех групп пользователя.
+
+    Показывает дневные суммы со скользящим средним за 7 дней, изменения
+    неделя к неделе и лучшие слоты для публикации (день недели × час).
+    Расчеты выполняются векторно над колонками PostStat (см. PostMetrics).
+
+    Параметры запроса:
+        group_id (str): Ограничить одной группой (необязательно).
+        tz (int): Сдвиг часового пояса аудитории от UTC в часах (по умолчанию 3).
+
+    Возвращает:
+        render_template: Страница аналитики или JSON при Accept: application/json.
+    """
+    from social_stats.analytics import WEEKDAYS, PostMetrics
+
+    user = g.user
+    groups = user.stats_groups()
+    group_ids = [str(group["group_id"]) for group in groups]
+    selected = request.args.get("group_id")
+    if selected in group_ids:
+        group_ids = [selected]
+    utc_offset = request.args.get("tz", 3, type=int)
+
+    rows = (
+        db.session.query(
+            PostStat.group_id,
+            PostStat.post_id,
+            PostStat.posted_at,
+            PostStat.likes,
+            PostStat.views,
+        )
+        .filter(PostStat.group_id.in_(group_ids))
+        .all()
+    )
+    metrics = PostMetrics.from_rows(rows)
+    daily = metrics.daily()
+    rolling = PostMetrics.rolling_average(daily["engagement"], window=7)
+    weekly = metrics.week_over_week()
+    heatmap = metrics.best_time_heatmap(utc_offset_hours=utc_offset)
+
+    report = {
+        "posts": len(metrics),
+        "daily": [
+            {
+                "day": str(day),
+                "likes": int(likes),
+                "views": int(views),
+                "engagement": float(engagement),
+                "engagement_7d": float(average),
+            }
+            for day, likes, views, engagement, average in zip(
+                daily["days"],
+                daily["likes"],
+                daily["views"],
+                daily["engagement"],
+                rolling,
+            )
+        ],
+        "weekly": [
+            {
+                "week": str(week),
+                "likes": int(likes),
+                "views": int(views),
+                "likes_delta": None if likes_delta != likes_delta else likes_delta,
+                "views_delta": None if views_delta != views_delta else views_delta,
+            }
+            for week, likes, views, likes_delta, views_delta in zip(
+                weekly["weeks"],
+                weekly["likes"],
+                weekly["views"],
+                weekly["likes_delta"].tolist(),
+                weekly["views_delta"].tolist(),
+            )
+        ],
+        "heatmap": [
+            [None if value != value else value for value in row]
+            for row in heatmap["engagement"].tolist()
+        ],
+        "best_slots": [
+            {"weekday": weekday, "hour": hour, "engagement": rate, "posts": posts}
+            for weekday, hour, rate, posts in metrics.best_slots(
+                top=5, utc_offset_hours=utc_offset
+            )
+        ],
+    }
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(report)
+    return render_template(
+        "analytics.html",
+        report=report,
+        groups=groups,
+        selected=selected,
+        utc_offset=utc_offset,
+        weekdays=WEEKDAYS,
+    )
@@ -0,0 +1,154 @@
+import datetime
+
+from app import db
+from app.database import bulk_insert, bulk_upsert
+from app.models import PostStat, PostStatSnapshot
+from core import metrics
+
+
+def load_known_stats(group_id, post_ids):
+    """
+    :return: Словарь post_id -> (likes, views) для уже сохраненных постов
+    """
+    return {
+        post_id: (likes, views)
+        for post_id, likes, views in db.session.query(
+            PostStat.post_id, PostStat.likes, PostStat.views
+        ).filter(PostStat.group_id == group_id, PostStat.post_id.in_(post_ids))
+    }
+
+
+def post_stats_page(group_id, page, per_page):
+    """
+    Страница сохраненной статистики постов группы, новые сначала.
+
+    :param group_id: ID группы VK
+    :param page: Номер страницы (с 1)
+    :param per_page: Постов на странице
+    :return: Пара (Pagination, список словарей post_id, date, likes, views)
+    """
+    pagination = (
+        PostStat.query.filter_by(group_id=str(group_id))
+        .order_by(PostStat.posted_at.desc())
+        .paginate(page=page, per_page=per_page, error_out=False)
+    )
+    stats = [
+        {
+            "post_id": post.post_id,
+            "date": post.posted_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "likes": post.likes,
+            "views": post.views,
+        }
+        for post in pagination.items
+    ]
+    return pagination, stats
+
+
+def post_stats_json(group_id, pagination, stats, sync_started=False):
+    """
+    :return: Ответ JSON страницы статистики (общий для Flask и ASGI)
+    """
+    return {
+        "group_id": str(group_id),
+        "page": pagination.page,
+        "pages": pagination.pages,
+        "total": pagination.total,
+        "posts": stats,
+        "sync_started": sync_started,
+    }
+
+
+def upsert_post_stats(group_id, posts, now=None, known=None):
+    """
+    Сохраняет лайки и просмотры постов одним пакетным запросом.
+
+    Для постов, у которых значения изменились (или которые появились
+    впервые), дополнительно записывается снимок во временной ряд.
+
+    :param group_id: ID группы VK
+    :param posts: Список словарей из VKStats.parse_post()
+    :param now: Время синхронизации (UTC)
+    :param known: Результат load_known_stats() для этих постов, если уже загружен
+    :return: Количество новых или изменившихся постов
+    """
+    if not posts:
+        return 0
+    now = now or datetime.datetime.utcnow()
+
+    if known is None:
+        known = load_known_stats(group_id, [post["post_id"] for post in posts])
+    changed = [
+        post
+        for post in posts
+        if known.get(post["post_id"]) != (post["likes"], post["views"])
+    ]
+    if not changed:
+        return 0
+
+    rows = [
+        {
+            "group_id": group_id,
+            "post_id": post["post_id"],
+            "posted_at": post["date"],
+            "likes": post["likes"],
+            "views": post["views"],
+            "updated_at": now,
+        }
+        for post in changed
+    ]
+    bulk_upsert(
+        PostStat,
+        rows,
+        index_elements=["group_id", "post_id"],
+        update_columns=["likes", "views", "updated_at"],
+    )
+    bulk_insert(
+        PostStatSnapshot,
+        [
+            {
+                "group_id": group_id,
+                "post_id": post["post_id"],
+                "taken_at": now,
+                "likes": post["likes"],
+                "views": post["views"],
+            }
+            for post in changed
+        ],
+    )
+    db.session.commit()
+    return len(changed)
+
+
+@metrics.span("stats.sync")
+def sync_group_stats(vk_stats, recent_days=7, page_size=100):
+    """
+    Инкрементально синхронизирует статистику стены группы с локальной базой.
+
+    Стена обходится постранично от новых записей к старым. Обход
+    останавливается на первой странице, все записи которой уже есть
+    в базе и опубликованы раньше, чем recent_days дней назад: у старых
+    постов лайки и просмотры почти не меняются.
+
+    :param vk_stats: Экземпляр VKStats
+    :param recent_days: Сколько последних дней постов перечитывать всегда
+    :param page_size: Размер страницы wall.get (макс. 100)
+    :return: Словарь с ключами fetched и changed
+    """
+    group_id = str(vk_stats.group_id)
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=recent_days)
+    fetched = changed = 0
+
+    for items in vk_stats.iter_wall(page_size=page_size):
+        posts = [vk_stats.parse_post(item) for item in items]
+        known = load_known_stats(group_id, [post["post_id"] for post in posts])
+        fetched += len(posts)
+        changed += upsert_post_stats(group_id, posts, known=known)
+
+        # Закрепленный пост может быть старым, поэтому он не учитывается.
+        regular = [
+            post for post, item in zip(posts, items) if not item.get("is_pinned")
+        ]
+        if len(known) == len(posts) and all(post["date"] < cutoff for post in regular):
+            break
+
+    return {"fetched": fetched, "changed": changed}
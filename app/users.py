@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, redirect, session, url_for
+
+from app import db
+from app.models import User
+
+
+class CurrentUser:
+    """
+    Настройки пользователя, нужные маршрутам: ID, имя, ключ и группы VK.
+
+    Это снимок строки User (и списка групп) без привязки к сессии
+    SQLAlchemy, поэтому его можно хранить в кэше между запросами.
+    Чтобы изменить пользователя, загрузите модель User по id.
+    """
+
+    __slots__ = (
+        "id",
+        "username",
+        "vk_api_id",
+        "vk_group_id",
+        "telegram_bot_token",
+        "telegram_chat_id",
+        "_groups",
+    )
+
+    def __init__(self, user):
+        """
+        :param user: Модель User
+        """
+        self.id = user.id
+        self.username = user.username
+        self.vk_api_id = user.vk_api_id
+        self.vk_group_id = user.vk_group_id
+        self.telegram_bot_token = user.telegram_bot_token
+        self.telegram_chat_id = user.telegram_chat_id
+        self._groups = user.stats_groups()
+
+    def stats_groups(self):
+        """
+        :return: Группы для статистики (см. User.stats_groups)
+        """
+        return [dict(group) for group in self._groups]
+
+    def __repr__(self):
+        return f"CurrentUser('{self.username}')"
+
+
+class UserCache:
+    """
+    Кэш настроек пользователей с временем жизни ttl секунд.
+
+    Страницы, которые фронтенд опрашивает часто (статистика, статус задач),
+    не обращаются к базе за пользователем на каждый запрос. При сохранении
+    настроек или списка групп запись сбрасывается через invalidate(); другие
+    процессы увидят изменения не позже чем через ttl секунд.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000):
+        """
+        :param ttl: Время жизни записи в секундах
+        :param max_entries: Максимум пользователей в кэше (LRU-вытеснение)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Счетчик сбросов по пользователю: снимок, загруженный до
+        # invalidate(), не должен попасть в кэш после него.
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def get(self, user_id):
+        """
+        Возвращает настройки пользователя из кэша или из базы.
+
+        :param user_id: ID пользователя
+        :return: CurrentUser или None, если пользователя нет
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now < entry[1]:
+                self._entries.move_to_end(user_id)
+                self._counters["hits"] += 1
+                return entry[0]
+            self._counters["misses"] += 1
+            generation = self._generations.get(user_id, 0)
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        current = CurrentUser(user)
+
+        with self._lock:
+            if self._generations.get(user_id, 0) == generation:
+                self._entries[user_id] = (current, now + self.ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return current
+
+    def invalidate(self, user_id):
+        """
+        Удаляет настройки пользователя из кэша.
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def stats(self):
+        """
+        :return: Счетчики попаданий и промахов, размер кэша
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+def init_users(app):
+    """
+    Подключает кэш пользователей и загрузку g.user перед каждым запросом.
+
+    :param app: Flask-приложение
+    """
+    app.extensions["user_cache"] = UserCache(
+        ttl=app.config["USER_CACHE_TTL"], max_entries=app.config["USER_CACHE_SIZE"]
+    )
+
+    @app.before_request
+    def load_user():
+        user_id = session.get("user_id")
+        g.user = get_user_cache().get(user_id) if user_id is not None else None
+
+
+def get_user_cache():
+    """
+    :return: Кэш пользователей текущего приложения
+    """
+    return current_app.extensions["user_cache"]
+
+
+def login_required(view):
+    """
+    Декоратор маршрута: без входа перенаправляет на страницу входа.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.user is None:
+            return redirect(url_for("auth.login"))
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def api_login_required(view):
+    """
+    Декоратор JSON-маршрута: без входа возвращает 401.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.user is None:
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,198 @@
+"""
+Бенчмарк параллельной записи в базу данных.
+
+Несколько потоков одновременно пишут в базу приложения так же, как это
+делают веб-процесс и воркеры: ставят задачи (INSERT и коммит на каждую
+строку) и сохраняют статистику постов пакетами (upsert + снимки). Для SQLite
+сравниваются режимы журнала WAL и rollback:
+
+    python -m benchmarks.db_writers
+    python -m benchmarks.db_writers --database-url postgresql://localhost/smm_bench
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.run import git_revision, percentile
+
+
+def make_app(database_url, wal):
+    from app import create_app, db
+    from app.models import User
+
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": database_url,
+            "SQLITE_WAL": wal,
+            "JOBS_BACKEND": "external",
+            "SCHEDULER_ENABLED": False,
+            "DB_AUTO_MIGRATE": True,
+            "METRICS_ENABLED": False,
+        }
+    )
+    with app.app_context():
+        if db.session.get(User, 1) is None:
+            db.session.add(User(id=1, username="db-bench", password="-"))
+            db.session.commit()
+    return app
+
+
+def write_jobs(app, writer, rows, latencies, errors):
+    """
+    Ставит rows задач по одной, как enqueue_job().
+    """
+    from app import db
+    from app.models import Job
+
+    with app.app_context():
+        for row in range(rows):
+            started_at = time.perf_counter()
+            try:
+                db.session.add(
+                    Job(user_id=1, kind="post", params={"topic": f"{writer}-{row}"})
+                )
+                db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                errors.append(str(e.orig))
+                continue
+            latencies.append(time.perf_counter() - started_at)
+
+
+def write_stats(app, writer, rows, latencies, errors, batch_size=100):
+    """
+    Сохраняет статистику rows постов пакетами, как синхронизация стены.
+    """
+    from app import db
+    from app.stats_sync import upsert_post_stats
+
+    now = datetime.datetime.now()
+    with app.app_context():
+        for start in range(0, rows, batch_size):
+            posts = [
+                {
+                    "post_id": post_id,
+                    "date": now - datetime.timedelta(hours=post_id),
+                    "likes": post_id % 50,
+                    "views": post_id * 3,
+                }
+                for post_id in range(start, min(rows, start + batch_size))
+            ]
+            started_at = time.perf_counter()
+            try:
+                upsert_post_stats(f"bench-{writer}", posts, now=now)
+            except OperationalError as e:
+                db.session.rollback()
+                errors.append(str(e.orig))
+                continue
+            latencies.append(time.perf_counter() - started_at)
+
+
+WORKLOADS = {"jobs": (write_jobs, 1), "stats": (write_stats, 100)}
+
+
+def run_workload(app, workload, writers, rows):
+    """
+    :return: Словарь с пропускной способностью (строк и коммитов в секунду),
+        задержками коммитов и числом ошибок блокировки
+    """
+    write, rows_per_commit = WORKLOADS[workload]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(writer):
+        local_latencies, local_errors = [], []
+        write(app, writer, rows, local_latencies, local_errors)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        list(executor.map(run, range(writers)))
+    duration = time.perf_counter() - started_at
+
+    commits = len(latencies)
+    return {
+        "writers": writers,
+        "rows_per_writer": rows,
+        "commits": commits,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "duration_s": round(duration, 4),
+        "rows_per_s": round(commits * rows_per_commit / duration, 1),
+        "commits_per_s": round(commits / duration, 1),
+        "commit_latency_s": {
+            "p50": round(percentile(latencies, 0.5), 5),
+            "p95": round(percentile(latencies, 0.95), 5),
+            "p99": round(percentile(latencies, 0.99), 5),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=500, help="rows per writer")
+    parser.add_argument(
+        "--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS)
+    )
+    parser.add_argument(
+        "--database-url",
+        help="database to benchmark instead of temporary SQLite files (tables are reused)",
+    )
+    parser.add_argument("--output", default="db_writers_results.json")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="smm-db-bench-")
+    if args.database_url:
+        modes = {"server": (args.database_url, True)}
+    else:
+        modes = {
+            mode: (f"sqlite:///{os.path.join(workdir, mode + '.db')}", wal)
+            for mode, wal in (("sqlite_rollback", False), ("sqlite_wal", True))
+        }
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "settings": vars(args),
+        },
+        "modes": {},
+    }
+    for mode, (database_url, wal) in modes.items():
+        app = make_app(database_url, wal)
+        results["modes"][mode] = {}
+        for workload in args.workloads:
+            result = run_workload(app, workload, args.writers, args.rows)
+            results["modes"][mode][workload] = result
+            print(
+                f"{mode:<16} {workload:<6} {result['rows_per_s']:>9} rows/s  "
+                f"{result['commits_per_s']:>8} commits/s  "
+                f"p95={result['commit_latency_s']['p95']}s  "
+                f"errors={result['errors']}"
+            )
+        with app.app_context():
+            from app import db
+
+            db.engine.dispose()
+    shutil.rmtree(workdir)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
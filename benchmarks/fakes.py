@@ -0,0 +1,433 @@
+import hashlib
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Локальные заменители OpenAI, VK и Telegram Bot API для бенчмарков.
+#
+# Серверы отвечают в формате настоящих API ровно настолько, насколько
+# это нужно генераторам, публикатору и статистике. Задержка, доля ошибок
+# и лимит запросов в секунду настраиваются, поэтому можно измерять
+# поведение приложения под нагрузкой без ключей и без сети.
+
+
+class FakeServer:
+    """
+    Базовый HTTP-сервер с настраиваемыми задержкой, ошибками и лимитом.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None):
+        """
+        :param latency: Задержка ответа в секундах
+        :param jitter: Случайная добавка к задержке (от 0 до jitter секунд)
+        :param error_rate: Доля запросов, завершающихся ошибкой сервера
+        :param rate_limit: Максимум запросов в секунду; сверх него — ошибка лимита
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self._window = []
+        self._lock = threading.Lock()
+        self._server = None
+        self.url = None
+
+    def start(self):
+        """
+        Запускает сервер на свободном порту в фоновом потоке.
+
+        :return: Базовый URL сервера
+        """
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                owner._dispatch(self)
+
+            do_POST = do_GET
+
+        class Server(ThreadingHTTPServer):
+            # Сотни одновременных подключений (асинхронный режим) не должны
+            # упираться в очередь accept() размером 5 по умолчанию.
+            request_queue_size = 1024
+
+            def handle_error(self, request, client_address):
+                # Клиент закрыл соединение, не дождавшись ответа (таймаут).
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        """
+        :return: Счетчики запросов, ошибок и отказов по лимиту
+        """
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+        }
+
+    def handle(self, path, params, body):
+        """
+        Формирует ответ на запрос.
+
+        :return: Кортеж (статус, заголовки, тело bytes) или генератор фрагментов
+        """
+        raise NotImplementedError
+
+    def rate_limit_response(self):
+        raise NotImplementedError
+
+    def error_response(self):
+        raise NotImplementedError
+
+    def _dispatch(self, request):
+        url = urlparse(request.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if request.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = self._read_chunked(request.rfile)
+        else:
+            length = int(request.headers.get("Content-Length") or 0)
+            body = request.rfile.read(length) if length else b""
+        content_type = request.headers.get("Content-Type", "")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            params.update(
+                {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            )
+
+        with self._lock:
+            self.requests += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self._over_limit():
+            with self._lock:
+                self.rate_limited += 1
+            response = self.rate_limit_response()
+        elif self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            response = self.error_response()
+        else:
+            response = self.handle(url.path, params, body)
+
+        status, headers, payload = response
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        if isinstance(payload, bytes):
+            request.send_header("Content-Length", str(len(payload)))
+            request.end_headers()
+            request.wfile.write(payload)
+        else:
+            request.send_header("Transfer-Encoding", "chunked")
+            request.end_headers()
+            for chunk in payload:
+                request.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            request.wfile.write(b"0\r\n\r\n")
+
+    @staticmethod
+    def _read_chunked(stream):
+        # Тело без Content-Length (потоковая загрузка из асинхронного режима).
+        body = b""
+        while True:
+            size = int(stream.readline().split(b";")[0], 16)
+            if not size:
+                stream.readline()
+                return body
+            body += stream.read(size)
+            stream.readline()
+
+    def _over_limit(self):
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                return True
+            self._window.append(now)
+            return False
+
+
+def json_response(data, status=200):
+    return status, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+
+class FakeOpenAI(FakeServer):
+    """
+    Заменитель OpenAI API: chat.completions (обычный и потоковый режим),
+    images.generate и раздача сгенерированных изображений.
+    """
+
+    def __init__(self, completion_words=120, image_bytes=200 * 1024, **options):
+        """
+        :param completion_words: Сколько слов в ответе модели
+        :param image_bytes: Размер "сгенерированного" изображения
+        :param options: Параметры FakeServer
+        """
+        super().__init__(**options)
+        self.completion_words = completion_words
+        self.image_bytes = image_bytes
+        self._ids = itertools.count(1)
+
+    def handle(self, path, params, body):
+        if path.endswith("/chat/completions"):
+            request = json.loads(body)
+            if request.get("stream"):
+                return 200, {"Content-Type": "text/event-stream"}, self._stream(request)
+            return json_response(self._completion(request))
+        if path.endswith("/images/generations"):
+            request = json.loads(body)
+            digest = hashlib.sha256(request["prompt"].encode("utf-8")).hexdigest()
+            return json_response(
+                {
+                    "created": int(time.time()),
+                    "data": [
+                        {"url": f"{self.url}/files/{digest}-{next(self._ids)}.png"}
+                        for _ in range(request.get("n", 1))
+                    ],
+                }
+            )
+        if path.startswith("/files/"):
+            seed = path.rsplit("/", 1)[-1].encode("utf-8")
+            block = hashlib.sha256(seed).digest()
+            data = (block * (self.image_bytes // len(block) + 1))[: self.image_bytes]
+            return 200, {"Content-Type": "image/png"}, data
+        return json_response({"error": {"message": "Not found"}}, status=404)
+
+    def rate_limit_response(self):
+        status, headers, body = json_response(
+            {"error": {"message": "Rate limit reached", "type": "requests"}},
+            status=429,
+        )
+        headers["retry-after-ms"] = "200"
+        return status, headers, body
+
+    def error_response(self):
+        return json_response(
+            {"error": {"message": "The server had an error", "type": "server_error"}},
+            status=500,
+        )
+
+    def _words(self, request):
+        topic = request["messages"][-1]["content"]
+        words = [f"слово{i % 17}" for i in range(self.completion_words)] + [topic[:40]]
+        # Одно "слово" — один токен ответа.
+        return words[: request.get("max_tokens") or len(words)]
+
+    def _finish_reason(self, request, words):
+        if request.get("max_tokens") and len(words) >= request["max_tokens"]:
+            return "length"
+        return "stop"
+
+    def _usage(self, request, words):
+        prompt = sum(len(m["content"].split()) for m in request["messages"])
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": len(words),
+            "total_tokens": prompt + len(words),
+        }
+
+    def _completion(self, request):
+        words = self._words(request)
+        return {
+            "id": f"chatcmpl-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": self._finish_reason(request, words),
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                }
+            ],
+            "usage": self._usage(request, words),
+        }
+
+    def _stream(self, request):
+        words = self._words(request)
+        base = {
+            "id": f"chatcmpl-{next(self._ids)}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request["model"],
+        }
+        for word in words:
+            chunk = dict(
+                base,
+                choices=[
+                    {
+                        "index": 0,
+                        "delta": {"content": word + " "},
+                        "finish_reason": None,
+                    }
+                ],
+            )
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        finish = dict(
+            base,
+            choices=[
+                {
+                    "index": 0,
+                    "delta": {},
+                    "finish_reason": self._finish_reason(request, words),
+                }
+            ],
+        )
+        yield f"data: {json.dumps(finish)}\n\n".encode()
+        yield f"data: {json.dumps(dict(base, choices=[], usage=self._usage(request, words)))}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+
+class FakeVK(FakeServer):
+    """
+    Заменитель VK API: публикация (с дедупликацией по guid), загрузка фото,
+    стена, подписчики, статистика и execute.
+    """
+
+    def __init__(self, wall_size=500, **options):
+        """
+        :param wall_size: Сколько постов на стене каждой группы
+        :param options: Параметры FakeServer
+        """
+        super().__init__(**options)
+        self.wall_size = wall_size
+        self._posts = {}
+        self._post_ids = itertools.count(1)
+        now = int(time.time())
+        self._wall = [
+            {
+                "id": wall_size - i,
+                "date": now - i * 3 * 3600,
+                "likes": {"count": (i * 7) % 300},
+                "views": {"count": 1000 + (i * 13) % 5000},
+            }
+            for i in range(wall_size)
+        ]
+
+    def handle(self, path, params, body):
+        if path.endswith("/upload"):
+            return json_response({"photo": "[]", "server": 1, "hash": "fake"})
+        method = path.rsplit("/", 1)[-1]
+        if method == "execute":
+            return json_response({"response": self._execute(params["code"])})
+        return json_response({"response": self._call(method, params)})
+
+    def rate_limit_response(self):
+        return json_response(
+            {"error": {"error_code": 6, "error_msg": "Too many requests per second"}}
+        )
+
+    def error_response(self):
+        return json_response(
+            {"error": {"error_code": 10, "error_msg": "Internal server error"}}
+        )
+
+    def _call(self, method, params):
+        if method == "wall.post":
+            guid = params.get("guid")
+            with self._lock:
+                if guid and guid in self._posts:
+                    return {"post_id": self._posts[guid]}
+                post_id = next(self._post_ids)
+                if guid:
+                    self._posts[guid] = post_id
+            return {"post_id": post_id}
+        if method == "wall.get":
+            offset = int(params.get("offset", 0))
+            count = int(params.get("count", 20))
+            return {
+                "count": len(self._wall),
+                "items": self._wall[offset : offset + count],
+            }
+        if method == "groups.getMembers":
+            return {"count": 12345, "items": []}
+        if method == "stats.get":
+            return [{"period_from": 0, "visitors": {"views": 100}}]
+        if method == "photos.getWallUploadServer":
+            return {"upload_url": f"{self.url}/upload"}
+        if method == "photos.saveWallPhoto":
+            return [{"id": next(self._post_ids), "owner_id": -1}]
+        return {}
+
+    def _execute(self, code):
+        if "saveWallPhoto" in code and "wall.post" in code:
+            return {"post_id": next(self._post_ids)}
+        return [
+            self._call(method, json.loads(arguments))
+            for method, arguments in re.findall(r"API\.([\w.]+)\((\{.*?\})\)", code)
+        ]
+
+
+class FakeTelegram(FakeServer):
+    """
+    Заменитель Telegram Bot API: sendMessage, sendPhoto и sendMediaGroup.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._message_ids = itertools.count(1)
+
+    def handle(self, path, params, body):
+        method = path.rsplit("/", 1)[-1]
+        if method == "sendMediaGroup":
+            # Фото альбома перечислены в JSON-поле media (см. TelegramPublisher).
+            count = max(body.count(b'"type": "photo"'), 1)
+            return self._ok([self._message() for _ in range(count)])
+        if method in ("sendMessage", "sendPhoto"):
+            return self._ok(self._message())
+        return json_response(
+            {"ok": False, "error_code": 404, "description": "Not Found"}, status=404
+        )
+
+    def rate_limit_response(self):
+        return json_response(
+            {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            },
+            status=429,
+        )
+
+    def error_response(self):
+        return json_response(
+            {"ok": False, "error_code": 500, "description": "Internal Server Error"},
+            status=500,
+        )
+
+    def _message(self):
+        return {"message_id": next(self._message_ids), "date": int(time.time())}
+
+    @staticmethod
+    def _ok(result):
+        return json_response({"ok": True, "result": result})
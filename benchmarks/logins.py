@@ -0,0 +1,200 @@
+"""
+Бенчмарк входа пользователей под нагрузкой.
+
+Несколько клиентов одновременно входят через маршрут /auth/login (как после
+смены SECRET_KEY, когда сессии всех пользователей становятся
+недействительными), а отдельный клиент в это время запрашивает легкую
+страницу. Для хэширования в потоке запроса и в пуле потоков выводятся
+входы в секунду (всего и на ядро) и задержка легкой страницы во время
+"шторма" входов. Сценарий invalid проверяет, что подбор пароля после
+LOGIN_MAX_ATTEMPTS попыток отклоняется без хэширования:
+
+    python -m benchmarks.logins
+    python -m benchmarks.logins --rounds 10 --clients 16 --workers 4
+"""
+
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.run import git_revision, percentile
+
+PASSWORD = "benchmark-password"
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def make_app(workdir, mode, args):
+    from app import create_app, db
+    from app.models import User
+    from core.passwords import hash_password
+
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///"
+            + os.path.join(workdir, f"{mode}.db"),
+            "JOBS_BACKEND": "external",
+            "SCHEDULER_ENABLED": False,
+            "DB_AUTO_MIGRATE": True,
+            "WTF_CSRF_ENABLED": False,
+            "BCRYPT_LOG_ROUNDS": args.rounds,
+            "PASSWORD_HASH_WORKERS": args.workers if mode == "pool" else 0,
+            "LOGIN_MAX_ATTEMPTS": args.max_attempts,
+        }
+    )
+    # Один хэш на всех пользователей: подготовка не должна занимать минуты.
+    password_hash = hash_password(PASSWORD, args.stored_rounds or args.rounds)
+    with app.app_context():
+        db.session.add_all(
+            User(username=f"user{index:05d}", password=password_hash)
+            for index in range(args.users)
+        )
+        db.session.commit()
+    return app
+
+
+def run_storm(app, args, password, spread):
+    """
+    :return: Словарь с пропускной способностью входа и задержками легкой страницы
+    """
+    latencies = []
+    probe_latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def login(client_index):
+        client = app.test_client()
+        local, local_statuses = [], {}
+        for attempt in range(args.logins):
+            index = (client_index * args.logins + attempt) % args.users if spread else 0
+            username = f"user{index:05d}"
+            started_at = time.perf_counter()
+            response = client.post(
+                "/auth/login", data={"username": username, "password": password}
+            )
+            local.append(time.perf_counter() - started_at)
+            local_statuses[response.status_code] = (
+                local_statuses.get(response.status_code, 0) + 1
+            )
+        with lock:
+            latencies.extend(local)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            started_at = time.perf_counter()
+            client.get("/auth/register")
+            probe_latencies.append(time.perf_counter() - started_at)
+            time.sleep(0.01)
+
+    probe_thread = threading.Thread(target=probe, daemon=True)
+    probe_thread.start()
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        list(executor.map(login, range(args.clients)))
+    duration = time.perf_counter() - started_at
+    done.set()
+    probe_thread.join()
+
+    cores = cpu_count()
+    logins = len(latencies)
+    return {
+        "logins": logins,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "duration_s": round(duration, 4),
+        "logins_per_s": round(logins / duration, 2),
+        "logins_per_s_per_core": round(logins / duration / cores, 2),
+        "login_latency_s": {
+            "p50": round(percentile(latencies, 0.5), 4),
+            "p95": round(percentile(latencies, 0.95), 4),
+        },
+        "page_latency_s": {
+            "p50": round(percentile(probe_latencies, 0.5), 4),
+            "p95": round(percentile(probe_latencies, 0.95), 4),
+            "max": round(max(probe_latencies, default=0.0), 4),
+        },
+    }
+
+
+# Пароль и распределение входов: valid — разные пользователи с верным
+# паролем, invalid — подбор пароля одного пользователя.
+SCENARIOS = {"valid": (PASSWORD, True), "invalid": ("wrong-password", False)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=5, help="logins per client")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_LOG_ROUNDS")
+    parser.add_argument(
+        "--stored-rounds",
+        type=int,
+        help="cost of existing hashes; differs from --rounds to measure rehash-on-login",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=cpu_count(), help="PASSWORD_HASH_WORKERS"
+    )
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument(
+        "--modes", nargs="+", choices=["inline", "pool"], default=["inline", "pool"]
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument("--output", default="logins_results.json")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "cpu_count": cpu_count(),
+            "settings": vars(args),
+        },
+        "modes": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="smm-login-bench-") as workdir:
+        for mode in args.modes:
+            results["modes"][mode] = {}
+            for scenario in args.scenarios:
+                # Свежая база и счетчики попыток для каждого прогона.
+                app = make_app(workdir, f"{mode}-{scenario}", args)
+                result = run_storm(app, args, *SCENARIOS[scenario])
+                results["modes"][mode][scenario] = result
+                print(
+                    f"{mode:<7} {scenario:<8} {result['logins_per_s']:>8} logins/s  "
+                    f"{result['logins_per_s_per_core']:>8} /s/core  "
+                    f"login p95={result['login_latency_s']['p95']}s  "
+                    f"page p95={result['page_latency_s']['p95']}s  "
+                    f"statuses={result['statuses']}"
+                )
+                with app.app_context():
+                    from app import db
+
+                    db.engine.dispose()
+
+        from core.passwords import get_password_hasher
+
+        get_password_hasher().close()
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,753 @@
+"""
+Офлайн-бенчмарки SMM Assistant.
+
+Запускает приложение и его классы против локальных заменителей OpenAI, VK
+и Telegram (benchmarks/fakes.py) и измеряет пропускную способность, задержки
+(p50/p95/p99) и пиковую память для каждого сценария. Результаты пишутся
+в JSON, который можно сравнить с предыдущим запуском:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import importlib
+import inspect
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeOpenAI, FakeTelegram, FakeVK
+
+OPENAI_KEY = "sk-benchmark"
+VK_KEY = "vk-benchmark"
+GROUP_ID = "1"
+TELEGRAM_TOKEN = "123:tg-benchmark"
+TELEGRAM_CHAT_ID = "@benchmark"
+PRELOADED_MODULES = [
+    "openai",
+    "httpx",
+    "requests",
+    "generators.bulk",
+    "social_publishers.vk_publisher",
+    "social_publishers.telegram_publisher",
+    "social_publishers.dispatcher",
+    "social_stats.aggregator",
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def measure(operation, iterations, concurrency):
+    """
+    Выполняет operation(i) iterations раз в concurrency потоков.
+
+    :return: Словарь с пропускной способностью, задержками, ошибками и памятью
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(index):
+        started_at = time.perf_counter()
+        try:
+            operation(index)
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started_at)
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, range(iterations)))
+    duration = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return _summary(iterations, concurrency, latencies, errors, duration, peak)
+
+
+def measure_async(operation, iterations, concurrency):
+    """
+    Выполняет корутину operation(i) iterations раз, не больше concurrency
+    одновременно, в одном потоке и одном цикле событий.
+
+    :return: Словарь того же формата, что у measure()
+    """
+    latencies = []
+    errors = []
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(index):
+            async with semaphore:
+                started_at = time.perf_counter()
+                try:
+                    await operation(index)
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                    return
+                latencies.append(time.perf_counter() - started_at)
+
+        await asyncio.gather(*(run(index) for index in range(iterations)))
+        if hasattr(operation, "aclose"):
+            await operation.aclose()
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    asyncio.run(run_all())
+    duration = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return _summary(iterations, concurrency, latencies, errors, duration, peak)
+
+
+def _summary(iterations, concurrency, latencies, errors, duration, peak):
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "duration_s": round(duration, 4),
+        "throughput_per_s": round(len(latencies) / duration, 3) if duration else 0.0,
+        "latency_s": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.5), 4),
+            "p95": round(percentile(latencies, 0.95), 4),
+            "p99": round(percentile(latencies, 0.99), 4),
+            "max": round(max(latencies), 4) if latencies else 0.0,
+        },
+        "memory": {
+            "python_peak_bytes": peak,
+            "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+    }
+
+
+class Environment:
+    """
+    Фейковые серверы и приложение Flask, настроенное на них.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.openai = FakeOpenAI(
+            latency=args.openai_latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_limit=args.server_rate_limit,
+        )
+        self.vk = FakeVK(
+            latency=args.vk_latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_limit=args.server_rate_limit,
+        )
+        self.telegram = FakeTelegram(
+            latency=args.telegram_latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_limit=args.server_rate_limit,
+        )
+        # Сеть, которая отвечает дольше таймаута публикации (fanout_degraded).
+        self.slow_telegram = FakeTelegram(latency=args.slow_latency)
+        self.workdir = tempfile.TemporaryDirectory(prefix="smm-bench-")
+        self.app = None
+
+    def __enter__(self):
+        openai_url = self.openai.start()
+        vk_url = self.vk.start()
+        telegram_url = self.telegram.start()
+        self.slow_telegram.start()
+        # Клиенты OpenAI читают адрес API из переменной окружения.
+        os.environ["OPENAI_BASE_URL"] = f"{openai_url}/v1"
+        # Приложение берет ключи из config.py; в бенчмарке ключи фиктивные.
+        sys.modules["config"] = types.SimpleNamespace(
+            openai_key=OPENAI_KEY, vk_api_key=VK_KEY, vk_group_id=GROUP_ID
+        )
+
+        # Сценарии измеряют установившийся режим, поэтому модули, которые
+        # приложение загружает при первом обращении к API, импортируются
+        # заранее (холодный старт измеряет benchmarks.startup).
+        for module in PRELOADED_MODULES:
+            importlib.import_module(module)
+
+        from app import create_app, db
+        from app.models import User
+
+        self.app = create_app(
+            {
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///"
+                + os.path.join(self.workdir.name, "bench.db"),
+                "JOBS_BACKEND": "inline",
+                "SCHEDULER_ENABLED": False,
+                "DB_AUTO_MIGRATE": True,
+                "VK_API_URL": f"{vk_url}/method",
+                "TELEGRAM_API_URL": telegram_url,
+                "CLIENT_POOL_SIZE": self.args.client_pool_size,
+                "IMAGE_STORE_DIR": os.path.join(self.workdir.name, "images"),
+                "OPENAI_REQUESTS_PER_SECOND": self.args.openai_rps,
+                "VK_REQUESTS_PER_SECOND": self.args.vk_rps,
+                "TELEGRAM_REQUESTS_PER_SECOND": self.args.telegram_rps,
+                "RATE_LIMIT_MAX_RETRIES": 8,
+            }
+        )
+        with self.app.app_context():
+            db.session.add(
+                User(
+                    username="bench",
+                    password="-",
+                    vk_api_id=VK_KEY,
+                    vk_group_id=GROUP_ID,
+                    telegram_bot_token=TELEGRAM_TOKEN,
+                    telegram_chat_id=TELEGRAM_CHAT_ID,
+                )
+            )
+            db.session.commit()
+        return self
+
+    def __exit__(self, *exc):
+        from core.clients import close_all
+
+        close_all()
+        self.openai.stop()
+        self.vk.stop()
+        self.telegram.stop()
+        self.slow_telegram.stop()
+        self.workdir.cleanup()
+
+    def client(self):
+        """
+        :return: Тестовый клиент Flask с сессией авторизованного пользователя
+        """
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = 1
+        return client
+
+    @property
+    def vk_api_url(self):
+        return self.app.config["VK_API_URL"]
+
+    @property
+    def telegram_api_url(self):
+        return self.app.config["TELEGRAM_API_URL"]
+
+
+def scenario_single_post(env):
+    """
+    Генерация одного поста через маршрут /smm/post-generator и очередь задач.
+    """
+    clients = threading.local()
+
+    def operation(index):
+        if not hasattr(clients, "client"):
+            clients.client = env.client()
+        response = clients.client.post(
+            "/smm/post-generator",
+            data={"tone": "дружелюбный", "topic": f"Тема {index}"},
+            headers={"Accept": "application/json"},
+        )
+        # Встроенная очередь выполняет задачи по порядку в тех потоках, что их
+        # поставили, поэтому задача могла достаться соседнему потоку.
+        job = response.json
+        while job["status"] in ("queued", "running"):
+            time.sleep(0.01)
+            job = clients.client.get(f"/smm/jobs/{job['id']}").json
+        if job["status"] != "done":
+            raise RuntimeError(job["error"])
+
+    return operation
+
+
+def scenario_post_image_publish(env):
+    """
+    Текст, описание и изображение (параллельно) и публикация в VK с загрузкой фото.
+    """
+    from generators.cache import GenerationCache
+    from generators.image_gen import ImageGenerator
+    from generators.text_gen import PostGenerator
+    from social_publishers.vk_publisher import VKPublisher
+
+    cache = GenerationCache()
+
+    def operation(index):
+        bundle = PostGenerator(
+            OPENAI_KEY, "вдохновляющий", f"Тема с картинкой {index}", cache=cache
+        ).generate_bundle(with_image=True, image_generator=ImageGenerator(OPENAI_KEY))
+        publisher = VKPublisher(VK_KEY, GROUP_ID, api_url=env.vk_api_url)
+        response = publisher.publish_post(
+            bundle["post_content"], bundle["image_url"], guid=f"bench-{index}"
+        )
+        if "response" not in response:
+            raise RuntimeError(response)
+
+    return operation
+
+
+def scenario_stats_page(env):
+    """
+    Страница статистики из локального хранилища (после первой синхронизации).
+    """
+    client = env.client()
+    client.post("/smm/vk-stats/sync")
+    clients = threading.local()
+
+    def operation(index):
+        if not hasattr(clients, "client"):
+            clients.client = env.client()
+        response = clients.client.get(f"/smm/vk-stats?page={index % 5 + 1}")
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+
+    return operation
+
+
+def scenario_dashboard(env):
+    """
+    Дэшборд (сводка по группам из VK) с повторной проверкой по ETag,
+    как при постоянном обновлении открытой страницы.
+    """
+    clients = threading.local()
+
+    def operation(index):
+        if not hasattr(clients, "client"):
+            clients.client = env.client()
+            clients.etag = None
+        headers = {"If-None-Match": clients.etag} if clients.etag else {}
+        response = clients.client.get("/smm/dashboard", headers=headers)
+        if response.status_code not in (200, 304):
+            raise RuntimeError(response.status_code)
+        clients.etag = response.headers.get("ETag", clients.etag)
+
+    return operation
+
+
+def scenario_bulk(env):
+    """
+    Пакетная генерация контент-плана (BulkGenerator) по bulk_rows строк.
+    """
+    from generators.bulk import BulkGenerator
+
+    generator = BulkGenerator(OPENAI_KEY, max_concurrency=env.args.bulk_concurrency)
+
+    def operation(index):
+        rows = [
+            {
+                "topic": f"План {index} пост {row}",
+                "tone": "деловой",
+                "generate_image": row % 4 == 0,
+            }
+            for row in range(env.args.bulk_rows)
+        ]
+        results = generator.run(rows, force=True)
+        failed = [result["error"] for result in results if result["error"]]
+        if failed:
+            raise RuntimeError(failed[0])
+
+    return operation
+
+
+def scenario_asgi_post(env):
+    """
+    Генерация поста через ASGI-приложение (app.asgi): маршрут ставит задачу
+    в очередь (в бенчмарке она выполняется сразу), а запросы принимает
+    один цикл событий.
+    """
+    import httpx
+
+    from app.asgi import create_asgi_app
+    from core.clients import aclose_loop_clients
+
+    application = create_asgi_app(env.app)
+    serializer = env.app.session_interface.get_signing_serializer(env.app)
+    cookies = {env.app.config["SESSION_COOKIE_NAME"]: serializer.dumps({"user_id": 1})}
+    clients = {}
+
+    async def operation(index):
+        # Клиент создается внутри цикла событий measure_async().
+        if "client" not in clients:
+            clients["client"] = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=application),
+                base_url="http://bench",
+                cookies=cookies,
+                timeout=None,
+            )
+        response = await clients["client"].post(
+            "/smm/post-generator",
+            data={"tone": "дружелюбный", "topic": f"Асинхронная тема {index}"},
+            headers={"Accept": "application/json"},
+        )
+        job = response.json()
+        if response.status_code != 202 or job["status"] != "done":
+            raise RuntimeError(job["error"])
+
+    async def aclose():
+        if "client" in clients:
+            await clients.pop("client").aclose()
+        await aclose_loop_clients()
+
+    operation.aclose = aclose
+    return operation
+
+
+def scenario_asgi_stream(env):
+    """
+    Потоковая генерация поста (Server-Sent Events) через ASGI-приложение:
+    фрагменты приходят от AsyncOpenAI, и поток на запрос не занимается.
+    force_regenerate обходит кэш генераций, чтобы каждый запрос шел в OpenAI.
+    """
+    import httpx
+
+    from app.asgi import create_asgi_app
+    from core.clients import aclose_loop_clients
+
+    application = create_asgi_app(env.app)
+    serializer = env.app.session_interface.get_signing_serializer(env.app)
+    cookies = {env.app.config["SESSION_COOKIE_NAME"]: serializer.dumps({"user_id": 1})}
+    clients = {}
+
+    async def operation(index):
+        if "client" not in clients:
+            clients["client"] = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=application),
+                base_url="http://bench",
+                cookies=cookies,
+                timeout=None,
+            )
+        response = await clients["client"].get(
+            "/smm/post-generator/stream",
+            params={
+                "tone": "дружелюбный",
+                "topic": f"Потоковая тема {index}",
+                "force_regenerate": "1",
+            },
+            headers={"Accept": "text/event-stream"},
+        )
+        if response.status_code != 200 or "event: done" not in response.text:
+            raise RuntimeError(response.text[-200:])
+
+    async def aclose():
+        if "client" in clients:
+            await clients.pop("client").aclose()
+        await aclose_loop_clients()
+
+    operation.aclose = aclose
+    return operation
+
+
+def scenario_carousel_serial(env):
+    """
+    Пост-карусель из carousel_images изображений по одному: генерация
+    (n=1) и загрузка в VK каждого изображения последовательно (базовая линия).
+    """
+    from core.vk_execute import vk_request
+    from generators.image_gen import ImageGenerator
+    from social_publishers.vk_publisher import VKPublisher
+
+    def operation(index):
+        generator = ImageGenerator(OPENAI_KEY)
+        publisher = VKPublisher(VK_KEY, GROUP_ID, api_url=env.vk_api_url)
+        attachments = []
+        for number in range(env.args.carousel_images):
+            url = generator.generate_image(f"Карусель {index} кадр {number}")
+            attachments.extend(publisher.upload_photos([url], concurrency=1))
+        response = vk_request(
+            publisher.session,
+            f"{env.vk_api_url}/wall.post",
+            {
+                "access_token": VK_KEY,
+                "from_group": 1,
+                "v": "5.236",
+                "owner_id": f"-{GROUP_ID}",
+                "message": f"Карусель {index}",
+                "attachments": ",".join(attachments),
+                "guid": f"bench-serial-{index}",
+            },
+            http_method="post",
+        )
+        if "response" not in response:
+            raise RuntimeError(response)
+
+    return operation
+
+
+def scenario_carousel(env):
+    """
+    Тот же пост-карусель конвейером: все изображения одним запросом (n > 1),
+    загрузка каждого в VK стартует по готовности
+    (app.publishing.apublish_carousel).
+    """
+    from app.publishing import apublish_carousel, get_dispatcher
+    from core.clients import run_async
+    from generators.image_gen import ImageGenerator
+    from social_publishers.vk_publisher import VKPublisher
+
+    dispatcher = get_dispatcher(env.app.config)
+
+    def operation(index):
+        results, image_urls = run_async(
+            apublish_carousel(
+                dispatcher,
+                {"vk": VKPublisher(VK_KEY, GROUP_ID, api_url=env.vk_api_url)},
+                f"Карусель {index}",
+                ImageGenerator(OPENAI_KEY),
+                f"Карусель {index}",
+                env.args.carousel_images,
+                guid=f"bench-carousel-{index}",
+            )
+        )
+        if results["vk"]["status"] != "published":
+            raise RuntimeError(results["vk"]["error"])
+        if len(image_urls) != env.args.carousel_images:
+            raise RuntimeError(f"{len(image_urls)} images generated")
+
+    return operation
+
+
+def scenario_fanout(env):
+    """
+    Публикация одного поста с изображением в VK и Telegram одновременно
+    (social_publishers.dispatcher.FanOutDispatcher).
+    """
+    from app.publishing import get_dispatcher
+    from generators.image_gen import ImageGenerator
+    from social_publishers.telegram_publisher import TelegramPublisher
+    from social_publishers.vk_publisher import VKPublisher
+
+    dispatcher = get_dispatcher(env.app.config)
+    image_url = ImageGenerator(OPENAI_KEY).generate_image("Кросспост")
+
+    def operation(index):
+        results = dispatcher.publish(
+            {
+                "vk": VKPublisher(VK_KEY, GROUP_ID, api_url=env.vk_api_url),
+                "telegram": TelegramPublisher(
+                    TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, api_url=env.telegram_api_url
+                ),
+            },
+            f"Кросспост {index}",
+            images=[image_url],
+            guid=f"bench-fanout-{index}",
+        )
+        failed = {
+            name: result["error"]
+            for name, result in results.items()
+            if result["status"] != "published"
+        }
+        if failed:
+            raise RuntimeError(failed)
+
+    return operation
+
+
+def scenario_fanout_degraded(env):
+    """
+    Тот же кросспост, когда Telegram отвечает дольше таймаута публикации:
+    VK публикуется за свое обычное время, Telegram завершается таймаутом.
+    """
+    from generators.image_gen import ImageGenerator
+    from social_publishers.dispatcher import FanOutDispatcher
+    from social_publishers.telegram_publisher import TelegramPublisher
+    from social_publishers.vk_publisher import VKPublisher
+
+    dispatcher = FanOutDispatcher(timeout=env.args.publish_timeout)
+    image_url = ImageGenerator(OPENAI_KEY).generate_image("Кросспост")
+
+    def operation(index):
+        results = dispatcher.publish(
+            {
+                "vk": VKPublisher(VK_KEY, GROUP_ID, api_url=env.vk_api_url),
+                "telegram": TelegramPublisher(
+                    TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, api_url=env.slow_telegram.url
+                ),
+            },
+            f"Кросспост {index}",
+            images=[image_url],
+            guid=f"bench-degraded-{index}",
+        )
+        if results["vk"]["status"] != "published":
+            raise RuntimeError(results["vk"]["error"])
+        if results["telegram"]["status"] != "failed":
+            raise RuntimeError("slow target did not time out")
+        if results["vk"]["duration_s"] >= env.args.publish_timeout:
+            raise RuntimeError("VK was delayed by the slow target")
+
+    return operation
+
+
+SCENARIOS = {
+    "single_post": scenario_single_post,
+    "post_image_publish": scenario_post_image_publish,
+    "stats_page": scenario_stats_page,
+    "dashboard": scenario_dashboard,
+    "bulk": scenario_bulk,
+    "asgi_post": scenario_asgi_post,
+    "asgi_stream": scenario_asgi_stream,
+    "carousel_serial": scenario_carousel_serial,
+    "carousel": scenario_carousel,
+    "fanout": scenario_fanout,
+    "fanout_degraded": scenario_fanout_degraded,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Печатает изменение пропускной способности и p95 относительно прошлого запуска.
+    """
+    print(f"\nCompared with {baseline['meta'].get('revision')}:")
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        throughput = _change(previous["throughput_per_s"], current["throughput_per_s"])
+        p95 = _change(previous["latency_s"]["p95"], current["latency_s"]["p95"])
+        print(f"  {name:<20} throughput {throughput:>8}   p95 {p95:>8}")
+
+
+def _change(old, new):
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument("--iterations", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--bulk-rows", type=int, default=20)
+    parser.add_argument("--bulk-concurrency", type=int, default=4)
+    parser.add_argument("--carousel-images", type=int, default=10)
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    parser.add_argument("--vk-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--slow-latency",
+        type=float,
+        default=3.0,
+        help="latency of the slow Telegram server in fanout_degraded",
+    )
+    parser.add_argument(
+        "--publish-timeout",
+        type=float,
+        default=1.0,
+        help="timeout of one publishing attempt in fanout_degraded",
+    )
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--server-rate-limit",
+        type=float,
+        default=None,
+        help="requests per second the fake servers accept before rate limiting",
+    )
+    parser.add_argument(
+        "--async-concurrency",
+        type=int,
+        default=200,
+        help="concurrent requests in async scenarios (one event loop)",
+    )
+    parser.add_argument(
+        "--client-pool-size",
+        type=int,
+        default=20,
+        help="HTTP connections per API client (CLIENT_POOL_SIZE)",
+    )
+    parser.add_argument("--openai-rps", type=float, default=1000)
+    parser.add_argument("--vk-rps", type=float, default=1000)
+    parser.add_argument("--telegram-rps", type=float, default=1000)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="previous results JSON to compare with")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": vars(args),
+        },
+        "scenarios": {},
+    }
+
+    with Environment(args) as env:
+        for name in args.scenarios:
+            operation = SCENARIOS[name](env)
+            iterations = args.iterations
+            if name == "bulk":
+                # Один прогон bulk — это bulk_rows генераций.
+                iterations = max(1, args.iterations // args.bulk_rows)
+            if inspect.iscoroutinefunction(operation):
+                concurrency = args.async_concurrency
+                iterations = max(iterations, concurrency)
+                run = measure_async
+            else:
+                concurrency = args.concurrency
+                run = measure
+            print(f"Running {name} ({iterations} x {concurrency})...", flush=True)
+            result = run(operation, iterations, concurrency)
+            results["scenarios"][name] = result
+            print(
+                f"  {result['throughput_per_s']}/s  "
+                f"p50={result['latency_s']['p50']}s  "
+                f"p95={result['latency_s']['p95']}s  "
+                f"p99={result['latency_s']['p99']}s  "
+                f"errors={result['errors']}  "
+                f"peak={result['memory']['python_peak_bytes'] // 1024} KiB"
+            )
+        results["servers"] = {
+            "openai": env.openai.stats(),
+            "vk": env.vk.stats(),
+            "telegram": env.telegram.stats(),
+        }
+        from generators.prompts import usage_report
+
+        results["token_usage"] = usage_report()
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
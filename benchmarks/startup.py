@@ -0,0 +1,177 @@
+"""
+Бенчмарк холодного старта процесса приложения.
+
+Каждый замер запускается в новом интерпретаторе, как воркер веб-сервера
+при масштабировании: импорт пакета app, create_app() и первый запрос.
+Для каждого этапа выводятся медиана и p95, а также пиковая память
+и тяжелые модули, загруженные к моменту готовности:
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --output new.json --compare startup.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import git_revision, percentile
+
+# Модули, которые не нужны процессу до первого обращения к внешним API.
+HEAVY_MODULES = [
+    "openai",
+    "httpx",
+    "requests",
+    "numpy",
+    "generators.text_gen",
+    "generators.image_gen",
+    "social_publishers.vk_publisher",
+    "social_stats.vk_stats",
+]
+
+STAGES = ["interpreter_s", "import_s", "create_app_s", "first_request_s", "total_s"]
+
+# Выполняется в дочернем процессе; результат печатается одной строкой JSON.
+CHILD = """
+import json, resource, sys, time
+started_at = time.perf_counter()
+from app import create_app
+imported_at = time.perf_counter()
+app = create_app({"SCHEDULER_ENABLED": False, "JOBS_BACKEND": "external"})
+created_at = time.perf_counter()
+response = app.test_client().get("/auth/login")
+assert response.status_code == 200, response.status_code
+served_at = time.perf_counter()
+print(json.dumps({
+    "import_s": imported_at - started_at,
+    "create_app_s": created_at - imported_at,
+    "first_request_s": served_at - created_at,
+    "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    "modules": len(sys.modules),
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def prepare_database(workdir):
+    """
+    Создает схему базы один раз, как flask db upgrade при деплое.
+
+    :return: URL базы данных
+    """
+    database_url = "sqlite:///" + os.path.join(workdir, "startup.db")
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from app import create_app; "
+            f"create_app({{'SQLALCHEMY_DATABASE_URI': {database_url!r}, "
+            "'SCHEDULER_ENABLED': False, 'JOBS_BACKEND': 'external', "
+            "'DB_AUTO_MIGRATE': True})",
+        ],
+        check=True,
+    )
+    return database_url
+
+
+def cold_start(env):
+    """
+    :return: Словарь с длительностями этапов одного запуска
+    """
+    started_at = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = time.perf_counter() - started_at
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["total_s"] = total
+    # Запуск и завершение интерпретатора (включая выгрузку модулей).
+    result["interpreter_s"] = total - (
+        result["import_s"] + result["create_app_s"] + result["first_request_s"]
+    )
+    return result
+
+
+def summarize(runs):
+    summary = {
+        stage: {
+            "p50": round(percentile([run[stage] for run in runs], 0.5), 4),
+            "p95": round(percentile([run[stage] for run in runs], 0.95), 4),
+        }
+        for stage in STAGES
+    }
+    summary["max_rss_bytes"] = max(run["max_rss_bytes"] for run in runs)
+    summary["modules"] = runs[-1]["modules"]
+    summary["heavy_modules"] = runs[-1]["heavy_modules"]
+    return summary
+
+
+def compare(summary, baseline):
+    print(f"\nCompared with {baseline['meta'].get('revision')}:")
+    for stage in STAGES:
+        old = baseline["summary"][stage]["p50"]
+        new = summary[stage]["p50"]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {stage:<16} p50 {old:.4f}s -> {new:.4f}s  {change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default="startup_results.json")
+    parser.add_argument("--compare", help="previous results JSON to compare with")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="smm-startup-") as workdir:
+        env = dict(os.environ, DATABASE_URL=prepare_database(workdir))
+        # Прогрев: байт-код и файловый кэш ОС не должны попадать в замеры.
+        cold_start(env)
+        runs = []
+        for index in range(args.runs):
+            runs.append(cold_start(env))
+            print(
+                f"  run {index + 1:>2}: total={runs[-1]['total_s']:.3f}s  "
+                f"import={runs[-1]['import_s']:.3f}s",
+                flush=True,
+            )
+
+    summary = summarize(runs)
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "settings": vars(args),
+        },
+        "summary": summary,
+        "runs": runs,
+    }
+    for stage in STAGES:
+        print(
+            f"{stage:<16} p50={summary[stage]['p50']:.4f}s  "
+            f"p95={summary[stage]['p95']:.4f}s"
+        )
+    print(
+        f"max RSS {summary['max_rss_bytes'] // 1024} KiB, "
+        f"{summary['modules']} modules, heavy: {summary['heavy_modules'] or 'none'}"
+    )
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(summary, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
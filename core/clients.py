@@ -0,0 +1,239 @@
+import asyncio
+import threading
+import weakref
+
+from core import metrics
+
+# Реестр клиентов внешних API, общий для всего процесса.
+#
+# Клиенты OpenAI, HTTP-сессия для VK и общий асинхронный HTTP-клиент
+# создаются один раз и переиспользуются генераторами, публикаторами и
+# статистикой, поэтому TCP+TLS соединения остаются "теплыми" (keep-alive)
+# между запросами.
+#
+# SDK OpenAI, httpx и requests импортируются при создании первого клиента,
+# а не при импорте модуля: процесс (веб-воркер, worker.py) стартует без
+# загрузки тяжелых библиотек, которые нужны только при обращении к API.
+
+DEFAULT_SETTINGS = {
+    "pool_size": 20,  # максимум одновременных соединений на клиента
+    "keepalive": 10,  # сколько простаивающих соединений держать открытыми
+    "connect_timeout": 5.0,
+    "read_timeout": 60.0,
+    "max_retries": 2,  # повторы соединения для VK; OpenAI повторяет core.ratelimit
+}
+
+_settings = dict(DEFAULT_SETTINGS)
+_lock = threading.Lock()
+_openai_clients = {}
+_async_openai_clients = weakref.WeakKeyDictionary()
+_async_http_clients = weakref.WeakKeyDictionary()
+_vk_session = None
+_loop = None
+_loop_thread = None
+
+
+def configure(**settings):
+    """
+    Меняет настройки пулов соединений и сбрасывает уже созданные клиенты.
+
+    :param settings: pool_size, keepalive, connect_timeout, read_timeout, max_retries
+    :raises ValueError: Если передан неизвестный параметр
+    """
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown client settings: {', '.join(sorted(unknown))}")
+
+    with _lock:
+        _settings.update(settings)
+    close_all()
+
+
+def get_timeout():
+    """
+    :return: Таймаут (connect, read) для вызовов requests
+    """
+    return (_settings["connect_timeout"], _settings["read_timeout"])
+
+
+def _httpx_options():
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=_settings["pool_size"],
+            max_keepalive_connections=_settings["keepalive"],
+        ),
+        "timeout": httpx.Timeout(
+            _settings["read_timeout"], connect=_settings["connect_timeout"]
+        ),
+    }
+
+
+def get_openai_client(api_key):
+    """
+    Возвращает общий синхронный клиент OpenAI для указанного ключа.
+
+    :param api_key: API-ключ OpenAI
+    :return: Экземпляр OpenAI с пулом соединений
+    """
+    with _lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+
+            client = OpenAI(
+                api_key=api_key,
+                # Повторы (в том числе по 429) выполняет core.ratelimit,
+                # чтобы Retry-After учитывался общим для процессов лимитом.
+                max_retries=0,
+                http_client=httpx.Client(**_httpx_options()),
+            )
+            _openai_clients[api_key] = client
+        return client
+
+
+def get_async_openai_client(api_key):
+    """
+    Возвращает общий асинхронный клиент OpenAI для указанного ключа.
+
+    Асинхронные соединения привязаны к event loop, поэтому клиенты
+    хранятся отдельно для каждого запущенного цикла событий.
+
+    :param api_key: API-ключ OpenAI
+    :return: Экземпляр AsyncOpenAI с пулом соединений
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_openai_clients.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(
+                api_key=api_key,
+                # Повторы (в том числе по 429) выполняет core.ratelimit,
+                # чтобы Retry-After учитывался общим для процессов лимитом.
+                max_retries=0,
+                http_client=httpx.AsyncClient(**_httpx_options()),
+            )
+            clients[api_key] = client
+        return client
+
+
+def get_vk_session():
+    """
+    Возвращает общую HTTP-сессию для VK API и серверов загрузки VK.
+
+    :return: requests.Session с пулом keep-alive соединений
+    """
+    global _vk_session
+    with _lock:
+        if _vk_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            adapter = HTTPAdapter(
+                pool_connections=_settings["keepalive"],
+                pool_maxsize=_settings["pool_size"],
+                max_retries=_settings["max_retries"],
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _vk_session = session
+        return _vk_session
+
+
+def get_async_http_client():
+    """
+    Возвращает общий асинхронный HTTP-клиент для REST API соцсетей
+    (VK API и серверы загрузки VK, Telegram Bot API).
+
+    Как и асинхронные клиенты OpenAI, клиент создается отдельно для каждого
+    запущенного цикла событий.
+
+    :return: httpx.AsyncClient с пулом keep-alive соединений
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_http_clients.get(loop)
+        if client is None:
+            import httpx
+
+            options = _httpx_options()
+            client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(
+                    limits=options.pop("limits"), retries=_settings["max_retries"]
+                ),
+                **options,
+            )
+            _async_http_clients[loop] = client
+        return client
+
+
+def get_async_vk_client():
+    """
+    Возвращает асинхронный HTTP-клиент для VK API и серверов загрузки VK
+    (общий клиент get_async_http_client()).
+
+    :return: httpx.AsyncClient с пулом keep-alive соединений
+    """
+    return get_async_http_client()
+
+
+async def aclose_loop_clients():
+    """
+    Закрывает асинхронные клиенты, созданные в текущем цикле событий
+    (например, при остановке ASGI-сервера).
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        openai_clients = _async_openai_clients.pop(loop, {})
+        http_client = _async_http_clients.pop(loop, None)
+    for client in openai_clients.values():
+        await client.close()
+    if http_client is not None:
+        await http_client.aclose()
+
+
+def run_async(coro):
+    """
+    Выполняет корутину в общем фоновом event loop и ждет результата.
+
+    Синхронный код (Flask-маршруты, воркеры очереди) вызывает асинхронные
+    методы через эту функцию, и асинхронные клиенты OpenAI живут в одном
+    цикле событий, сохраняя пул соединений между вызовами.
+
+    :param coro: Корутина
+    :return: Результат корутины
+    """
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(
+                target=_loop.run_forever, name="clients-event-loop", daemon=True
+            )
+            _loop_thread.start()
+        loop = _loop
+    # Трейс текущего запроса продолжается внутри корутины (см. core.metrics).
+    return asyncio.run_coroutine_threadsafe(metrics.bind_trace(coro), loop).result()
+
+
+def close_all():
+    """
+    Закрывает все созданные клиенты и сессии.
+    """
+    global _vk_session
+    with _lock:
+        for client in _openai_clients.values():
+            client.close()
+        _openai_clients.clear()
+        _async_openai_clients.clear()
+        _async_http_clients.clear()
+        if _vk_session is not None:
+            _vk_session.close()
+            _vk_session = None
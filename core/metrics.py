@@ -0,0 +1,400 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Метрики производительности внутри процесса.
+#
+# span() измеряет длительность операции (запрос к OpenAI, вызов VK API,
+# SQL-запрос, рендер шаблона) и пишет ее в гистограмму с квантилями
+# p50/p95/p99. trace() объединяет спаны одного HTTP-запроса или фоновой
+# задачи, чтобы для медленных запросов можно было вывести разбивку по спанам.
+# render() отдает все метрики в текстовом формате Prometheus.
+
+QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_SETTINGS = {
+    "samples": 1024,  # сколько последних значений хранить для квантилей
+    "slow_threshold": None,  # порог медленного запроса в секундах (None — выкл.)
+}
+
+logger = logging.getLogger("smm.metrics")
+
+_settings = dict(DEFAULT_SETTINGS)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Summary:
+    """
+    Наблюдения одной серии: количество, сумма и последние значения для квантилей.
+    """
+
+    def __init__(self, samples):
+        self.count = 0
+        self.sum = 0.0
+        self.values = deque(maxlen=samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.values.append(value)
+
+    def quantiles(self):
+        """
+        :return: Словарь квантиль -> значение по последним наблюдениям
+        """
+        values = sorted(self.values)
+        if not values:
+            return {q: 0.0 for q in QUANTILES}
+        return {
+            q: values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES
+        }
+
+
+class MetricsRegistry:
+    """
+    Реестр счетчиков и гистограмм процесса.
+
+    Серия определяется именем метрики и набором меток.
+    """
+
+    def __init__(self):
+        self._summaries = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        """
+        Добавляет наблюдение в гистограмму.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = Summary(_settings["samples"])
+            summary.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """
+        Увеличивает счетчик.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter_values(self, name):
+        """
+        :return: Список пар (словарь меток, значение) для серий счетчика name
+        """
+        with self._lock:
+            return [
+                (dict(labels), value)
+                for (counter, labels), value in self._counters.items()
+                if counter == name
+            ]
+
+    def describe(self, name, text):
+        """
+        Задает описание метрики (строка # HELP).
+        """
+        self._help[name] = text
+
+    def snapshot(self):
+        """
+        :return: Словарь с counters и summaries (count, sum, квантили) для отчетов
+        """
+        with self._lock:
+            counters = {
+                _series(name, labels): value
+                for (name, labels), value in self._counters.items()
+            }
+            summaries = {
+                _series(name, labels): {
+                    "count": summary.count,
+                    "sum": summary.sum,
+                    **{f"p{int(q * 100)}": v for q, v in summary.quantiles().items()},
+                }
+                for (name, labels), summary in self._summaries.items()
+            }
+        return {"counters": counters, "summaries": summaries}
+
+    def render(self):
+        """
+        :return: Все метрики в текстовом формате Prometheus
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted(
+                (key, summary.count, summary.sum, summary.quantiles())
+                for key, summary in self._summaries.items()
+            )
+
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{_series(name, labels)} {value}")
+
+        for (name, labels), count, total, quantiles in summaries:
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} summary")
+            for q, value in quantiles.items():
+                lines.append(
+                    f"{_series(name, labels + (('quantile', str(q)),))} {value:.6f}"
+                )
+            lines.append(f"{_series(name + '_sum', labels)} {total:.6f}")
+            lines.append(f"{_series(name + '_count', labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
+            self._counters.clear()
+
+
+registry = MetricsRegistry()
+registry.describe("span_duration_seconds", "Duration of instrumented operations")
+registry.describe("trace_duration_seconds", "Duration of HTTP requests and jobs")
+registry.describe("openai_tokens_total", "OpenAI tokens used")
+registry.describe(
+    "openai_completions_total",
+    "OpenAI completions by prompt template and finish reason",
+)
+registry.describe("transfer_bytes_total", "Bytes sent to or received from APIs")
+registry.describe("login_attempts_total", "Login attempts by result")
+
+
+class Trace:
+    """
+    Спаны одного HTTP-запроса или фоновой задачи.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, duration, labels):
+        with self._lock:
+            self.spans.append((name, duration, labels))
+
+    def breakdown(self):
+        """
+        :return: Список (имя спана, количество, суммарное время) по убыванию времени
+        """
+        totals = {}
+        with self._lock:
+            for name, duration, _ in self.spans:
+                count, total = totals.get(name, (0, 0.0))
+                totals[name] = (count + 1, total + duration)
+        return sorted(
+            ((name, count, total) for name, (count, total) in totals.items()),
+            key=lambda item: item[2],
+            reverse=True,
+        )
+
+
+def configure(**settings):
+    """
+    Меняет настройки метрик.
+
+    :param settings: samples, slow_threshold
+    :raises ValueError: Если передан неизвестный параметр
+    """
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown metrics settings: {', '.join(sorted(unknown))}")
+    _settings.update(settings)
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Измеряет длительность блока и записывает ее в span_duration_seconds.
+
+    :param name: Имя операции, например "openai.chat" или "vk.api"
+    :param labels: Дополнительные метки серии (модель, метод API и т. п.)
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started_at, **labels)
+
+
+def record_span(name, duration, **labels):
+    """
+    Записывает уже измеренный спан (для событий с отдельными началом и концом).
+    """
+    registry.observe("span_duration_seconds", duration, span=name, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration, labels)
+
+
+@contextmanager
+def trace(name, **labels):
+    """
+    Собирает спаны блока в один трейс и записывает его длительность.
+
+    Если длительность превышает порог slow_threshold, в лог выводится
+    разбивка по спанам.
+
+    :param name: Имя трейса (эндпоинт или тип задачи)
+    :param labels: Метки серии trace_duration_seconds
+    """
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        finish_trace(current, **labels)
+
+
+def start_trace(name):
+    """
+    Начинает трейс без блока with (для хуков before_request/teardown_request).
+
+    :return: Пара (трейс, токен для end_trace)
+    """
+    current = Trace(name)
+    return current, _current_trace.set(current)
+
+
+def end_trace(current, token, **labels):
+    """
+    Завершает трейс, начатый start_trace().
+    """
+    _current_trace.reset(token)
+    finish_trace(current, **labels)
+
+
+def finish_trace(current, **labels):
+    duration = time.perf_counter() - current.started_at
+    registry.observe("trace_duration_seconds", duration, trace=current.name, **labels)
+    threshold = _settings["slow_threshold"]
+    if threshold is not None and duration >= threshold:
+        parts = ", ".join(
+            f"{name}={total:.3f}s/{count}" for name, count, total in current.breakdown()
+        )
+        logger.warning("Slow %s: %.3fs [%s]", current.name, duration, parts)
+
+
+def bind_trace(coro):
+    """
+    Переносит текущий трейс в корутину, выполняемую в другом потоке
+    (например, в общем event loop из core.clients.run_async).
+    """
+    current = _current_trace.get()
+
+    async def run():
+        token = _current_trace.set(current)
+        try:
+            return await coro
+        finally:
+            _current_trace.reset(token)
+
+    return run()
+
+
+def with_trace(func):
+    """
+    Оборачивает функцию так, чтобы ее спаны попадали в текущий трейс,
+    даже если она выполняется в другом потоке (например, в ThreadPoolExecutor).
+    """
+    current = _current_trace.get()
+
+    def run(*args, **kwargs):
+        token = _current_trace.set(current)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+
+    return run
+
+
+def record_tokens(model, usage, **labels):
+    """
+    Учитывает токены из поля usage ответа OpenAI, в том числе токены
+    промта, взятые из кэша промтов провайдера (type="cached").
+
+    :param labels: Дополнительные метки (например, template — шаблон промта)
+    """
+    if usage is None:
+        return
+    registry.inc(
+        "openai_tokens_total",
+        usage.prompt_tokens or 0,
+        model=model,
+        type="prompt",
+        **labels,
+    )
+    registry.inc(
+        "openai_tokens_total",
+        usage.completion_tokens or 0,
+        model=model,
+        type="completion",
+        **labels,
+    )
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached:
+        registry.inc(
+            "openai_tokens_total", cached, model=model, type="cached", **labels
+        )
+
+
+def record_completion(model, finish_reason, **labels):
+    """
+    Учитывает ответ модели; finish_reason="length" означает, что ответ
+    обрезан лимитом max_tokens.
+    """
+    registry.inc(
+        "openai_completions_total",
+        model=model,
+        finish_reason=finish_reason or "unknown",
+        **labels,
+    )
+
+
+def record_bytes(target, direction, size):
+    """
+    Учитывает объем переданных данных.
+
+    :param target: Внешний сервис (vk, vk_upload, image_download)
+    :param direction: "sent" или "received"
+    :param size: Число байт
+    """
+    registry.inc("transfer_bytes_total", size, target=target, direction=direction)
+
+
+def record_login(result):
+    """
+    Учитывает попытку входа.
+
+    :param result: "ok", "failed" или "throttled" (отклонена без проверки пароля)
+    """
+    registry.inc("login_attempts_total", result=result)
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    rendered = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{name}{{{rendered}}}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
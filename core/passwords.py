@@ -0,0 +1,267 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from core import metrics
+
+# Хэширование паролей (bcrypt) и ограничение попыток входа.
+#
+# Стоимость bcrypt (rounds, log2 числа итераций) задается политикой: хэш
+# с другой стоимостью после успешного входа пересчитывается, поэтому
+# повышение BCRYPT_LOG_ROUNDS постепенно применяется ко всем пользователям.
+#
+# Хэш считается сотни миллисекунд процессорного времени. bcrypt отпускает
+# GIL на время вычисления, поэтому оно выполняется в ограниченном пуле из
+# workers потоков (workers > 0): остальные потоки процесса продолжают
+# обслуживать запросы, а "шторм" входов занимает не больше workers ядер.
+# Пул процессов не используется: fork многопоточного процесса приложения
+# может унаследовать захваченные блокировки, а spawn и forkserver заново
+# выполняли бы __main__ (main.py создает приложение и фоновые потоки).
+#
+# Пул создается при первом хэшировании, поэтому create_app, команды CLI и
+# процессы без входа пользователей (worker.py) его не запускают. Если
+# процесс приложения разветвился (например, gunicorn --preload), пул
+# создается заново: потоки родителя в дочерний процесс не переходят.
+
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+_HASH_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+_settings = {
+    "rounds": DEFAULT_ROUNDS,
+    "workers": 0,
+    "max_attempts": 5,
+    "window": 300.0,
+}
+_hasher = None
+_throttle = None
+_lock = threading.Lock()
+
+
+def hash_password(password, rounds=DEFAULT_ROUNDS):
+    """
+    :param password: Пароль
+    :param rounds: Стоимость bcrypt
+    :return: Хэш пароля (строка вида $2b$12$...)
+    """
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode(
+        "ascii"
+    )
+
+
+def check_password(password_hash, password, rounds=None):
+    """
+    Проверяет пароль и при необходимости пересчитывает хэш по политике.
+
+    :param password_hash: Сохраненный хэш
+    :param password: Введенный пароль
+    :param rounds: Стоимость по политике или None, чтобы не пересчитывать
+    :return: Пара (пароль верный, новый хэш или None)
+    """
+    try:
+        valid = bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("ascii"))
+    except ValueError:
+        # Не хэш bcrypt (например, пароль-заглушка).
+        return False, None
+    if valid and rounds is not None and hash_rounds(password_hash) != rounds:
+        return True, hash_password(password, rounds)
+    return valid, None
+
+
+def hash_rounds(password_hash):
+    """
+    :param password_hash: Хэш bcrypt
+    :return: Стоимость, с которой он посчитан, или None
+    """
+    match = _HASH_RE.match(password_hash or "")
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """
+    Хэширование и проверка паролей по политике стоимости в пуле потоков.
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=0):
+        """
+        :param rounds: Стоимость bcrypt для новых хэшей
+        :param workers: Размер пула потоков; 0 — считать в вызывающем потоке
+        :raises ValueError: Если стоимость вне допустимого диапазона bcrypt
+        """
+        if not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+            raise ValueError(f"bcrypt rounds must be {MIN_ROUNDS}..{MAX_ROUNDS}")
+        self.rounds = rounds
+        self.workers = workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        """
+        :param password: Пароль
+        :return: Хэш пароля со стоимостью по политике
+        """
+        with metrics.span("password.hash"):
+            return self._call(hash_password, password, self.rounds)
+
+    def verify(self, password_hash, password):
+        """
+        Проверяет пароль; если хэш посчитан с другой стоимостью, в том же
+        вызове считается новый.
+
+        :param password_hash: Сохраненный хэш
+        :param password: Введенный пароль
+        :return: Пара (пароль верный, новый хэш для сохранения или None)
+        """
+        with metrics.span("password.verify"):
+            return self._call(check_password, password_hash, password, self.rounds)
+
+    def close(self):
+        """
+        Останавливает пул потоков.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            owned = self._pid == os.getpid()
+        if pool is not None and owned:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _call(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        return self._get_pool().submit(func, *args).result()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # Пул родительского процесса после fork непригоден.
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+
+class LoginThrottle:
+    """
+    Ограничение неудачных попыток входа по имени пользователя.
+
+    После max_attempts неудачных попыток за window секунд вход под этим
+    именем отклоняется без проверки пароля, пока самая старая попытка
+    не выйдет из окна. Подбор пароля и "шторм" повторных входов не тратят
+    процессорное время на хэширование. Счетчики хранятся в памяти процесса.
+    """
+
+    def __init__(self, max_attempts=5, window=300.0, max_entries=100000):
+        """
+        :param max_attempts: Неудачных попыток за окно; 0 — без ограничения
+        :param window: Длина окна в секундах
+        :param max_entries: Максимум отслеживаемых имен (LRU-вытеснение)
+        """
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_entries = max_entries
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def retry_after(self, username):
+        """
+        :param username: Имя пользователя
+        :return: Сколько секунд ждать до следующей попытки (0 — можно сейчас)
+        """
+        if not self.max_attempts:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            failures = self._failures.get(_throttle_key(username))
+            if failures is None:
+                return 0
+            while failures and now - failures[0] >= self.window:
+                failures.popleft()
+            if len(failures) < self.max_attempts:
+                return 0
+            return self.window - (now - failures[0])
+
+    def failure(self, username):
+        """
+        Учитывает неудачную попытку входа.
+        """
+        if not self.max_attempts:
+            return
+        key = _throttle_key(username)
+        with self._lock:
+            failures = self._failures.get(key)
+            if failures is None:
+                failures = self._failures[key] = deque(maxlen=self.max_attempts)
+                while len(self._failures) > self.max_entries:
+                    self._failures.popitem(last=False)
+            else:
+                self._failures.move_to_end(key)
+            failures.append(time.monotonic())
+
+    def reset(self, username):
+        """
+        Сбрасывает счетчик после успешного входа.
+        """
+        with self._lock:
+            self._failures.pop(_throttle_key(username), None)
+
+
+def _throttle_key(username):
+    return (username or "").strip().lower()
+
+
+def configure_passwords(rounds=DEFAULT_ROUNDS, workers=0, max_attempts=5, window=300):
+    """
+    Задает политику хэширования и ограничение попыток входа. Пул потоков
+    создается при первом хэшировании.
+
+    :param rounds: Стоимость bcrypt для новых хэшей
+    :param workers: Размер пула потоков хэширования; 0 — без пула
+    :param max_attempts: Неудачных попыток входа за окно на имя пользователя
+    :param window: Окно попыток в секундах
+    """
+    global _hasher, _throttle
+    hasher = PasswordHasher(rounds=rounds, workers=workers)
+    with _lock:
+        previous = _hasher
+        _settings.update(
+            rounds=rounds, workers=workers, max_attempts=max_attempts, window=window
+        )
+        _hasher = hasher
+        _throttle = LoginThrottle(max_attempts=max_attempts, window=window)
+    if previous is not None:
+        previous.close()
+
+
+def get_password_hasher():
+    """
+    :return: Общий PasswordHasher процесса
+    """
+    global _hasher
+    with _lock:
+        if _hasher is None:
+            _hasher = PasswordHasher(
+                rounds=_settings["rounds"], workers=_settings["workers"]
+            )
+        return _hasher
+
+
+def get_login_throttle():
+    """
+    :return: Общий LoginThrottle процесса
+    """
+    global _throttle
+    with _lock:
+        if _throttle is None:
+            _throttle = LoginThrottle(
+                max_attempts=_settings["max_attempts"], window=_settings["window"]
+            )
+        return _throttle
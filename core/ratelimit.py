@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import sqlite3
+import sys
+import threading
+import time
+
+from core import metrics
+
+# Общие ограничители частоты запросов к внешним API.
+#
+# Бакеты ведутся по ключу: для OpenAI — API-ключ и модель, для VK — токен
+# доступа, для Telegram — токен бота и чат. Если задан db_path, состояние
+# бакетов хранится в SQLite, и все процессы (веб-сервер, worker.py)
+# расходуют один и тот же лимит.
+
+DEFAULT_LIMITS = {
+    "openai": 3.0,  # запросов в секунду на ключ и модель
+    "vk": 3.0,  # запросов в секунду на токен (лимит VK для пользовательских ключей)
+    "telegram": 1.0,  # сообщений в секунду на чат (лимит Bot API для группы)
+}
+
+_settings = {
+    "db_path": None,
+    "max_retries": 5,
+    "backoff_base": 1.0,
+    "rates": dict(DEFAULT_LIMITS),
+}
+_limiters = {}
+_lock = threading.Lock()
+
+
+class TokenBucketLimiter:
+    """
+    Токен-бакет с очередью ожидания (алгоритм GCRA).
+
+    Для каждого ключа хранится одно число — "теоретическое время прибытия"
+    следующего запроса. reserve() атомарно резервирует место в очереди и
+    возвращает, сколько нужно подождать, поэтому конкурирующие вызовы
+    выстраиваются друг за другом, а не опрашивают бакет в цикле.
+
+    При db_path состояние хранится в таблице SQLite и общее для всех
+    процессов; ключи сохраняются в виде хэшей.
+    """
+
+    def __init__(self, rate, burst=None, db_path=None, name="default"):
+        """
+        :param rate: Запросов в секунду
+        :param burst: Сколько запросов можно выполнить подряд без ожидания
+        :param db_path: Путь к файлу SQLite для общего состояния или None
+        :param name: Имя ограничителя (разделяет бакеты в общей таблице)
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.name = name
+        self._state = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(
+                db_path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, tat REAL NOT NULL, "
+                "PRIMARY KEY (name, key))"
+            )
+
+    def reserve(self, key, tokens=1):
+        """
+        Резервирует tokens запросов для ключа.
+
+        :return: Сколько секунд нужно подождать перед запросом
+        """
+        interval = tokens / self.rate
+        tolerance = self.burst / self.rate
+        return self._update(key, lambda tat, now: max(tat, now) + interval, tolerance)
+
+    def acquire(self, key, tokens=1):
+        """
+        Ждет, пока для ключа не освободится tokens запросов.
+        """
+        wait = self.reserve(key, tokens)
+        if wait > 0:
+            metrics.record_span("ratelimit.wait", wait, limiter=self.name)
+            time.sleep(wait)
+
+    async def aacquire(self, key, tokens=1):
+        """
+        Асинхронная версия acquire().
+
+        Общее состояние в SQLite резервируется в потоке: BEGIN IMMEDIATE
+        может ждать блокировку до 30 секунд и не должен останавливать цикл
+        событий со всеми его корутинами.
+        """
+        if self._db is None:
+            wait = self.reserve(key, tokens)
+        else:
+            wait = await asyncio.to_thread(self.reserve, key, tokens)
+        if wait > 0:
+            metrics.record_span("ratelimit.wait", wait, limiter=self.name)
+            await asyncio.sleep(wait)
+
+    def penalize(self, key, delay):
+        """
+        Запрещает запросы по ключу на delay секунд (например, по Retry-After).
+
+        Повторные штрафы не суммируются: берется самый поздний срок.
+        """
+        tolerance = self.burst / self.rate
+        shift = tolerance - 1 / self.rate
+        self._update(key, lambda tat, now: max(tat, now + delay + shift), tolerance)
+
+    async def apenalize(self, key, delay):
+        """
+        Асинхронная версия penalize() (см. aacquire).
+        """
+        if self._db is None:
+            self.penalize(key, delay)
+        else:
+            await asyncio.to_thread(self.penalize, key, delay)
+
+    def _update(self, key, advance, tolerance):
+        key = hashlib.sha256(str(key).encode("utf-8")).hexdigest()
+        with self._lock:
+            now = time.time()
+            if self._db is None:
+                tat = advance(self._state.get(key, now), now)
+                self._state[key] = tat
+                return max(0.0, tat - tolerance - now)
+
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT tat FROM rate_limits WHERE name = ? AND key = ?",
+                    (self.name, key),
+                ).fetchone()
+                tat = advance(row[0] if row else now, now)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO rate_limits (name, key, tat) "
+                    "VALUES (?, ?, ?)",
+                    (self.name, key, tat),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return max(0.0, tat - tolerance - now)
+
+
+def configure_limits(db_path=None, max_retries=5, backoff_base=1.0, **rates):
+    """
+    Задает лимиты и сбрасывает уже созданные ограничители.
+
+    :param db_path: Путь к файлу SQLite для общего между процессами состояния
+    :param max_retries: Сколько раз повторять запрос после ответа "слишком часто"
+    :param backoff_base: Базовая задержка экспоненциального отката в секундах
+    :param rates: Запросов в секунду по имени ограничителя (openai, vk)
+    :raises ValueError: Если передан неизвестный ограничитель
+    """
+    unknown = set(rates) - set(DEFAULT_LIMITS)
+    if unknown:
+        raise ValueError(f"Unknown rate limits: {', '.join(sorted(unknown))}")
+
+    with _lock:
+        _settings.update(
+            db_path=db_path,
+            max_retries=max_retries,
+            backoff_base=backoff_base,
+            rates=dict(DEFAULT_LIMITS, **rates),
+        )
+        _limiters.clear()
+
+
+def get_limiter(name):
+    """
+    :param name: Имя ограничителя (openai, vk, telegram)
+    :return: Общий для процесса TokenBucketLimiter
+    """
+    with _lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rate = _settings["rates"][name]
+            limiter = TokenBucketLimiter(rate, db_path=_settings["db_path"], name=name)
+            _limiters[name] = limiter
+        return limiter
+
+
+def retry_delay(error, attempt):
+    """
+    Определяет, можно ли повторить запрос после ошибки, и через сколько.
+
+    :param error: Исключение
+    :param attempt: Номер попытки, начиная с 0
+    :return: Пара (задержка в секундах, ошибка лимита) или None, если
+        повторять не нужно
+    """
+    backoff = _settings["backoff_base"] * 2**attempt
+    # SDK OpenAI загружается лениво (см. core.clients): пока он не
+    # импортирован, ошибка не может быть ошибкой OpenAI.
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, openai.RateLimitError):
+        if error.code == "insufficient_quota":
+            # Исчерпан баланс или месячная квота: повтор не поможет.
+            return None
+        return parse_retry_after(error.response.headers) or backoff, True
+    if getattr(error, "rate_limited", False):
+        return getattr(error, "retry_after", None) or backoff, True
+    if openai is not None and isinstance(
+        error, (openai.APIConnectionError, openai.InternalServerError)
+    ):
+        return backoff, False
+    return None
+
+
+def call_limited(name, key, func, tokens=1):
+    """
+    Вызывает func() с учетом лимита и повторяет при ошибке "слишком часто".
+
+    Перед каждым вызовом занимается место в бакете. Ответ 429 (Retry-After)
+    или ошибка VK с кодом 6 блокирует ключ для всех процессов на время
+    отката; временные сетевые ошибки повторяются с экспоненциальной задержкой.
+
+    :param name: Имя ограничителя (openai, vk, telegram)
+    :param key: Ключ бакета
+    :param func: Функция без аргументов, выполняющая запрос
+    :param tokens: Сколько запросов расходует вызов
+    :return: Результат func()
+    """
+    limiter = get_limiter(name)
+    attempt = 0
+    while True:
+        limiter.acquire(key, tokens)
+        try:
+            return func()
+        except Exception as e:
+            retry = retry_delay(e, attempt)
+            if retry is None or attempt >= _settings["max_retries"]:
+                raise
+            delay, rate_limited = retry
+            if rate_limited:
+                limiter.penalize(key, delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+
+async def acall_limited(name, key, func, tokens=1):
+    """
+    Асинхронная версия call_limited(); func() возвращает корутину.
+    """
+    limiter = get_limiter(name)
+    attempt = 0
+    while True:
+        await limiter.aacquire(key, tokens)
+        try:
+            return await func()
+        except Exception as e:
+            retry = retry_delay(e, attempt)
+            if retry is None or attempt >= _settings["max_retries"]:
+                raise
+            delay, rate_limited = retry
+            if rate_limited:
+                await limiter.apenalize(key, delay)
+            else:
+                await asyncio.sleep(delay)
+            attempt += 1
+
+
+def parse_retry_after(headers):
+    """
+    :param headers: Заголовки HTTP-ответа
+    :return: Задержка в секундах из retry-after-ms / Retry-After или None
+    """
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
@@ -0,0 +1,202 @@
+import json
+from concurrent.futures import Future
+
+from core import metrics
+from core.clients import get_timeout, get_vk_session
+from core.ratelimit import acall_limited, call_limited, parse_retry_after
+
+VK_API_URL = "https://api.vk.com/method"
+VK_API_VERSION = "5.236"
+MAX_CALLS_PER_EXECUTE = 25
+# 6 — слишком много запросов в секунду; такие вызовы повторяются после паузы.
+RATE_LIMIT_ERROR_CODES = {6}
+
+
+class VKAPIError(Exception):
+    """
+    Ошибка, которую вернул VK API.
+
+    Атрибуты:
+        code (int): Код ошибки VK (error_code).
+        retry_after (float): Задержка из заголовка Retry-After или None.
+    """
+
+    def __init__(self, error, retry_after=None):
+        super().__init__(error.get("error_msg", "VK API error"))
+        self.code = error.get("error_code")
+        self.retry_after = retry_after
+
+    @property
+    def rate_limited(self):
+        return self.code in RATE_LIMIT_ERROR_CODES
+
+
+def vk_request(session, url, params, http_method="get"):
+    """
+    Выполняет запрос к методу VK API с учетом лимита частоты для токена.
+
+    Запрос ждет своей очереди в общем бакете токена (core.ratelimit),
+    а при ошибке "слишком много запросов" (код 6 или HTTP 429) повторяется
+    после паузы, вместо того чтобы сразу завершиться ошибкой.
+
+    :param session: requests.Session
+    :param url: Полный URL метода, например ".../wall.get"
+    :param params: Параметры запроса, включая access_token
+    :param http_method: "get" (параметры в URL) или "post" (в теле запроса)
+    :return: Полный JSON-ответ
+    :raises VKAPIError: Если VK API возвращает ошибку
+    """
+
+    def send():
+        with metrics.span("vk.api", method=url.rsplit("/", 1)[-1]):
+            if http_method == "post":
+                response = session.post(url, data=params, timeout=get_timeout())
+            else:
+                response = session.get(url, params=params, timeout=get_timeout())
+        return _parse_response(response)
+
+    return call_limited("vk", params.get("access_token"), send)
+
+
+async def avk_request(client, url, params, http_method="get"):
+    """
+    Асинхронная версия vk_request().
+
+    :param client: httpx.AsyncClient (см. core.clients.get_async_vk_client)
+    :return: Полный JSON-ответ
+    :raises VKAPIError: Если VK API возвращает ошибку
+    """
+
+    async def send():
+        with metrics.span("vk.api", method=url.rsplit("/", 1)[-1]):
+            if http_method == "post":
+                response = await client.post(url, data=params)
+            else:
+                response = await client.get(url, params=params)
+        return _parse_response(response)
+
+    return await acall_limited("vk", params.get("access_token"), send)
+
+
+def _parse_response(response):
+    # Ответ requests или httpx: у обоих есть status_code, headers, content и json().
+    metrics.record_bytes("vk", "received", len(response.content))
+    if response.status_code == 429:
+        raise VKAPIError(
+            {"error_code": 6, "error_msg": "Too many requests"},
+            retry_after=parse_retry_after(response.headers),
+        )
+    body = response.json()
+    if "error" in body:
+        raise VKAPIError(body["error"])
+    return body
+
+
+class VKExecuteBatch:
+    """
+    Пакетный вызов методов VK API через метод execute.
+
+    Вызовы, добавленные через add(), накапливаются и при flush()
+    объединяются в скрипты VKScript по 25 вызовов (лимит execute).
+    Результат каждого вызова возвращается через свой Future. Если execute
+    целиком завершился ошибкой или отдельный вызов внутри него вернул
+    false, такие вызовы повторяются по одному обычными запросами.
+
+    Все вызовы пакета выполняются с одним ключом доступа.
+    """
+
+    def __init__(self, vk_api_key, api_url=None, session=None):
+        """
+        :param vk_api_key: Ключ доступа к VK API
+        :param api_url: Базовый URL VK API (например, локальный тестовый сервер)
+        :param session: requests.Session; по умолчанию общая сессия VK
+        """
+        self.vk_api_key = vk_api_key
+        self.api_url = api_url or VK_API_URL
+        self.session = session or get_vk_session()
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, method, **params):
+        """
+        Добавляет вызов в пакет.
+
+        :param method: Имя метода VK API, например "wall.get"
+        :param params: Параметры метода (без access_token и v)
+        :return: Future с результатом поля response
+        """
+        future = Future()
+        self._pending.append((method, params, future))
+        return future
+
+    def flush(self):
+        """
+        Выполняет все накопленные вызовы.
+        """
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), MAX_CALLS_PER_EXECUTE):
+            self._execute_chunk(pending[start : start + MAX_CALLS_PER_EXECUTE])
+
+    def call(self, method, **params):
+        """
+        Выполняет один вызов VK API без пакетирования.
+
+        :return: Значение поля response
+        :raises VKAPIError: Если VK API возвращает ошибку
+        """
+        params = dict(params, access_token=self.vk_api_key, v=VK_API_VERSION)
+        response = vk_request(
+            self.session, f"{self.api_url}/{method}", params, http_method="post"
+        )
+        return response["response"]
+
+    def execute(self, code):
+        """
+        Выполняет произвольный скрипт VKScript.
+
+        :param code: Текст скрипта
+        :return: Полный JSON-ответ (response и, возможно, execute_errors)
+        :raises VKAPIError: Если VK API возвращает ошибку
+        """
+        return vk_request(
+            self.session,
+            f"{self.api_url}/execute",
+            {"access_token": self.vk_api_key, "v": VK_API_VERSION, "code": code},
+            http_method="post",
+        )
+
+    def _execute_chunk(self, chunk):
+        if len(chunk) == 1:
+            self._call_single(*chunk[0])
+            return
+
+        calls = ",".join(
+            f"API.{method}({json.dumps(params, ensure_ascii=False)})"
+            for method, params, _ in chunk
+        )
+        try:
+            results = self.execute(f"return [{calls}];")["response"]
+        except Exception:
+            results = None
+        if not isinstance(results, list) or len(results) != len(chunk):
+            results = [False] * len(chunk)
+
+        for (method, params, future), result in zip(chunk, results):
+            if result is False:
+                # Вызов завершился ошибкой внутри execute — повторяем отдельно,
+                # чтобы получить текст ошибки или результат после сбоя.
+                self._call_single(method, params, future)
+            else:
+                future.set_result(result)
+
+    def _call_single(self, method, params, future):
+        try:
+            future.set_result(self.call(method, **params))
+        except Exception as e:
+            future.set_exception(e)
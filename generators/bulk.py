@@ -0,0 +1,120 @@
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core import metrics
+from generators.image_gen import ImageGenerator
+from generators.text_gen import PostGenerator
+
+TRUE_VALUES = {"1", "true", "yes", "y", "да", "+"}
+
+
+def parse_rows(csv_text):
+    """
+    Разбирает CSV с колонками topic, tone и (необязательно) generate_image.
+
+    Первая строка может быть заголовком; без заголовка колонки берутся
+    по порядку: тема, тон, генерировать ли изображение.
+
+    :param csv_text: Текст CSV
+    :return: Список словарей с ключами topic, tone, generate_image
+    :raises ValueError: Если в строке нет темы или тона
+    """
+    lines = [line for line in csv_text.splitlines() if line.strip()]
+    if not lines:
+        return []
+
+    reader = csv.reader(io.StringIO("\n".join(lines)))
+    rows = list(reader)
+    header = [cell.strip().lower() for cell in rows[0]]
+    if "topic" in header and "tone" in header:
+        columns = header
+        rows = rows[1:]
+    else:
+        columns = ["topic", "tone", "generate_image"]
+
+    result = []
+    for number, row in enumerate(rows, start=1):
+        values = dict(zip(columns, (cell.strip() for cell in row)))
+        if not values.get("topic") or not values.get("tone"):
+            raise ValueError(f"Row {number}: topic and tone are required")
+        result.append(
+            {
+                "topic": values["topic"],
+                "tone": values["tone"],
+                "generate_image": values.get("generate_image", "").lower()
+                in TRUE_VALUES,
+            }
+        )
+    return result
+
+
+class BulkGenerator:
+    """
+    Пакетная генерация постов для контент-плана.
+
+    Строки обрабатываются параллельно пулом из max_concurrency потоков.
+    Частоту запросов к OpenAI ограничивают сами генераторы через общий
+    лимит ключа (core.ratelimit), поэтому лишние потоки просто ждут очереди.
+    """
+
+    def __init__(self, openai_key, max_concurrency=4):
+        """
+        :param openai_key: API-ключ OpenAI
+        :param max_concurrency: Максимум одновременно обрабатываемых строк
+        """
+        self.openai_key = openai_key
+        self.max_concurrency = max_concurrency
+
+    def generate_row(self, row, force=False):
+        """
+        Генерирует пост (и изображение) для одной строки контент-плана.
+
+        :param row: Словарь с ключами topic, tone, generate_image
+        :param force: Игнорировать кэш генераций
+        :return: Словарь с ключами post_content, image_url, error
+        """
+        try:
+            post_gen = PostGenerator(self.openai_key, row["tone"], row["topic"])
+            image_generator = (
+                ImageGenerator(self.openai_key) if row.get("generate_image") else None
+            )
+            bundle = post_gen.generate_bundle(
+                with_image=bool(row.get("generate_image")),
+                image_generator=image_generator,
+                force=force,
+            )
+            return {
+                "post_content": bundle["post_content"],
+                "image_url": bundle["image_url"],
+                "error": None,
+            }
+        except Exception as e:
+            return {"post_content": None, "image_url": None, "error": str(e)}
+
+    def iter_results(self, rows, force=False):
+        """
+        Обрабатывает строки параллельно и отдает результаты по мере готовности.
+
+        :param rows: Список строк из parse_rows()
+        :param force: Игнорировать кэш генераций
+        :return: Итератор пар (индекс строки, результат generate_row())
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                executor.submit(
+                    metrics.with_trace(self.generate_row), row, force
+                ): index
+                for index, row in enumerate(rows)
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def run(self, rows, force=False):
+        """
+        :return: Список результатов в порядке исходных строк
+        """
+        results = [None] * len(rows)
+        for index, result in self.iter_results(rows, force):
+            results[index] = result
+        return results
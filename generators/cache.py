@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class GenerationCache:
+    """
+    Кэш результатов генерации с адресацией по содержимому запроса.
+
+    Ключ — SHA-256 от модели, шаблона промта (с версией), тона и темы.
+    Кэш состоит из двух уровней: LRU-словарь в памяти и (опционально)
+    таблица SQLite на диске, которая переживает перезапуск процесса.
+    Записи старше ttl секунд считаются устаревшими.
+    """
+
+    def __init__(self, max_entries=1000, ttl=24 * 60 * 60, db_path=None):
+        """
+        :param max_entries: Максимум записей в памяти (LRU-вытеснение)
+        :param ttl: Время жизни записи в секундах
+        :param db_path: Путь к файлу SQLite для дискового уровня или None
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS generation_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model, prompt_id, tone, topic):
+        """
+        :param prompt_id: Идентификатор шаблона промта (PromptTemplate.id)
+        :return: Хэш-ключ записи кэша
+        """
+        payload = json.dumps(
+            [model, prompt_id, tone, topic], ensure_ascii=False
+        ).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key):
+        """
+        Ищет запись сначала в памяти, затем на диске.
+
+        :param key: Ключ из make_key()
+        :return: Сохраненное значение или None
+        """
+        value = self._get_memory(key)
+        if value is None and self._db is not None:
+            value = self._get_disk(key)
+        if value is None:
+            self._miss()
+        return value
+
+    async def aget(self, key):
+        """
+        Асинхронная версия get(): запрос к SQLite выполняется в потоке,
+        чтобы не останавливать цикл событий; попадание в память — сразу.
+        """
+        value = self._get_memory(key)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        if value is None:
+            self._miss()
+        return value
+
+    def set(self, key, value):
+        """
+        Сохраняет значение в памяти и на диске.
+
+        :param key: Ключ из make_key()
+        :param value: Строка для сохранения
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO generation_cache (key, value, created_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, value, now),
+                )
+                self._db.execute(
+                    "DELETE FROM generation_cache WHERE created_at < ?",
+                    (now - self.ttl,),
+                )
+                self._db.commit()
+
+    async def aset(self, key, value):
+        """
+        Асинхронная версия set() (см. aget).
+        """
+        if self._db is None:
+            self.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def get_or_create(self, key, create, force=False):
+        """
+        Возвращает значение из кэша или вычисляет и сохраняет новое.
+
+        :param key: Ключ из make_key()
+        :param create: Функция без аргументов, вычисляющая значение
+        :param force: Игнорировать кэш и перегенерировать значение
+        :return: Значение
+        """
+        if not force:
+            value = self.get(key)
+            if value is not None:
+                return value
+        value = create()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        """
+        :return: Счетчики попаданий и промахов, размер кэша в памяти
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._memory)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM generation_cache")
+                self._db.commit()
+
+    def _get_memory(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if now - created_at > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._counters["hits"] += 1
+            self._counters["memory_hits"] += 1
+            return value
+
+    def _get_disk(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM generation_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            self._remember(key, row[0], row[1])
+            self._counters["hits"] += 1
+            self._counters["disk_hits"] += 1
+            return row[0]
+
+    def _miss(self):
+        with self._lock:
+            self._counters["misses"] += 1
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+default_cache = GenerationCache()
+
+
+def configure_cache(max_entries=1000, ttl=24 * 60 * 60, db_path=None):
+    """
+    Заменяет общий кэш генераций новым с указанными параметрами.
+
+    :return: Новый экземпляр GenerationCache
+    """
+    global default_cache
+    default_cache = GenerationCache(max_entries=max_entries, ttl=ttl, db_path=db_path)
+    return default_cache
+
+
+def get_cache():
+    """
+    :return: Текущий общий кэш генераций
+    """
+    return default_cache
@@ -1,18 +1,32 @@
-from openai import OpenAI
+import asyncio
+
+from core import metrics
+from core.clients import get_async_openai_client, get_openai_client, run_async
+from core.ratelimit import acall_limited, call_limited
+from generators.image_store import ImageStore, get_image_store
+
+IMAGE_MODEL = "dall-e-2"
+IMAGE_SIZE = "256x256"
+# Максимум изображений за один запрос к DALL-E 2 (параметр n).
+MAX_IMAGES = 10
 
 
 class ImageGenerator:
-    def __init__(self, openai_key):
+    def __init__(self, openai_key, store=None):
         """
         Создает экземпляр класса ImageGenerator.
 
         Аргументы:
             openai_key (str): API ключ для DALL-E API от OpenAI.
+            store (ImageStore | None): Хранилище изображений. По умолчанию общее
+                хранилище процесса; если оно не настроено, возвращаются URL OpenAI.
 
         Возвращает:
             None
         """
-        self.client = OpenAI(api_key=openai_key)
+        self.openai_key = openai_key
+        self.client = get_openai_client(openai_key)
+        self.store = store if store is not None else get_image_store()
 
     # def generate_image(self, prompt):
     #     response = self.client.images.generate(
@@ -31,24 +45,168 @@ class ImageGenerator:
     # Для тестов беру дешевле модель. По качеству и пониманию промтов отстой полный.
     # Очень некачественно и плохо понимает промт, но в 4 раза дешевле при тех же параметрах. Промт в два раза дешевле получается.
     # Размеры есть 256x256, 512x512, 1024x1024
-    def generate_image(self, prompt):
+    def generate_image(self, prompt, force=False):
         """
         Генерирует изображение на основе заданного текстового приглашения с использованием модели DALL-E 2.
 
+        Если настроено хранилище изображений, картинка сохраняется локально
+        один раз и возвращается URL нашего сервера; повторный промт берется
+        из хранилища без запроса к API.
+
         Аргументы:
             prompt (str): Текстовое приглашение для генерации изображения.
+            force (bool): Сгенерировать изображение заново, даже если оно есть в хранилище.
 
         Возвращает:
             str: URL сгенерированного изображения или None, если генерация не удалась.
         """
-        response = self.client.images.generate(
-            model="dall-e-2",
-            prompt=prompt,
-            size="256x256",
-            n=1,
-        )
+        if self.store is None:
+            return self._request_image(prompt)
+
+        key = ImageStore.make_key(IMAGE_MODEL, IMAGE_SIZE, prompt)
+        if force:
+            url = self._request_image(prompt)
+            return self.store.put(key, url) if url is not None else None
+        return self.store.get_or_create(key, lambda: self._request_image(prompt))
+
+    async def agenerate_image(self, prompt, force=False):
+        """
+        Асинхронная версия generate_image().
+
+        Аргументы:
+            prompt (str): Текстовое приглашение для генерации изображения.
+            force (bool): Сгенерировать изображение заново, даже если оно есть в хранилище.
+
+        Возвращает:
+            str: URL сгенерированного изображения или None, если генерация не удалась.
+        """
+        if self.store is None:
+            return await self._arequest_image(prompt)
+
+        key = ImageStore.make_key(IMAGE_MODEL, IMAGE_SIZE, prompt)
+        if not force:
+            url = await self.store.alookup(key)
+            if url is not None:
+                return url
+        url = await self._arequest_image(prompt)
+        if url is None:
+            return None
+        # Скачивание и запись на диск выполняются вне цикла событий.
+        return await asyncio.to_thread(self.store.put, key, url)
+
+    def generate_images(self, prompt, count, force=False):
+        """
+        Генерирует несколько изображений по одному промту (например, для
+        поста-карусели).
+
+        Аргументы:
+            prompt (str): Текстовое приглашение для генерации изображений.
+            count (int): Количество изображений, от 1 до MAX_IMAGES.
+            force (bool): Сгенерировать изображения заново, даже если они есть в хранилище.
+
+        Возвращает:
+            list: URL изображений в порядке номеров (None для неудавшихся).
+        """
+        return run_async(self.agenerate_images(prompt, count, force))
+
+    async def agenerate_images(self, prompt, count, force=False):
+        """
+        Асинхронная версия generate_images().
+        """
+        return list(await asyncio.gather(*self.aimages(prompt, count, force)))
+
+    def aimages(self, prompt, count, force=False):
+        """
+        Запускает генерацию count изображений и сразу возвращает задачи asyncio,
+        по одной на изображение.
+
+        Хранилище проверяется в потоке (см. ImageStore.alookup); недостающие
+        в нем изображения запрашиваются одним запросом (n = их количество),
+        после чего каждое скачивается в хранилище отдельно. Задача
+        завершается, как только готово ее изображение, поэтому дальнейшую
+        обработку (например, загрузку в VK) можно начинать, не дожидаясь
+        остальных. Вызывается внутри работающего цикла событий.
+
+        Аргументы:
+            prompt (str): Текстовое приглашение для генерации изображений.
+            count (int): Количество изображений, от 1 до MAX_IMAGES.
+            force (bool): Сгенерировать изображения заново, даже если они есть в хранилище.
+
+        Возвращает:
+            list: Задачи asyncio с URL изображений, в порядке номеров.
+        """
+        if not 1 <= count <= MAX_IMAGES:
+            raise ValueError(f"count must be between 1 and {MAX_IMAGES}")
+
+        keys = [
+            ImageStore.make_key(IMAGE_MODEL, IMAGE_SIZE, prompt, index)
+            for index in range(count)
+        ]
+
+        async def lookup():
+            if self.store is None or force:
+                return [None] * count
+            return await asyncio.gather(*(self.store.alookup(key) for key in keys))
+
+        async def request():
+            cached = await lookups
+            missing = [index for index, url in enumerate(cached) if url is None]
+            urls = await self._arequest_images(prompt, len(missing)) if missing else []
+            return missing, urls
+
+        lookups = asyncio.ensure_future(lookup())
+        requested = asyncio.ensure_future(request())
+
+        async def image(index):
+            cached = await lookups
+            if cached[index] is not None:
+                return cached[index]
+            missing, urls = await requested
+            position = missing.index(index)
+            url = urls[position] if position < len(urls) else None
+            if url is None or self.store is None:
+                return url
+            return await asyncio.to_thread(self.store.put, keys[index], url)
+
+        return [asyncio.ensure_future(image(index)) for index in range(count)]
+
+    def _request_image(self, prompt):
+        with metrics.span("openai.image", model=IMAGE_MODEL):
+            response = call_limited(
+                "openai",
+                f"{self.openai_key}:{IMAGE_MODEL}",
+                lambda: self.client.images.generate(
+                    model=IMAGE_MODEL,
+                    prompt=prompt,
+                    size=IMAGE_SIZE,
+                    n=1,
+                ),
+            )
 
         if response.data is not None:
             return response.data[0].url
         else:
             return None
+
+    async def _arequest_image(self, prompt):
+        urls = await self._arequest_images(prompt, 1)
+        return urls[0] if urls else None
+
+    async def _arequest_images(self, prompt, n):
+        client = get_async_openai_client(self.openai_key)
+        with metrics.span("openai.image", model=IMAGE_MODEL):
+            response = await acall_limited(
+                "openai",
+                f"{self.openai_key}:{IMAGE_MODEL}",
+                lambda: client.images.generate(
+                    model=IMAGE_MODEL,
+                    prompt=prompt,
+                    size=IMAGE_SIZE,
+                    n=n,
+                ),
+            )
+
+        if response.data is not None:
+            return [item.url for item in response.data]
+        else:
+            return []
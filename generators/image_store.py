@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from core import metrics
+from core.clients import get_timeout, get_vk_session
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageStore:
+    """
+    Локальное хранилище сгенерированных изображений с адресацией по содержимому.
+
+    Файлы лежат в root/<первые 2 символа хэша>/<SHA-256 содержимого>, поэтому
+    одинаковые изображения хранятся один раз. Индекс SQLite связывает ключ
+    генерации (модель, размер, промт) с хэшем содержимого: повторный промт
+    не требует ни запроса к API, ни повторного скачивания.
+
+    Когда суммарный размер файлов превышает max_bytes, удаляются файлы,
+    к которым дольше всего не обращались (LRU по размеру).
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, url_prefix="/smm/images/"):
+        """
+        :param root: Каталог для файлов и индекса
+        :param max_bytes: Максимальный суммарный размер файлов
+        :param url_prefix: Префикс URL маршрута, отдающего изображения
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.url_prefix = url_prefix
+        self._lock = threading.Lock()
+        # Блокировки по ключу генерации (с разбиением на полосы), чтобы
+        # одновременные запросы одного промта не генерировали его дважды.
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(root, "index.db"), timeout=30, check_same_thread=False
+        )
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "digest TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "content_type TEXT NOT NULL, last_access REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS prompts ("
+            "key TEXT PRIMARY KEY, digest TEXT NOT NULL, created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS ix_blobs_last_access ON blobs (last_access);"
+            "CREATE INDEX IF NOT EXISTS ix_prompts_digest ON prompts (digest);"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model, size, prompt, index=0):
+        """
+        :param index: Номер изображения среди сгенерированных по одному промту
+        :return: Ключ генерации изображения
+        """
+        parts = [model, size, prompt] + ([index] if index else [])
+        payload = json.dumps(parts, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def url(self, digest):
+        """
+        :return: URL изображения на нашем сервере
+        """
+        return f"{self.url_prefix}{digest}"
+
+    def path(self, digest):
+        """
+        :return: Путь к файлу изображения
+        """
+        return os.path.join(self.root, digest[:2], digest)
+
+    def resolve(self, url):
+        """
+        Находит локальный файл по URL изображения из хранилища.
+
+        :param url: URL, возвращенный url()
+        :return: Путь к файлу или None, если URL не из хранилища
+        """
+        if not url.startswith(self.url_prefix):
+            return None
+        digest = url[len(self.url_prefix) :]
+        if not self._is_digest(digest):
+            return None
+        return self.path(digest)
+
+    def lookup(self, key):
+        """
+        Ищет изображение, уже сохраненное для ключа генерации.
+
+        :param key: Ключ из make_key()
+        :return: URL изображения или None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM prompts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(self.path(row[0])):
+                self._forget(row[0])
+                return None
+            self._touch(row[0])
+        return self.url(row[0])
+
+    async def alookup(self, key):
+        """
+        Асинхронная версия lookup(): запрос и запись времени обращения в
+        SQLite выполняются в потоке, чтобы не останавливать цикл событий.
+        """
+        return await asyncio.to_thread(self.lookup, key)
+
+    def put(self, key, url):
+        """
+        Скачивает изображение потоково и сохраняет его под ключом генерации.
+
+        Файл пишется во временный файл с одновременным подсчетом хэша, затем
+        переименовывается; если такое содержимое уже есть, копия удаляется.
+
+        :param key: Ключ из make_key()
+        :param url: Адрес изображения (например, временный URL OpenAI)
+        :return: URL сохраненного изображения
+        """
+        with metrics.span("image.download"):
+            response = get_vk_session().get(url, stream=True, timeout=get_timeout())
+            try:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "image/png")
+                digest, size, temp_path = self._write_temp(
+                    response.iter_content(CHUNK_SIZE)
+                )
+            finally:
+                response.close()
+        metrics.record_bytes("image_download", "received", size)
+
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (digest, size, content_type, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (digest, size, content_type, now),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO prompts (key, digest, created_at) "
+                "VALUES (?, ?, ?)",
+                (key, digest, now),
+            )
+            self._db.commit()
+            self._evict()
+        return self.url(digest)
+
+    def get_or_create(self, key, create):
+        """
+        Возвращает изображение из хранилища или генерирует и сохраняет новое.
+
+        Одновременные вызовы с одним ключом выполняют генерацию один раз.
+
+        :param key: Ключ из make_key()
+        :param create: Функция без аргументов, возвращающая URL нового изображения
+        :return: URL сохраненного изображения или None, если генерация не удалась
+        """
+        url = self.lookup(key)
+        if url is not None:
+            return url
+        with self._key_lock(key):
+            url = self.lookup(key)
+            if url is not None:
+                return url
+            source_url = create()
+            if source_url is None:
+                return None
+            return self.put(key, source_url)
+
+    def content_type(self, digest):
+        """
+        :return: MIME-тип изображения или None, если его нет в индексе
+        """
+        if not self._is_digest(digest):
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_type FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is not None:
+                self._touch(digest)
+        return row[0] if row else None
+
+    async def acontent_type(self, digest):
+        """
+        Асинхронная версия content_type() (см. alookup).
+        """
+        return await asyncio.to_thread(self.content_type, digest)
+
+    def stats(self):
+        """
+        :return: Количество файлов, ключей генерации и суммарный размер
+        """
+        with self._lock:
+            files, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs"
+            ).fetchone()
+            (keys,) = self._db.execute("SELECT COUNT(*) FROM prompts").fetchone()
+        return {"files": files, "keys": keys, "bytes": total}
+
+    def _write_temp(self, chunks):
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return digest.hexdigest(), size, temp_path
+
+    def _evict(self):
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        for digest, size in self._db.execute(
+            "SELECT digest, size FROM blobs ORDER BY last_access"
+        ).fetchall():
+            self._forget(digest)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _forget(self, digest):
+        self._db.execute("DELETE FROM prompts WHERE digest = ?", (digest,))
+        self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        self._db.commit()
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _touch(self, digest):
+        self._db.execute(
+            "UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), digest)
+        )
+        self._db.commit()
+
+    def _key_lock(self, key):
+        return self._key_locks[int(key[:8], 16) % len(self._key_locks)]
+
+    @staticmethod
+    def _is_digest(value):
+        return len(value) == 64 and all(char in "0123456789abcdef" for char in value)
+
+
+default_store = None
+_store_settings = None
+_store_lock = threading.Lock()
+
+
+def configure_image_store(root, max_bytes=512 * 1024 * 1024, url_prefix="/smm/images/"):
+    """
+    Задает параметры общего хранилища изображений.
+
+    Само хранилище (каталог и индекс SQLite) создается при первом
+    обращении через get_image_store(), а не при запуске приложения.
+
+    :param root: Каталог хранилища или None, чтобы отключить его
+    """
+    global default_store, _store_settings
+    with _store_lock:
+        default_store = None
+        _store_settings = (root, max_bytes, url_prefix) if root else None
+
+
+def get_image_store():
+    """
+    :return: Текущее общее хранилище изображений или None, если оно не настроено
+    """
+    global default_store
+    if default_store is None and _store_settings is not None:
+        with _store_lock:
+            if default_store is None and _store_settings is not None:
+                default_store = ImageStore(*_store_settings)
+    return default_store
@@ -0,0 +1,418 @@
+import hashlib
+import math
+import re
+import string
+import threading
+
+from core import metrics
+
+# Шаблоны промтов для генерации текстов.
+#
+# Шаблон — системная инструкция без подстановок и пользовательское сообщение
+# с полями {topic} и {tone}. Всё, что идет до пользовательского сообщения,
+# побайтно одинаково во всех запросах одной версии шаблона. OpenAI кэширует
+# такой префикс только начиная с 1024 токенов; инструкции шаблонов ниже
+# короче, поэтому скидку за кэш они не получают (длину префикса показывает
+# prefix_tokens в usage_report). Значения полей обрезаются до бюджета
+# токенов поля, а ответ модели ограничивается max_tokens шаблона.
+#
+# Шаблон выбирается по имени, платформе и тону: сначала ищется шаблон для
+# этой платформы и тона, затем для платформы, затем для тона, затем общий.
+# Из нескольких версий берется последняя; версия входит в ключ кэша
+# генераций, поэтому после изменения текста шаблона версию нужно увеличить.
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+# Служебные токены формата чата: на каждое сообщение и на начало ответа.
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+TRUNCATION_MARK = "…"
+
+
+class PromptBudgetError(ValueError):
+    """
+    Промт не помещается в бюджет входных токенов шаблона.
+    """
+
+
+def count_tokens(text):
+    """
+    Оценивает число токенов текста локально, без токенизатора модели.
+
+    Оценка сверху для словарей GPT-4o/GPT-4: слово латиницей — токен на
+    каждые 4 символа, слово кириллицей или другим алфавитом — на каждые
+    3 символа, знак препинания — отдельный токен.
+
+    :param text: Текст
+    :return: Число токенов
+    """
+    tokens = 0
+    for piece in _WORD_RE.findall(text):
+        tokens += math.ceil(len(piece) / (4 if piece.isascii() else 3))
+    return tokens
+
+
+def count_message_tokens(messages):
+    """
+    :param messages: Сообщения чата (role, content)
+    :return: Оценка числа входных токенов запроса
+    """
+    return REPLY_OVERHEAD_TOKENS + sum(
+        MESSAGE_OVERHEAD_TOKENS + count_tokens(message["content"])
+        for message in messages
+    )
+
+
+def truncate_tokens(text, budget):
+    """
+    Обрезает текст по границе слова так, чтобы он помещался в budget токенов.
+
+    :param text: Текст
+    :param budget: Бюджет токенов
+    :return: Текст (с многоточием, если он был обрезан)
+    """
+    if count_tokens(text) <= budget:
+        return text
+    # Многоточие — тоже токен.
+    budget -= 1
+    used = 0
+    end = 0
+    for match in _WORD_RE.finditer(text):
+        piece = match.group()
+        used += math.ceil(len(piece) / (4 if piece.isascii() else 3))
+        if used > budget:
+            break
+        end = match.end()
+    return text[:end].rstrip() + TRUNCATION_MARK
+
+
+class PromptTemplate:
+    """
+    Версионированный шаблон промта с бюджетами токенов.
+    """
+
+    def __init__(
+        self,
+        name,
+        system,
+        user,
+        version=1,
+        platform=None,
+        tone=None,
+        max_input_tokens=1000,
+        max_output_tokens=None,
+        field_tokens=None,
+    ):
+        """
+        :param name: Имя шаблона (например, "post")
+        :param system: Системная инструкция; подстановок не содержит
+        :param user: Пользовательское сообщение с полями {topic}, {tone}
+        :param version: Версия шаблона
+        :param platform: Платформа ("vk", "telegram") или None для любой
+        :param tone: Тон, для которого предназначен шаблон, или None для любого
+        :param max_input_tokens: Бюджет входных токенов всего запроса
+        :param max_output_tokens: Ограничение ответа (max_tokens) или None
+        :param field_tokens: Бюджеты токенов полей, например {"topic": 300}
+        :raises ValueError: Если системная инструкция содержит поля подстановки
+        """
+        if any(field for _, field, _, _ in string.Formatter().parse(system)):
+            raise ValueError(f"System prompt of {name!r} must not contain fields")
+        self.name = name
+        self.system = system
+        self.user = user
+        self.version = version
+        self.platform = platform
+        self.tone = _normalize_tone(tone)
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.field_tokens = dict(field_tokens or {})
+        self.prefix_tokens = count_message_tokens(
+            [{"role": "system", "content": system}]
+        )
+        self.prefix_hash = hashlib.sha256(system.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def id(self):
+        """
+        :return: Идентификатор шаблона и версии, например "post:vk:v2"
+        """
+        parts = [self.name, self.platform, self.tone, f"v{self.version}"]
+        return ":".join(part for part in parts if part)
+
+    def render(self, **values):
+        """
+        Подставляет значения полей, обрезая их до бюджетов токенов.
+
+        :param values: Значения полей (topic, tone)
+        :return: Сообщения чата: общий префикс (системная инструкция),
+            затем пользовательское сообщение
+        :raises PromptBudgetError: Если запрос не помещается в max_input_tokens
+        """
+        values = {
+            field: (
+                truncate_tokens(str(value), self.field_tokens[field])
+                if field in self.field_tokens
+                else str(value)
+            )
+            for field, value in values.items()
+        }
+        messages = [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**values)},
+        ]
+        tokens = count_message_tokens(messages)
+        if tokens > self.max_input_tokens:
+            raise PromptBudgetError(
+                f"Prompt {self.id} needs about {tokens} tokens, "
+                f"budget is {self.max_input_tokens}"
+            )
+        return messages
+
+    def request_options(self):
+        """
+        :return: Дополнительные параметры запроса chat.completions (max_tokens)
+        """
+        if self.max_output_tokens is None:
+            return {}
+        return {"max_tokens": self.max_output_tokens}
+
+    def __repr__(self):
+        return f"PromptTemplate('{self.id}')"
+
+
+class PromptRegistry:
+    """
+    Реестр шаблонов промтов по имени, платформе, тону и версии.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def register(self, template):
+        """
+        Добавляет шаблон.
+
+        :param template: PromptTemplate
+        :return: Тот же шаблон
+        :raises ValueError: Если такая версия шаблона уже зарегистрирована
+        """
+        key = (template.name, template.platform, template.tone)
+        with self._lock:
+            versions = self._templates.setdefault(key, {})
+            if template.version in versions:
+                raise ValueError(f"Prompt template {template.id} is already registered")
+            versions[template.version] = template
+        return template
+
+    def get(self, name, platform=None, tone=None, version=None):
+        """
+        Выбирает шаблон: для платформы и тона, для платформы, для тона
+        или общий (в этом порядке).
+
+        :param name: Имя шаблона
+        :param platform: Платформа
+        :param tone: Тон
+        :param version: Версия; по умолчанию последняя
+        :return: PromptTemplate
+        :raises KeyError: Если подходящего шаблона нет
+        """
+        tone = _normalize_tone(tone)
+        candidates = [(platform, tone), (platform, None), (None, tone), (None, None)]
+        with self._lock:
+            for candidate_platform, candidate_tone in candidates:
+                versions = self._templates.get(
+                    (name, candidate_platform, candidate_tone)
+                )
+                if not versions:
+                    continue
+                if version is None:
+                    return versions[max(versions)]
+                if version in versions:
+                    return versions[version]
+        raise KeyError(f"Unknown prompt template: {name}")
+
+    def templates(self):
+        """
+        :return: Все зарегистрированные шаблоны
+        """
+        with self._lock:
+            return [
+                template
+                for versions in self._templates.values()
+                for template in versions.values()
+            ]
+
+
+def _normalize_tone(tone):
+    return tone.strip().lower() if tone else None
+
+
+registry = PromptRegistry()
+
+registry.register(
+    PromptTemplate(
+        "post",
+        system=(
+            "Ты высококвалифицированный SMM специалист, который будет помогать "
+            "в генерации текста для постов с заданной тебе тематикой и заданным тоном."
+        ),
+        user="Сгенерировать текст для соцсети с темой: {topic} и тоном: {tone}.",
+        max_input_tokens=500,
+        max_output_tokens=800,
+        field_tokens={"topic": 300, "tone": 30},
+    )
+)
+
+# Требования площадок к тексту поста.
+POST_PLATFORMS = {
+    "vk": (
+        "Пост публикуется на стене сообщества ВКонтакте. В ленте видны только "
+        "первые строки, поэтому главная мысль и зацепка должны быть в первом "
+        "абзаце. Объем — до 1500 знаков, короткие абзацы по 2–3 предложения, "
+        "эмодзи умеренно (не больше одного на абзац). В конце — призыв к "
+        "действию (вопрос к подписчикам или предложение написать в комментариях) "
+        "и 3–5 хэштегов по теме. Не используй разметку Markdown: ВКонтакте "
+        "показывает ее как есть."
+    ),
+    "telegram": (
+        "Пост публикуется в канале Telegram. Первая строка — короткий заголовок, "
+        "передающий суть поста. Объем — до 1000 знаков, чтобы текст поместился в "
+        "подпись к фото; короткие абзацы, перечисления начинай с «—». Хэштеги не "
+        "нужны, допустимо один-два, если они помогают поиску по каналу. Не "
+        "используй разметку Markdown и HTML: текст отправляется без форматирования."
+    ),
+}
+
+# Тоны с отдельной инструкцией: названия тона (как их вводят в форме) -> текст.
+POST_TONES = {
+    ("дружелюбный", "friendly"): (
+        "Тон дружелюбный: обращайся к читателю на «ты», пиши живо и просто, "
+        "как знакомому, без канцелярита."
+    ),
+    ("официальный", "деловой", "formal"): (
+        "Тон официальный: обращайся к читателю на «вы», без сленга, шуток и "
+        "эмодзи; факты и польза для читателя важнее эмоций."
+    ),
+    ("юмористический", "шутливый", "humorous"): (
+        "Тон юмористический: уместная ирония и игра слов, одна-две шутки по "
+        "теме; юмор не должен задевать читателя и заслонять главную мысль."
+    ),
+    ("вдохновляющий", "мотивирующий", "inspiring"): (
+        "Тон вдохновляющий: покажи читателю, чего он может добиться, приведи "
+        "пример или историю и закончи призывом сделать первый шаг."
+    ),
+    ("экспертный", "expert"): (
+        "Тон экспертный: уверенно, с конкретными фактами, цифрами и "
+        "практическими советами; термины поясняй простыми словами."
+    ),
+}
+
+
+def _post_template(platform=None, tone=None, instruction=None):
+    base = registry.get("post")
+    system = base.system
+    if platform is not None:
+        system += " " + POST_PLATFORMS[platform]
+    if instruction is not None:
+        system += " " + instruction
+    return PromptTemplate(
+        "post",
+        system=system,
+        user=base.user,
+        platform=platform,
+        tone=tone,
+        # Бюджет общего шаблона, увеличенный на длину дополнительных инструкций.
+        max_input_tokens=base.max_input_tokens
+        + count_message_tokens([{"role": "system", "content": system}])
+        - base.prefix_tokens,
+        max_output_tokens=base.max_output_tokens,
+        field_tokens=base.field_tokens,
+    )
+
+
+def _register_post_templates():
+    # Шаблоны для каждой площадки, каждого тона и их сочетаний: PromptRegistry.get
+    # предпочитает шаблон площадки шаблону тона, поэтому сочетания нужны явно.
+    for platform in [None, *POST_PLATFORMS]:
+        if platform is not None:
+            registry.register(_post_template(platform))
+        for names, instruction in POST_TONES.items():
+            for tone in names:
+                registry.register(_post_template(platform, tone, instruction))
+
+
+_register_post_templates()
+
+registry.register(
+    PromptTemplate(
+        "image_description",
+        system=(
+            "Ты ассистент, который составит промт для нейронной сети, которая будет "
+            "генерировать изображения. Ты должен составить промт на заданную тему."
+        ),
+        user="Сгенерируй изображение для соцсети с темой: {topic}",
+        max_input_tokens=450,
+        # DALL-E 2 принимает промт не длиннее 1000 символов.
+        max_output_tokens=250,
+        field_tokens={"topic": 300},
+    )
+)
+
+
+def get_template(name, platform=None, tone=None, version=None):
+    """
+    :return: Шаблон из общего реестра (см. PromptRegistry.get)
+    """
+    return registry.get(name, platform=platform, tone=tone, version=version)
+
+
+def usage_report():
+    """
+    Сводка расхода токенов по шаблонам промтов с начала работы процесса.
+
+    :return: Словарь id шаблона -> requests, prompt_tokens, completion_tokens,
+        cached_tokens (префикс из кэша провайдера), truncated (ответы,
+        обрезанные max_tokens), средние токены на запрос и параметры шаблона
+    """
+    report = {}
+
+    def entry(template_id):
+        return report.setdefault(
+            template_id,
+            {
+                "requests": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0,
+                "truncated": 0,
+            },
+        )
+
+    for labels, value in metrics.registry.counter_values("openai_tokens_total"):
+        if "template" in labels:
+            entry(labels["template"])[f"{labels['type']}_tokens"] += value
+    for labels, value in metrics.registry.counter_values("openai_completions_total"):
+        if "template" in labels:
+            item = entry(labels["template"])
+            item["requests"] += value
+            if labels["finish_reason"] == "length":
+                item["truncated"] += value
+
+    templates = {template.id: template for template in registry.templates()}
+    for template_id, item in report.items():
+        if item["requests"]:
+            item["avg_prompt_tokens"] = round(
+                item["prompt_tokens"] / item["requests"], 1
+            )
+            item["avg_completion_tokens"] = round(
+                item["completion_tokens"] / item["requests"], 1
+            )
+        template = templates.get(template_id)
+        if template is not None:
+            item["prefix_tokens"] = template.prefix_tokens
+            item["prefix_hash"] = template.prefix_hash
+            item["max_input_tokens"] = template.max_input_tokens
+            item["max_output_tokens"] = template.max_output_tokens
+    return report
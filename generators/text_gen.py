@@ -1,20 +1,38 @@
-from openai import OpenAI
+import asyncio
+
+from core import metrics
+from core.clients import get_async_openai_client, get_openai_client, run_async
+from core.ratelimit import acall_limited, call_limited
+from generators.cache import GenerationCache, get_cache
+from generators.prompts import get_template
+
+MODEL = "gpt-4o-mini"
 
 
 class PostGenerator:
 
-    def __init__(self, openai_key: str, tone: str, topic: str):
+    def __init__(
+        self, openai_key: str, tone: str, topic: str, cache=None, platform=None
+    ):
         """
         Аргументы:
             openai_key (str): API-ключ для OpenAI.
             tone (str): Пожелаемый тон для генерируемого текста.
             topic (str): Тема для генерируемого текста.
+            cache (GenerationCache | None): Кэш генераций. По умолчанию общий кэш процесса.
+            platform (str | None): Платформа публикации ("vk", "telegram") для
+                выбора шаблонов промтов (см. generators.prompts).
         """
-        self.client = OpenAI(api_key=openai_key)
+        self.openai_key = openai_key
+        self.client = get_openai_client(openai_key)
         self.tone = tone
         self.topic = topic
+        self.cache = cache if cache is not None else get_cache()
+        self.post_template = get_template("post", platform=platform, tone=tone)
+        # Описание изображения не зависит от тона.
+        self.image_template = get_template("image_description", platform=platform)
 
-    def generate_post(self):
+    def generate_post(self, force=False):
         """
         Генерирует текст для поста в социальной сети на основе заданной темы и тона.
 
@@ -23,27 +41,130 @@ class PostGenerator:
         происходит через симуляцию диалога, где система выступает в роли SMM
         специалиста, а пользователь задает тему и тон.
 
+        Аргументы:
+            force (bool): Игнорировать кэш и сгенерировать текст заново.
+
         Возвращает:
             str: Сгенерированный текст для поста.
         """
-
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Ты высококвалифицированный SMM специалист, который будет помогать в генерации текста для постов с заданной тебе тематикой и заданным тоном.",
-                },
-                {
-                    "role": "user",
-                    "content": f"Сгенерировать текст для соцсети с темой: {self.topic} и тоном: {self.tone}.",
-                },
-            ],
+        return self.cache.get_or_create(
+            self._post_cache_key(),
+            lambda: self._complete(self.post_template, self._post_messages()),
+            force=force,
         )
 
-        return response.choices[0].message.content
+    def stream_post(self, force=False):
+        """
+        Генерирует текст поста потоково, отдавая фрагменты по мере генерации.
 
-    def generate_post_image_description(self):
+        Использует потоковый режим OpenAI API (stream=True). Итоговый текст
+        сохраняется в кэш, а при попадании в кэш весь текст отдается сразу.
+
+        Аргументы:
+            force (bool): Игнорировать кэш и сгенерировать текст заново.
+
+        Возвращает:
+            Iterator[str]: Фрагменты сгенерированного текста.
+        """
+        key = self._post_cache_key()
+        if not force:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        template = self.post_template
+        messages = self._post_messages()
+        with metrics.span("openai.chat_stream", model=MODEL):
+            stream = call_limited(
+                "openai",
+                f"{self.openai_key}:{MODEL}",
+                lambda: self.client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **template.request_options(),
+                ),
+            )
+        parts = []
+        finish_reason = None
+        for chunk in stream:
+            # Последний фрагмент (stream_options.include_usage) содержит usage.
+            metrics.record_tokens(
+                MODEL, getattr(chunk, "usage", None), template=template.id
+            )
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        metrics.record_completion(MODEL, finish_reason, template=template.id)
+
+        content = "".join(parts)
+        if content:
+            self.cache.set(key, content)
+
+    async def astream_post(self, force=False):
+        """
+        Асинхронная версия stream_post() на AsyncOpenAI.
+
+        Если потребитель прекращает чтение (клиент отключился), поток ответа
+        OpenAI закрывается, а неполный текст в кэш не сохраняется.
+
+        Аргументы:
+            force (bool): Игнорировать кэш и сгенерировать текст заново.
+
+        Возвращает:
+            AsyncIterator[str]: Фрагменты сгенерированного текста.
+        """
+        key = self._post_cache_key()
+        if not force:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                yield cached
+                return
+
+        client = get_async_openai_client(self.openai_key)
+        template = self.post_template
+        messages = self._post_messages()
+        with metrics.span("openai.chat_stream", model=MODEL):
+            stream = await acall_limited(
+                "openai",
+                f"{self.openai_key}:{MODEL}",
+                lambda: client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **template.request_options(),
+                ),
+            )
+        parts = []
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                metrics.record_tokens(
+                    MODEL, getattr(chunk, "usage", None), template=template.id
+                )
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            await stream.close()
+        metrics.record_completion(MODEL, finish_reason, template=template.id)
+
+        content = "".join(parts)
+        if content:
+            await self.cache.aset(key, content)
+
+    def generate_post_image_description(self, force=False):
         """
         Генерирует текст-описание для изображения, которое будет сгенерировано
         на основе заданной темы.
@@ -53,21 +174,151 @@ class PostGenerator:
         происходит через симуляцию диалога, где система выступает в роли
         ассистента, а пользователь задает тему.
 
+        Аргументы:
+            force (bool): Игнорировать кэш и сгенерировать описание заново.
+
         Возвращает:
             str: Сгенерированный текст-описание для изображения.
         """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Ты ассистент, который составит промт для нейронной сети, которая будет генерировать изображения. Ты должен составить промт на заданную тему.",
-                },
-                {
-                    "role": "user",
-                    "content": f"Сгенерируй изображение для соцсети с темой: {self.topic}",
-                },
-            ],
+        return self.cache.get_or_create(
+            self._image_description_cache_key(),
+            lambda: self._complete(
+                self.image_template, self._image_description_messages()
+            ),
+            force=force,
         )
 
+    def generate_bundle(
+        self, with_image=True, image_generator=None, force=False, image_count=1
+    ):
+        """
+        Генерирует текст поста и описание изображения одновременно.
+
+        Обе генерации независимы, поэтому запросы к модели отправляются
+        параллельно через асинхронный клиент OpenAI. Если передан
+        image_generator, генерация изображения стартует сразу после получения
+        описания, не дожидаясь текста поста.
+
+        Аргументы:
+            with_image (bool): Генерировать ли описание (и изображение).
+            image_generator (ImageGenerator | None): Генератор изображений.
+            force (bool): Игнорировать кэш и сгенерировать тексты (и изображение) заново.
+            image_count (int): Сколько изображений сгенерировать по описанию
+                (пост-карусель); все они запрашиваются одним запросом.
+
+        Возвращает:
+            dict: Ключи post_content, image_prompt, image_url (первое
+                изображение) и image_urls (все изображения).
+        """
+        return run_async(
+            self.agenerate_bundle(with_image, image_generator, force, image_count)
+        )
+
+    async def agenerate_bundle(
+        self, with_image=True, image_generator=None, force=False, image_count=1
+    ):
+        """
+        Асинхронная версия generate_bundle().
+        """
+        client = get_async_openai_client(self.openai_key)
+
+        async def image_chain():
+            image_prompt = await self._acomplete_cached(
+                client,
+                self._image_description_cache_key(),
+                self.image_template,
+                self._image_description_messages(),
+                force,
+            )
+            image_urls = []
+            if image_generator is not None and image_count > 1:
+                image_urls = await image_generator.agenerate_images(
+                    image_prompt, image_count, force=force
+                )
+            elif image_generator is not None:
+                image_urls = [
+                    await image_generator.agenerate_image(image_prompt, force=force)
+                ]
+            return image_prompt, [url for url in image_urls if url]
+
+        post_chain = self._acomplete_cached(
+            client,
+            self._post_cache_key(),
+            self.post_template,
+            self._post_messages(),
+            force,
+        )
+        if with_image:
+            post_content, (image_prompt, image_urls) = await asyncio.gather(
+                post_chain, image_chain()
+            )
+        else:
+            post_content = await post_chain
+            image_prompt, image_urls = None, []
+
+        return {
+            "post_content": post_content,
+            "image_prompt": image_prompt,
+            "image_url": image_urls[0] if image_urls else None,
+            "image_urls": image_urls,
+        }
+
+    def _complete(self, template, messages):
+        with metrics.span("openai.chat", model=MODEL):
+            response = call_limited(
+                "openai",
+                f"{self.openai_key}:{MODEL}",
+                lambda: self.client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    **template.request_options(),
+                ),
+            )
+        self._record_usage(template, response)
         return response.choices[0].message.content
+
+    async def _acomplete(self, client, template, messages):
+        with metrics.span("openai.chat", model=MODEL):
+            response = await acall_limited(
+                "openai",
+                f"{self.openai_key}:{MODEL}",
+                lambda: client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    **template.request_options(),
+                ),
+            )
+        self._record_usage(template, response)
+        return response.choices[0].message.content
+
+    async def _acomplete_cached(self, client, key, template, messages, force):
+        if not force:
+            value = await self.cache.aget(key)
+            if value is not None:
+                return value
+        value = await self._acomplete(client, template, messages)
+        if value is not None:
+            await self.cache.aset(key, value)
+        return value
+
+    @staticmethod
+    def _record_usage(template, response):
+        metrics.record_tokens(MODEL, response.usage, template=template.id)
+        metrics.record_completion(
+            MODEL, response.choices[0].finish_reason, template=template.id
+        )
+
+    def _post_cache_key(self):
+        return GenerationCache.make_key(
+            MODEL, self.post_template.id, self.tone, self.topic
+        )
+
+    def _image_description_cache_key(self):
+        # Описание изображения не зависит от тона, поэтому тон в ключ не входит.
+        return GenerationCache.make_key(MODEL, self.image_template.id, "", self.topic)
+
+    def _post_messages(self):
+        return self.post_template.render(topic=self.topic, tone=self.tone)
+
+    def _image_description_messages(self):
+        return self.image_template.render(topic=self.topic)
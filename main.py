@@ -1,6 +1,8 @@
 from app import create_app
 
-app = create_app()
+# Сервер разработки (python main.py) сам создает и обновляет схему базы
+# данных; при развертывании это делает команда flask --app main db upgrade.
+app = create_app({"DB_AUTO_MIGRATE": __name__ == "__main__"})
 
 if __name__ == "__main__":
     app.run(debug=True, port=5500)
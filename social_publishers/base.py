@@ -0,0 +1,97 @@
+import importlib
+import sys
+
+from core.clients import run_async
+
+# Публикаторы соцсетей регистрируются по имени площадки и загружаются при
+# первом обращении, чтобы запуск процесса не импортировал клиенты всех сетей.
+PUBLISHERS = {
+    "vk": "social_publishers.vk_publisher:VKPublisher",
+    "telegram": "social_publishers.telegram_publisher:TelegramPublisher",
+}
+
+
+class PublishError(Exception):
+    """
+    Ошибка публикации поста на площадке.
+
+    Атрибуты:
+        retryable (bool): Можно ли повторить публикацию.
+    """
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Publisher:
+    """
+    Интерфейс публикатора: публикует текст с изображениями на одной площадке.
+
+    Наследники задают platform и реализуют apublish(); синхронный publish()
+    выполняет ее в общем цикле событий (core.clients.run_async).
+    """
+
+    platform = None
+    # Повторная отправка не создает дубликат (например, guid записи VK),
+    # поэтому публикацию можно повторить после таймаута или ошибки сервера.
+    idempotent = False
+
+    def publish(self, content, images=(), guid=None):
+        """
+        Публикует пост.
+
+        :param content: Текст поста
+        :param images: Изображения (URL, пути, bytes или файловые объекты)
+        :param guid: Уникальный идентификатор поста для защиты от дубликатов
+        :return: ID опубликованной записи на площадке
+        :raises PublishError: Если площадка отклонила пост
+        """
+        return run_async(self.apublish(content, images, guid))
+
+    async def apublish(self, content, images=(), guid=None):
+        """
+        Асинхронная версия publish().
+
+        Элементом images может быть и awaitable (например, задача
+        ImageGenerator.aimages()), если изображение еще генерируется.
+        """
+        raise NotImplementedError
+
+    def is_retryable(self, error):
+        """
+        :param error: Исключение, которым завершилась попытка публикации
+        :return: True, если публикацию можно повторить без риска дубликата
+        """
+        if isinstance(error, PublishError):
+            return error.retryable
+        httpx = sys.modules.get("httpx")
+        if httpx is not None and isinstance(
+            error, (httpx.ConnectError, httpx.ConnectTimeout)
+        ):
+            # Запрос не дошел до сервера.
+            return True
+        return self.idempotent
+
+
+def get_publisher_class(platform):
+    """
+    :param platform: Имя площадки (ключ PUBLISHERS)
+    :return: Класс публикатора
+    :raises ValueError: Если площадка неизвестна
+    """
+    path = PUBLISHERS.get(platform)
+    if path is None:
+        raise ValueError(f"Unknown publishing platform: {platform}")
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def create_publisher(platform, *args, **kwargs):
+    """
+    Создает публикатор площадки; аргументы передаются его конструктору.
+
+    :param platform: Имя площадки (ключ PUBLISHERS)
+    :return: Publisher
+    """
+    return get_publisher_class(platform)(*args, **kwargs)
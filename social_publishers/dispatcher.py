@@ -0,0 +1,119 @@
+import asyncio
+import inspect
+import time
+
+from core import metrics
+from core.clients import run_async
+
+
+class FanOutDispatcher:
+    """
+    Публикует один пост на несколько площадок одновременно.
+
+    Каждая площадка публикуется в своей задаче со своим таймаутом попытки
+    и своими повторами, поэтому медленная или недоступная сеть не задерживает
+    и не срывает публикацию в остальных. Повтор выполняется, только если он
+    не создаст дубликат (см. Publisher.is_retryable).
+    """
+
+    def __init__(self, timeout=60.0, max_attempts=3, backoff=2.0):
+        """
+        :param timeout: Таймаут одной попытки публикации, секунд
+        :param max_attempts: Максимум попыток на площадку
+        :param backoff: Пауза перед второй попыткой; дальше удваивается
+        """
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def publish(self, targets, content, images=(), guid=None):
+        """
+        Публикует пост на всех площадках.
+
+        :param targets: Словарь имя площадки -> Publisher
+        :param content: Текст поста
+        :param images: Изображения или awaitable, возвращающие изображение
+        :param guid: Уникальный идентификатор поста
+        :return: Словарь имя площадки -> результат: status ("published" или
+            "failed"), post_id, error, attempts, duration_s
+        """
+        return run_async(self.apublish(targets, content, images, guid))
+
+    async def apublish(self, targets, content, images=(), guid=None):
+        """
+        Асинхронная версия publish().
+        """
+        images = list(images)
+        names = list(targets)
+        results = await asyncio.gather(
+            *(
+                self._publish_target(targets[name], content, images, guid)
+                for name in names
+            )
+        )
+        return dict(zip(names, results))
+
+    async def _publish_target(self, publisher, content, images, guid):
+        started = time.perf_counter()
+        result = {
+            "platform": publisher.platform,
+            "status": "failed",
+            "post_id": None,
+            "error": None,
+            "attempts": 0,
+        }
+        while True:
+            result["attempts"] += 1
+            # Изображения, которые еще генерируются, ждут все площадки;
+            # shield не дает таймауту одной из них отменить общую задачу.
+            attempt_images = [
+                asyncio.shield(image) if inspect.isawaitable(image) else image
+                for image in images
+            ]
+            try:
+                result["post_id"] = await asyncio.wait_for(
+                    publisher.apublish(content, attempt_images, guid), self.timeout
+                )
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    error = f"Timed out after {self.timeout:g}s"
+                else:
+                    error = str(e) or type(e).__name__
+                result["error"] = error
+                if result["attempts"] < self.max_attempts and publisher.is_retryable(e):
+                    await asyncio.sleep(self.backoff * 2 ** (result["attempts"] - 1))
+                    continue
+            else:
+                result["status"] = "published"
+                result["error"] = None
+            break
+
+        duration = time.perf_counter() - started
+        result["duration_s"] = round(duration, 3)
+        metrics.record_span(
+            "publish.target",
+            duration,
+            platform=publisher.platform,
+            status=result["status"],
+        )
+        return result
+
+
+def published(results):
+    """
+    :param results: Результаты FanOutDispatcher.publish()
+    :return: True, если пост опубликован хотя бы на одной площадке
+    """
+    return any(result["status"] == "published" for result in results.values())
+
+
+def failure_message(results):
+    """
+    :param results: Результаты FanOutDispatcher.publish()
+    :return: Ошибки площадок одной строкой, например "vk: ...; telegram: ..."
+    """
+    return "; ".join(
+        f"{name}: {result['error']}"
+        for name, result in results.items()
+        if result["status"] == "failed"
+    )
@@ -0,0 +1,235 @@
+import io
+import mmap
+import os
+import uuid
+
+from core import metrics
+from core.clients import get_timeout, get_vk_session
+from generators.image_store import get_image_store
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageSource:
+    """
+    Источник изображения для потоковой загрузки.
+
+    Поддерживаются:
+        - URL (http/https): ответ скачивается потоком, по CHUNK_SIZE байт;
+        - URL изображения из локального хранилища (ImageStore): читается файл;
+        - путь к локальному файлу (str или os.PathLike): файл отображается
+          в память (mmap) и отдается срезами без копирования;
+        - bytes, bytearray, memoryview: отдаются срезами memoryview без копирования;
+        - файловые объекты (io.BytesIO, открытые файлы): читаются по частям.
+
+    В памяти одновременно находится не больше одного фрагмента.
+    """
+
+    def __init__(self, source, session=None):
+        self.length = None
+        self._close = None
+
+        store = get_image_store()
+        if isinstance(source, str) and store is not None:
+            source = store.resolve(source) or source
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source)
+            self.length = view.nbytes
+            self._chunks = (
+                view[i : i + CHUNK_SIZE] for i in range(0, self.length, CHUNK_SIZE)
+            )
+        elif isinstance(source, str) and source.startswith(("http://", "https://")):
+            session = session or get_vk_session()
+            response = session.get(source, stream=True, timeout=get_timeout())
+            try:
+                response.raise_for_status()
+            except Exception:
+                # Иначе соединение с непрочитанным телом ответа не вернется в пул.
+                response.close()
+                raise
+            if "Content-Length" in response.headers:
+                self.length = int(response.headers["Content-Length"])
+            self._chunks = response.iter_content(CHUNK_SIZE)
+            self._close = response.close
+        elif isinstance(source, (str, os.PathLike)):
+            file = open(source, "rb")
+            self.length = os.fstat(file.fileno()).st_size
+            if self.length == 0:
+                # Пустой файл нельзя отобразить в память.
+                self._chunks = iter(())
+                self._close = file.close
+            else:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(mapped)
+                self._chunks = (
+                    view[i : i + CHUNK_SIZE] for i in range(0, self.length, CHUNK_SIZE)
+                )
+                self._close = lambda: self._close_mapped(file, mapped, view)
+        elif hasattr(source, "read"):
+            if isinstance(source, io.BytesIO):
+                self.length = source.getbuffer().nbytes - source.tell()
+            elif hasattr(source, "fileno"):
+                self.length = os.fstat(source.fileno()).st_size - source.tell()
+            self._chunks = iter(lambda: source.read(CHUNK_SIZE), b"")
+        else:
+            raise TypeError(f"Unsupported image source: {type(source).__name__}")
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    async def __aiter__(self):
+        # Для асинхронной загрузки: локальные источники читаются без ожидания сети.
+        for chunk in self._chunks:
+            yield chunk
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    @staticmethod
+    def _close_mapped(file, mapped, view):
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # Срезы еще используются; отображение закроет сборщик мусора.
+            pass
+        file.close()
+
+
+class AsyncDownloadSource:
+    """
+    Изображение, скачиваемое асинхронно: потоковый ответ httpx.
+    """
+
+    def __init__(self, response):
+        self.length = None
+        if "Content-Length" in response.headers and not response.headers.get(
+            "Content-Encoding"
+        ):
+            self.length = int(response.headers["Content-Length"])
+        self._response = response
+
+    def __aiter__(self):
+        return self._response.aiter_bytes(CHUNK_SIZE)
+
+
+class MultipartStream:
+    """
+    Тело запроса multipart/form-data с одним файлом, формируемое на лету.
+
+    Если длина файла известна, у объекта есть атрибут len, и requests
+    отправляет заголовок Content-Length; иначе тело уходит с
+    Transfer-Encoding: chunked.
+    """
+
+    def __init__(self, field, filename, source, content_type="image/jpeg"):
+        self.boundary = uuid.uuid4().hex
+        self.source = source
+        self._preamble = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._epilogue = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        if source.length is not None:
+            self.len = len(self._preamble) + source.length + len(self._epilogue)
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __iter__(self):
+        sent = len(self._preamble) + len(self._epilogue)
+        yield self._preamble
+        for chunk in self.source:
+            if chunk:
+                sent += len(chunk)
+                yield chunk
+        yield self._epilogue
+        metrics.record_bytes("vk_upload", "sent", sent)
+
+    async def __aiter__(self):
+        sent = len(self._preamble) + len(self._epilogue)
+        yield self._preamble
+        async for chunk in self.source:
+            if chunk:
+                sent += len(chunk)
+                yield chunk
+        yield self._epilogue
+        metrics.record_bytes("vk_upload", "sent", sent)
+
+
+def upload_file(session, url, field, source, filename="image.jpg"):
+    """
+    Загружает изображение на сервер потоково, не держа его целиком в памяти.
+
+    :param session: requests.Session
+    :param url: URL сервера загрузки
+    :param field: Имя поля формы
+    :param source: URL, путь к файлу, bytes или файловый объект
+    :param filename: Имя файла в форме
+    :return: Ответ requests.Response
+    """
+    image = ImageSource(source, session=session)
+    try:
+        body = MultipartStream(field, filename, image)
+        data = body if hasattr(body, "len") else iter(body)
+        with metrics.span("vk.upload"):
+            return session.post(
+                url,
+                data=data,
+                headers={"Content-Type": body.content_type},
+                timeout=get_timeout(),
+            )
+    finally:
+        image.close()
+
+
+async def aupload_file(client, url, field, source, filename="image.jpg"):
+    """
+    Асинхронная версия upload_file().
+
+    Изображение по URL скачивается тем же клиентом и фрагменты сразу
+    уходят на сервер загрузки; остальные источники читаются как в ImageSource.
+
+    :param client: httpx.AsyncClient
+    :param url: URL сервера загрузки
+    :param field: Имя поля формы
+    :param source: URL, путь к файлу, bytes или файловый объект
+    :param filename: Имя файла в форме
+    :return: Ответ httpx.Response
+    """
+    store = get_image_store()
+    if isinstance(source, str) and store is not None:
+        source = store.resolve(source) or source
+
+    if isinstance(source, str) and source.startswith(("http://", "https://")):
+        async with client.stream("GET", source) as download:
+            try:
+                download.raise_for_status()
+            except Exception:
+                await download.aclose()
+                raise
+            body = MultipartStream(field, filename, AsyncDownloadSource(download))
+            return await _apost_multipart(client, url, body)
+
+    image = ImageSource(source)
+    try:
+        return await _apost_multipart(
+            client, url, MultipartStream(field, filename, image)
+        )
+    finally:
+        image.close()
+
+
+async def _apost_multipart(client, url, body):
+    headers = {"Content-Type": body.content_type}
+    if hasattr(body, "len"):
+        headers["Content-Length"] = str(body.len)
+    with metrics.span("vk.upload"):
+        # aiter(): у MultipartStream есть и синхронный __iter__, а httpx
+        # выбирает синхронный поток, если объект итерируемый.
+        return await client.post(url, content=aiter(body), headers=headers)
@@ -0,0 +1,297 @@
+import functools
+import inspect
+import json
+import mimetypes
+import os
+import re
+
+from core import metrics
+from core.clients import get_async_http_client
+from core.ratelimit import acall_limited, parse_retry_after
+from generators.image_store import get_image_store
+from social_publishers.base import Publisher, PublishError
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+# Ограничения Bot API на длину подписи к фото и текста сообщения. Telegram
+# считает длину в кодовых единицах UTF-16: эмодзи вне BMP занимает две.
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+# Альбом (sendMediaGroup) — от 2 до 10 фото.
+MAX_MEDIA_GROUP = 10
+# Сигнатуры форматов изображений для загружаемых файлов без типа в хранилище.
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+DEFAULT_CONTENT_TYPE = "image/jpeg"
+# Места разбиения длинного текста по убыванию предпочтения: абзац, строка,
+# любой пробельный символ.
+SPLIT_PATTERNS = (re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"\s"))
+
+
+class TelegramAPIError(Exception):
+    """
+    Ошибка, которую вернул Telegram Bot API.
+
+    Атрибуты:
+        code (int): Код ошибки (error_code).
+        retry_after (float): Сколько секунд ждать после ошибки 429 или None.
+    """
+
+    def __init__(self, body, retry_after=None):
+        super().__init__(body.get("description", "Telegram Bot API error"))
+        self.code = body.get("error_code")
+        self.retry_after = retry_after or (body.get("parameters") or {}).get(
+            "retry_after"
+        )
+
+    @property
+    def rate_limited(self):
+        return self.code == 429
+
+
+class TelegramPublisher(Publisher):
+    """
+    Публикация постов в канал или чат Telegram через Bot API.
+    """
+
+    platform = "telegram"
+
+    def __init__(self, bot_token, chat_id, api_url=None):
+        """
+        :param bot_token: Токен бота
+        :param chat_id: ID чата или @username канала
+        :param api_url: Базовый URL Bot API (например, локальный тестовый сервер)
+        """
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.api_url = api_url or TELEGRAM_API_URL
+        # ID уже отправленных сообщений поста (по guid или тексту): повторная
+        # попытка публикации продолжает с первого неотправленного сообщения.
+        self._sent = {}
+
+    async def apublish(self, content, images=(), guid=None):
+        """
+        Публикует текст с фото (одним сообщением или альбомом).
+
+        Текст становится подписью к фото, если помещается в CAPTION_LIMIT;
+        иначе он отправляется отдельными сообщениями после фото, разбитый
+        по абзацам, строкам или пробелам (см. _split_text).
+        Bot API не защищает от дубликатов, поэтому публикатор запоминает
+        отправленные сообщения поста, и повторный вызов после ошибки
+        (например, 429 на одной из частей длинного текста) отправляет только
+        оставшиеся.
+
+        :param content: Текст поста
+        :param images: Изображения или awaitable, возвращающие изображение
+        :param guid: Уникальный идентификатор поста (ключ отправленных сообщений)
+        :return: ID первого отправленного сообщения
+        :raises PublishError: Если изображений больше MAX_MEDIA_GROUP
+        """
+        images = [
+            await image if inspect.isawaitable(image) else image for image in images
+        ]
+        if len(images) > MAX_MEDIA_GROUP:
+            raise PublishError(
+                f"Telegram allows at most {MAX_MEDIA_GROUP} photos per post",
+                retryable=False,
+            )
+
+        caption = content if images and _utf16_len(content) <= CAPTION_LIMIT else None
+        steps = []
+        if len(images) == 1:
+            steps.append(functools.partial(self._send_photo, images[0], caption))
+        elif images:
+            steps.append(functools.partial(self._send_media_group, images, caption))
+        if caption is None:
+            for text in _split_text(content, MESSAGE_LIMIT):
+                steps.append(functools.partial(self._send_message, text))
+
+        key = guid or content
+        sent = self._sent.setdefault(key, [])
+        for step in steps[len(sent) :]:
+            sent.append(await step())
+        del self._sent[key]
+        return sent[0]
+
+    def is_retryable(self, error):
+        if isinstance(error, TelegramAPIError):
+            # После 429 сообщение точно не отправлено.
+            return error.rate_limited
+        return super().is_retryable(error)
+
+    async def _send_message(self, text):
+        message = await self._call(
+            "sendMessage", {"chat_id": self.chat_id, "text": text}
+        )
+        return message["message_id"]
+
+    async def _send_photo(self, image, caption):
+        data = {"chat_id": self.chat_id}
+        if caption:
+            data["caption"] = caption
+        refs, uploads = await self._media([image])
+        if uploads:
+            message = await self._call("sendPhoto", data, {"photo": uploads["photo0"]})
+        else:
+            data["photo"] = refs[0]
+            message = await self._call("sendPhoto", data)
+        return message["message_id"]
+
+    async def _send_media_group(self, images, caption):
+        refs, uploads = await self._media(images)
+        media = [{"type": "photo", "media": ref} for ref in refs]
+        if caption:
+            media[0]["caption"] = caption
+        messages = await self._call(
+            "sendMediaGroup",
+            {"chat_id": self.chat_id, "media": json.dumps(media, ensure_ascii=False)},
+            uploads,
+        )
+        return messages[0]["message_id"]
+
+    @staticmethod
+    async def _media(images):
+        """
+        :return: Пара (ссылки на фото для Bot API, пары (файл, MIME-тип или
+            None) для загрузки по имени)
+        """
+        store = get_image_store()
+        refs = []
+        uploads = {}
+        for index, image in enumerate(images):
+            content_type = None
+            if isinstance(image, str) and store is not None:
+                path = store.resolve(image)
+                if path is not None:
+                    content_type = await store.acontent_type(os.path.basename(path))
+                    image = path
+            if isinstance(image, str) and image.startswith(("http://", "https://")):
+                # Изображение по публичному URL Telegram скачивает сам.
+                refs.append(image)
+            else:
+                name = f"photo{index}"
+                refs.append(f"attach://{name}")
+                uploads[name] = (image, content_type)
+        return refs, uploads
+
+    async def _call(self, method, data, uploads=None):
+        client = get_async_http_client()
+        url = f"{self.api_url}/bot{self.bot_token}/{method}"
+
+        async def send():
+            files, opened = _open_files(uploads or {})
+            try:
+                with metrics.span("telegram.api", method=method):
+                    response = await client.post(url, data=data, files=files or None)
+            finally:
+                for file in opened:
+                    file.close()
+            return _parse_response(response)
+
+        return await acall_limited("telegram", f"{self.bot_token}:{self.chat_id}", send)
+
+
+def _utf16_len(text):
+    """
+    :return: Длина текста в кодовых единицах UTF-16 (как ее считает Telegram)
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _split_text(text, limit):
+    """
+    Разбивает текст на части не длиннее limit кодовых единиц UTF-16.
+
+    Часть заканчивается на последнем разрыве абзаца, строки или пробеле,
+    который оставляет в ней не меньше половины limit; слово без пробелов
+    длиннее limit режется по символам. Суррогатная пара не разрывается:
+    строка Python режется по кодовым точкам.
+
+    :param text: Текст
+    :param limit: Максимальная длина части
+    :return: Список частей без пробелов по краям
+    """
+    parts = []
+    text = text.strip()
+    while _utf16_len(text) > limit:
+        fits = 0
+        units = 0
+        for char in text:
+            units += 2 if ord(char) > 0xFFFF else 1
+            if units > limit:
+                break
+            fits += 1
+        head = text[:fits]
+        end = fits
+        for pattern in SPLIT_PATTERNS:
+            breaks = [match.start() for match in pattern.finditer(head)]
+            if breaks and breaks[-1] >= fits // 2:
+                end = breaks[-1]
+                break
+        else:
+            # Пробела во второй половине нет: берется последний из найденных.
+            spaces = [match.start() for match in SPLIT_PATTERNS[-1].finditer(head)]
+            if spaces and spaces[-1] > 0:
+                end = spaces[-1]
+        parts.append(text[:end].rstrip())
+        text = text[end:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+def _open_files(uploads):
+    """
+    :return: Пара (файлы для multipart-запроса httpx, открытые файлы для закрытия)
+    """
+    files = {}
+    opened = []
+    for name, (source, content_type) in uploads.items():
+        if isinstance(source, str):
+            source = open(source, "rb")
+            opened.append(source)
+        elif hasattr(source, "seek"):
+            # Файловый объект может читаться повторно (повтор после 429).
+            source.seek(0)
+        content_type = content_type or _sniff_content_type(source)
+        extension = mimetypes.guess_extension(content_type) or ".jpg"
+        files[name] = (f"{name}{extension}", source, content_type)
+    return files, opened
+
+
+def _sniff_content_type(source):
+    """
+    :param source: bytes или файловый объект с методом seek
+    :return: MIME-тип изображения по сигнатуре; по умолчанию image/jpeg
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        head = bytes(source[:16])
+    elif hasattr(source, "seek"):
+        head = source.read(16)
+        source.seek(0)
+    else:
+        return DEFAULT_CONTENT_TYPE
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return DEFAULT_CONTENT_TYPE
+
+
+def _parse_response(response):
+    metrics.record_bytes("telegram", "received", len(response.content))
+    try:
+        body = response.json()
+    except ValueError:
+        body = {
+            "ok": False,
+            "error_code": response.status_code,
+            "description": f"HTTP {response.status_code}",
+        }
+    if not body.get("ok"):
+        raise TelegramAPIError(body, retry_after=parse_retry_after(response.headers))
+    return body["result"]
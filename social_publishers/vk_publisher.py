@@ -1,19 +1,45 @@
-import requests
+import asyncio
+import inspect
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
+from core import metrics
+from core.clients import get_async_vk_client, get_vk_session
+from core.vk_execute import VKAPIError, VKExecuteBatch, avk_request, vk_request
+from social_publishers.base import Publisher
+from social_publishers.streaming import aupload_file, upload_file
 
-class VKPublisher:
-    def __init__(self, vk_api_key, group_id):
+VK_API_URL = "https://api.vk.com/method"
+# VK принимает не более 10 вложений в одной записи.
+MAX_ATTACHMENTS = 10
+# Сколько фотографий загружается одновременно.
+UPLOAD_CONCURRENCY = 5
+# Ошибки, после которых повтор публикации бессмысленен: 5 — неверный токен,
+# 15 и 214 — нет доступа к стене, 100 — неверные параметры.
+FATAL_ERROR_CODES = {5, 15, 100, 214}
+
+
+class VKPublisher(Publisher):
+    platform = "vk"
+    # Запись с тем же guid VK не публикует повторно.
+    idempotent = True
+
+    def __init__(self, vk_api_key, group_id, api_url=None):
         """
         Конструктор для VKPublisher
 
         :param vk_api_key: Ключ доступа к VK API
         :param group_id: ID группы VK
+        :param api_url: Базовый URL VK API (например, локальный тестовый сервер)
         :return: None
         """
         self.vk_api_key = vk_api_key
         self.group_id = group_id
+        self.api_url = api_url or VK_API_URL
+        self.session = get_vk_session()
 
-    def upload_photo(self, image_url):
+    def upload_photo(self, image):
         """
         Загружает фотографию на VK и возвращает строку для вложения.
 
@@ -22,56 +48,203 @@ class VKPublisher:
         потом сохраняя его на сервере VK. Она возвращает строку, которая может быть
         использована в качестве вложения для поста VK.
 
-        :param image_url: URL изображения, которое будет загружено.
+        Изображение передается потоково: скачиваемые фрагменты сразу уходят
+        на сервер загрузки VK, поэтому файл целиком в памяти не хранится.
+
+        :param image: URL изображения, путь к локальному файлу, bytes или файловый объект.
         :return: Строка в формате 'photo{owner_id}_{photo_id}' для вложения фотографии к посту.
         :raises Exception: Если происходит ошибка при получении URL загрузки или на любом шаге процесса загрузки.
         """
-        upload_url_response = requests.get(
-            url="https://api.vk.com/method/photos.getWallUploadServer",
-            params={
+        upload_response = self._upload_to_server(image)
+        return self._save_uploaded(upload_response)
+
+    async def aupload_photo(self, image):
+        """
+        Асинхронная версия upload_photo().
+
+        :param image: URL изображения, путь к локальному файлу, bytes или файловый объект.
+        :return: Строка в формате 'photo{owner_id}_{photo_id}' для вложения фотографии к посту.
+        """
+        upload_response = await self._aupload_to_server(image)
+        return await self._asave_uploaded(upload_response)
+
+    def upload_photos(self, images, concurrency=UPLOAD_CONCURRENCY):
+        """
+        Загружает несколько фотографий параллельно.
+
+        Цепочки getWallUploadServer → загрузка → saveWallPhoto разных
+        фотографий выполняются одновременно (не более concurrency сразу),
+        поэтому общее время близко ко времени загрузки одной фотографии.
+
+        :param images: Список изображений (URL, пути, bytes или файловые объекты)
+        :param concurrency: Максимум одновременных загрузок
+        :return: Список строк 'photo{owner_id}_{photo_id}' в порядке images
+        :raises ValueError: Если изображений больше MAX_ATTACHMENTS
+        """
+        images = list(images)
+        _check_attachments(images)
+        if len(images) == 1:
+            return [self.upload_photo(images[0])]
+        with ThreadPoolExecutor(
+            max_workers=min(concurrency, len(images)),
+            thread_name_prefix="vk-upload",
+        ) as executor:
+            return list(executor.map(self.upload_photo, images))
+
+    async def aupload_photos(self, images, concurrency=UPLOAD_CONCURRENCY):
+        """
+        Асинхронная версия upload_photos().
+
+        Элементом images может быть и awaitable (например, задача из
+        ImageGenerator.aimages()): загрузка каждой фотографии начинается, как
+        только готово ее изображение, не дожидаясь остальных.
+
+        :param images: Список изображений или awaitable, возвращающих изображение
+        :param concurrency: Максимум одновременных загрузок
+        :return: Список строк 'photo{owner_id}_{photo_id}' в порядке images
+        :raises ValueError: Если изображений больше MAX_ATTACHMENTS
+        """
+        images = list(images)
+        _check_attachments(images)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def upload(image):
+            if inspect.isawaitable(image):
+                image = await image
+            async with semaphore:
+                return await self.aupload_photo(image)
+
+        return list(await asyncio.gather(*(upload(image) for image in images)))
+
+    def _upload_to_server(self, image):
+        """
+        Получает URL сервера загрузки и загружает на него изображение.
+
+        :return: Ответ сервера загрузки (поля photo, server, hash)
+        """
+        upload_url_response = vk_request(
+            self.session,
+            f"{self.api_url}/photos.getWallUploadServer",
+            {
                 "access_token": self.vk_api_key,
                 "v": "5.236",
                 "group_id": self.group_id,
             },
-        ).json()
+        )
 
-        if "error" in upload_url_response:
-            raise Exception(upload_url_response["error"]["error_msg"])
-        else:
-            upload_url = upload_url_response["response"]["upload_url"]
+        upload_url = upload_url_response["response"]["upload_url"]
+        return upload_file(self.session, upload_url, "photo", image).json()
 
-            image_data = requests.get(image_url).content
+    async def _aupload_to_server(self, image):
+        client = get_async_vk_client()
+        upload_url_response = await avk_request(
+            client,
+            f"{self.api_url}/photos.getWallUploadServer",
+            {
+                "access_token": self.vk_api_key,
+                "v": "5.236",
+                "group_id": self.group_id,
+            },
+        )
 
-            upload_response = requests.post(
-                upload_url, files={"photo": ("image.jpg", image_data)}
-            ).json()
+        upload_url = upload_url_response["response"]["upload_url"]
+        response = await aupload_file(client, upload_url, "photo", image)
+        return response.json()
 
-            save_response = requests.get(
-                url="https://api.vk.com/method/photos.saveWallPhoto",
-                params={
-                    "access_token": self.vk_api_key,
-                    "v": "5.236",
-                    "group_id": self.group_id,
-                    "photo": upload_response["photo"],
-                    "server": upload_response["server"],
-                    "hash": upload_response["hash"],
-                },
-            ).json()
+    @metrics.span("vk.publish")
+    def publish_post(self, content, image_url=None, guid=None, images=None):
+        """
+        Метод для публикации поста в VK.
 
-            photo_id = save_response["response"][0]["id"]
-            owner_id = save_response["response"][0]["owner_id"]
+        :param content: текст поста
+        :param image_url: изображение, которое будет добавлено к посту
+            (URL, путь к файлу, bytes или файловый объект)
+        :param guid: уникальный идентификатор записи; VK не публикует повторно
+            запись с тем же guid, поэтому повторная отправка безопасна
+        :param images: несколько изображений (карусель, до MAX_ATTACHMENTS)
+            вместо image_url; загружаются параллельно, порядок сохраняется
+        :return: ответ от VK API в виде JSON-объекта
+        :raises Exception: если происходит ошибка при загрузке изображения или на любом шаге процесса публикации.
+        """
+        params = self._post_params(content, guid)
+        images = list(images or [])
+        if len(images) == 1:
+            image_url = images.pop()
+        if images:
+            params["attachments"] = ",".join(self.upload_photos(images))
+        elif image_url:
+            upload_response = self._upload_to_server(image_url)
+            response, started = self._save_and_post(params, upload_response)
+            if response is not None:
+                return response
+            if started:
+                # saveWallPhoto мог выполниться внутри execute, а hash
+                # загрузки одноразовый: фотография загружается заново.
+                upload_response = self._upload_to_server(_rewind(image_url))
+            params["attachments"] = self._save_uploaded(upload_response)
 
-            return f"photo{owner_id}_{photo_id}"
+        return vk_request(
+            self.session, f"{self.api_url}/wall.post", params, http_method="post"
+        )
 
-    def publish_post(self, content, image_url=None):
+    async def apublish_post(self, content, image_url=None, guid=None, images=None):
         """
-        Метод для публикации поста в VK.
+        Асинхронная версия publish_post().
 
         :param content: текст поста
-        :param image_url: URL изображения, которое будет добавлено к посту
+        :param image_url: изображение, которое будет добавлено к посту
+            (URL, путь к файлу, bytes или файловый объект)
+        :param guid: уникальный идентификатор записи (см. publish_post)
+        :param images: несколько изображений или awaitable (см. aupload_photos)
+            вместо image_url
         :return: ответ от VK API в виде JSON-объекта
-        :raises Exception: если происходит ошибка при загрузке изображения или на любом шаге процесса публикации.
         """
+        with metrics.span("vk.publish"):
+            params = self._post_params(content, guid)
+            images = list(images or [])
+            if len(images) == 1:
+                image_url = images.pop()
+                if inspect.isawaitable(image_url):
+                    image_url = await image_url
+            if images:
+                attachments = await self.aupload_photos(images)
+                params["attachments"] = ",".join(attachments)
+            elif image_url:
+                upload_response = await self._aupload_to_server(image_url)
+                response, started = await self._asave_and_post(params, upload_response)
+                if response is not None:
+                    return response
+                if started:
+                    # См. publish_post: hash загрузки одноразовый.
+                    upload_response = await self._aupload_to_server(_rewind(image_url))
+                params["attachments"] = await self._asave_uploaded(upload_response)
+
+            return await avk_request(
+                get_async_vk_client(),
+                f"{self.api_url}/wall.post",
+                params,
+                http_method="post",
+            )
+
+    async def apublish(self, content, images=(), guid=None):
+        """
+        Публикует пост через интерфейс Publisher.
+
+        :param content: текст поста
+        :param images: изображения или awaitable (см. aupload_photos)
+        :param guid: уникальный идентификатор записи (см. publish_post)
+        :return: ID записи на стене
+        :raises VKAPIError: если VK API вернул ошибку
+        """
+        response = await self.apublish_post(content, guid=guid, images=images)
+        return response["response"]["post_id"]
+
+    def is_retryable(self, error):
+        if isinstance(error, VKAPIError) and error.code in FATAL_ERROR_CODES:
+            return False
+        return super().is_retryable(error)
+
+    def _post_params(self, content, guid):
         params = {
             "access_token": self.vk_api_key,
             "from_group": 1,
@@ -79,12 +252,119 @@ class VKPublisher:
             "owner_id": f"-{self.group_id}",
             "message": content,
         }
-        if image_url:
-            attachment = self.upload_photo(image_url)
-            params["attachments"] = attachment
+        if guid:
+            params["guid"] = guid
+        return params
+
+    def _save_and_post(self, params, upload_response):
+        """
+        Сохраняет загруженную фотографию и публикует пост одним запросом
+        execute вместо двух (photos.saveWallPhoto + wall.post).
+
+        :return: Пара (ответ в формате wall.post или None, если execute не
+            удался и нужно выполнить шаги по отдельности; мог ли execute
+            начать выполняться — тогда upload_response уже использован)
+        """
+        code = self._save_and_post_code(params, upload_response)
+        try:
+            response = VKExecuteBatch(
+                self.vk_api_key, api_url=self.api_url, session=self.session
+            ).execute(code)
+        except Exception as e:
+            return None, not _not_started(e)
+        if not response.get("response"):
+            return None, True
+        return {"response": response["response"]}, True
+
+    async def _asave_and_post(self, params, upload_response):
+        code = self._save_and_post_code(params, upload_response)
+        try:
+            response = await avk_request(
+                get_async_vk_client(),
+                f"{self.api_url}/execute",
+                {"access_token": self.vk_api_key, "v": "5.236", "code": code},
+                http_method="post",
+            )
+        except Exception as e:
+            return None, not _not_started(e)
+        if not response.get("response"):
+            return None, True
+        return {"response": response["response"]}, True
+
+    def _save_and_post_code(self, params, upload_response):
+        post_params = {
+            key: value
+            for key, value in params.items()
+            if key not in ("access_token", "v")
+        }
+        save_params = {
+            "group_id": self.group_id,
+            "photo": upload_response["photo"],
+            "server": upload_response["server"],
+            "hash": upload_response["hash"],
+        }
+        return (
+            f"var photo = API.photos.saveWallPhoto({json.dumps(save_params, ensure_ascii=False)})[0];"
+            f"var params = {json.dumps(post_params, ensure_ascii=False)};"
+            'params.attachments = "photo" + photo.owner_id + "_" + photo.id;'
+            "return API.wall.post(params);"
+        )
+
+    def _save_uploaded(self, upload_response):
+        save_response = vk_request(
+            self.session,
+            f"{self.api_url}/photos.saveWallPhoto",
+            self._save_params(upload_response),
+        )
+
+        photo = save_response["response"][0]
+        return f"photo{photo['owner_id']}_{photo['id']}"
+
+    async def _asave_uploaded(self, upload_response):
+        save_response = await avk_request(
+            get_async_vk_client(),
+            f"{self.api_url}/photos.saveWallPhoto",
+            self._save_params(upload_response),
+        )
+
+        photo = save_response["response"][0]
+        return f"photo{photo['owner_id']}_{photo['id']}"
+
+    def _save_params(self, upload_response):
+        return {
+            "access_token": self.vk_api_key,
+            "v": "5.236",
+            "group_id": self.group_id,
+            "photo": upload_response["photo"],
+            "server": upload_response["server"],
+            "hash": upload_response["hash"],
+        }
+
+
+def _not_started(error):
+    """
+    :return: True, если запрос точно не был выполнен сервером VK
+        (отказ по лимиту частоты или ошибка установки соединения)
+    """
+    if isinstance(error, VKAPIError):
+        return error.rate_limited
+    connect_errors = []
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        connect_errors += [httpx.ConnectError, httpx.ConnectTimeout]
+    requests = sys.modules.get("requests")
+    if requests is not None:
+        connect_errors.append(requests.exceptions.ConnectTimeout)
+    return isinstance(error, tuple(connect_errors))
+
+
+def _rewind(image):
+    # Файловый объект после первой загрузки прочитан до конца.
+    if hasattr(image, "seek"):
+        image.seek(0)
+    return image
 
-        response = requests.post(
-            "https://api.vk.com/method/wall.post", params=params
-        ).json()
 
-        return response
+def _check_attachments(images):
+    if len(images) > MAX_ATTACHMENTS:
+        raise ValueError(f"VK allows at most {MAX_ATTACHMENTS} attachments per post")
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import metrics
+from social_stats.vk_stats import get_summaries
+
+
+class StatsAggregator:
+    """
+    Сводная статистика по многим группам VK.
+
+    Запросы с одним ключом доступа ограничены общим лимитом VK для этого
+    ключа (core.ratelimit), поэтому группы с одним ключом запрашиваются
+    пакетами execute (см. get_summaries): 50 групп на общем ключе — это
+    5 запросов, а не 100. Пулом из max_workers потоков параллельно
+    опрашиваются только разные ключи. Результат каждой группы кэшируется
+    на cache_ttl секунд.
+    """
+
+    def __init__(self, max_workers=8, cache_ttl=300, posts_per_group=20, api_url=None):
+        """
+        :param max_workers: Максимум одновременных запросов к VK
+        :param cache_ttl: Время жизни кэша по группе в секундах
+        :param posts_per_group: Сколько последних постов учитывать в группе
+        :param api_url: Базовый URL VK API
+        """
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+        self.posts_per_group = posts_per_group
+        self.api_url = api_url
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def fetch_groups(self, vk_api_key, group_ids, force=False):
+        """
+        Получает сводки групп с одним ключом доступа: из кэша, если он не
+        устарел, остальные — одним пакетом запросов execute.
+
+        :param vk_api_key: Ключ доступа к VK API
+        :param group_ids: Список ID групп (строки)
+        :param force: Игнорировать кэш
+        :return: Словарь group_id -> словарь с ключами followers и posts
+            или Exception, если запрос для группы завершился ошибкой
+        """
+        now = time.monotonic()
+        result = {}
+        if not force:
+            with self._lock:
+                for group_id in group_ids:
+                    cached = self._cache.get((vk_api_key, group_id))
+                    if cached is not None and now - cached[0] <= self.cache_ttl:
+                        result[group_id] = cached[1]
+
+        missing = [group_id for group_id in group_ids if group_id not in result]
+        if missing:
+            fetched = get_summaries(
+                vk_api_key, missing, count=self.posts_per_group, api_url=self.api_url
+            )
+            with self._lock:
+                for group_id, summary in fetched.items():
+                    if not isinstance(summary, Exception):
+                        self._cache[(vk_api_key, group_id)] = (now, summary)
+            result.update(fetched)
+        return result
+
+    @metrics.span("stats.aggregate")
+    def aggregate(self, groups, force=False):
+        """
+        Собирает сводную статистику по списку групп.
+
+        :param groups: Список словарей с ключами name, group_id, vk_api_key
+        :param force: Игнорировать кэш
+        :return: Словарь с ключами groups (строка на группу), totals и top_posts
+        """
+        if not groups:
+            return {"groups": [], "totals": self._totals([]), "top_posts": []}
+
+        by_key = {}
+        for group in groups:
+            group_ids = by_key.setdefault(group["vk_api_key"], [])
+            if str(group["group_id"]) not in group_ids:
+                group_ids.append(str(group["group_id"]))
+
+        def fetch(item):
+            vk_api_key, group_ids = item
+            try:
+                return vk_api_key, self.fetch_groups(vk_api_key, group_ids, force)
+            except Exception as e:
+                return vk_api_key, dict.fromkeys(group_ids, e)
+
+        workers = min(self.max_workers, len(by_key))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            summaries = dict(executor.map(metrics.with_trace(fetch), by_key.items()))
+
+        rows = []
+        top_posts = []
+        for group in groups:
+            summary = summaries[group["vk_api_key"]][str(group["group_id"])]
+            error = None
+            if isinstance(summary, Exception):
+                summary, error = None, str(summary)
+            row = {
+                "name": group["name"],
+                "group_id": group["group_id"],
+                "error": error,
+                "followers": 0,
+                "posts": 0,
+                "likes": 0,
+                "views": 0,
+            }
+            if summary is not None:
+                posts = summary["posts"]
+                row["followers"] = summary["followers"]
+                row["posts"] = len(posts)
+                row["likes"] = sum(post["likes"] for post in posts)
+                row["views"] = sum(post["views"] for post in posts)
+                top_posts.extend(dict(post, group=group["name"]) for post in posts)
+            rows.append(row)
+
+        top_posts.sort(key=lambda post: post["likes"], reverse=True)
+        return {
+            "groups": rows,
+            "totals": self._totals(rows),
+            "top_posts": top_posts[:10],
+        }
+
+    @staticmethod
+    def _totals(rows):
+        return {
+            field: sum(row[field] for row in rows)
+            for field in ("followers", "posts", "likes", "views")
+        }
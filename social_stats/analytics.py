@@ -0,0 +1,202 @@
+import numpy as np
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+class PostMetrics:
+    """
+    Метрики постов в колоночном виде (массивы NumPy).
+
+    Все вычисления векторизованы: посты не обходятся циклом Python,
+    поэтому десятки тысяч постов по многим группам считаются за
+    миллисекунды.
+
+    Атрибуты:
+        group_ids (np.ndarray[str]): ID группы для каждого поста.
+        post_ids (np.ndarray[int64]): ID поста.
+        timestamps (np.ndarray[int64]): Время публикации, секунды Unix.
+        likes (np.ndarray[int64]): Лайки.
+        views (np.ndarray[int64]): Просмотры.
+    """
+
+    def __init__(self, group_ids, post_ids, timestamps, likes, views):
+        order = np.argsort(timestamps, kind="stable")
+        self.group_ids = np.asarray(group_ids)[order]
+        self.post_ids = np.asarray(post_ids, dtype=np.int64)[order]
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)[order]
+        self.likes = np.asarray(likes, dtype=np.int64)[order]
+        self.views = np.asarray(views, dtype=np.int64)[order]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Создает метрики из строк запроса (group_id, post_id, posted_at, likes, views).
+
+        :param rows: Последовательность кортежей; posted_at — datetime
+        :return: PostMetrics
+        """
+        if not rows:
+            return cls([], [], [], [], [])
+        group_ids, post_ids, posted_at, likes, views = zip(*rows)
+        timestamps = np.array(posted_at, dtype="datetime64[s]").astype(np.int64)
+        return cls(group_ids, post_ids, timestamps, likes, views)
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def engagement_rate(self):
+        """
+        :return: Доля лайков от просмотров для каждого поста (0, если просмотров нет)
+        """
+        return np.divide(
+            self.likes,
+            self.views,
+            out=np.zeros(len(self), dtype=np.float64),
+            where=self.views > 0,
+        )
+
+    def daily(self):
+        """
+        Суммирует лайки и просмотры по календарным дням (UTC).
+
+        :return: Словарь с массивами days (datetime64[D]), likes, views,
+            engagement (лайки / просмотры за день)
+        """
+        day_index = self.timestamps // SECONDS_PER_DAY
+        if len(day_index) == 0:
+            empty = np.array([], dtype=np.int64)
+            return {
+                "days": empty.astype("datetime64[D]"),
+                "likes": empty,
+                "views": empty,
+                "engagement": empty.astype(np.float64),
+            }
+
+        first = day_index[0]
+        offsets = day_index - first
+        size = offsets[-1] + 1
+        likes = np.bincount(offsets, weights=self.likes, minlength=size)
+        views = np.bincount(offsets, weights=self.views, minlength=size)
+        days = (first + np.arange(size)).astype("datetime64[D]")
+        engagement = np.divide(
+            likes, views, out=np.zeros(size, dtype=np.float64), where=views > 0
+        )
+        return {
+            "days": days,
+            "likes": likes.astype(np.int64),
+            "views": views.astype(np.int64),
+            "engagement": engagement,
+        }
+
+    @staticmethod
+    def rolling_average(values, window=7):
+        """
+        Скользящее среднее через кумулятивную сумму.
+
+        Для первых window - 1 точек среднее считается по доступным значениям.
+
+        :param values: Одномерный массив
+        :param window: Размер окна
+        :return: np.ndarray той же длины
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return values
+        cumsum = np.cumsum(np.insert(values, 0, 0.0))
+        index = np.arange(1, len(values) + 1)
+        start = np.maximum(index - window, 0)
+        return (cumsum[index] - cumsum[start]) / (index - start)
+
+    def week_over_week(self):
+        """
+        Суммы по неделям (понедельник — начало недели) и изменения к прошлой неделе.
+
+        :return: Словарь с массивами weeks (datetime64[D], понедельник недели),
+            likes, views и likes_delta, views_delta (доля изменения, NaN для
+            первой недели и недель с нулем на предыдущей)
+        """
+        daily = self.daily()
+        if len(daily["days"]) == 0:
+            empty = np.array([], dtype=np.float64)
+            return {
+                "weeks": daily["days"],
+                "likes": daily["likes"],
+                "views": daily["views"],
+                "likes_delta": empty,
+                "views_delta": empty,
+            }
+
+        # 1970-01-01 — четверг, поэтому сдвиг на 3 дня дает недели с понедельника.
+        day_numbers = daily["days"].astype(np.int64)
+        week_index = (day_numbers + 3) // 7
+        offsets = week_index - week_index[0]
+        size = offsets[-1] + 1
+        likes = np.bincount(offsets, weights=daily["likes"], minlength=size)
+        views = np.bincount(offsets, weights=daily["views"], minlength=size)
+        weeks = ((week_index[0] + np.arange(size)) * 7 - 3).astype("datetime64[D]")
+        return {
+            "weeks": weeks,
+            "likes": likes.astype(np.int64),
+            "views": views.astype(np.int64),
+            "likes_delta": self._deltas(likes),
+            "views_delta": self._deltas(views),
+        }
+
+    def best_time_heatmap(self, utc_offset_hours=0):
+        """
+        Тепловая карта "день недели × час": средний engagement rate постов,
+        опубликованных в этот слот.
+
+        :param utc_offset_hours: Сдвиг часового пояса аудитории относительно UTC
+        :return: Словарь с массивами engagement (7×24, NaN — нет постов) и counts (7×24)
+        """
+        local = self.timestamps + utc_offset_hours * SECONDS_PER_HOUR
+        weekday = (local // SECONDS_PER_DAY + 3) % 7
+        hour = (local // SECONDS_PER_HOUR) % 24
+        slot = weekday * 24 + hour
+
+        counts = np.bincount(slot, minlength=7 * 24)
+        totals = np.bincount(slot, weights=self.engagement_rate(), minlength=7 * 24)
+        engagement = np.divide(
+            totals,
+            counts,
+            out=np.full(7 * 24, np.nan),
+            where=counts > 0,
+        )
+        return {
+            "engagement": engagement.reshape(7, 24),
+            "counts": counts.reshape(7, 24),
+        }
+
+    def best_slots(self, top=5, min_posts=1, utc_offset_hours=0):
+        """
+        :return: Список (день недели, час, engagement, число постов) лучших слотов
+        """
+        heatmap = self.best_time_heatmap(utc_offset_hours)
+        engagement = np.where(
+            heatmap["counts"] >= min_posts, heatmap["engagement"], np.nan
+        ).ravel()
+        valid = np.flatnonzero(~np.isnan(engagement))
+        best = valid[np.argsort(engagement[valid])[::-1][:top]]
+        counts = heatmap["counts"].ravel()
+        return [
+            (
+                WEEKDAYS[slot // 24],
+                int(slot % 24),
+                float(engagement[slot]),
+                int(counts[slot]),
+            )
+            for slot in best
+        ]
+
+    @staticmethod
+    def _deltas(values):
+        previous = np.concatenate(([np.nan], values[:-1]))
+        return np.divide(
+            values - previous,
+            previous,
+            out=np.full(len(values), np.nan),
+            where=previous > 0,
+        )
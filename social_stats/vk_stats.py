@@ -1,24 +1,25 @@
 import datetime
-import sys
-from pathlib import Path
 
-import requests
+from core.clients import get_vk_session
+from core.vk_execute import VKExecuteBatch, vk_request
 
-# Add parent directory to Python path
-sys.path.insert(0, str(Path(__file__).parent.parent))
+VK_API_URL = "https://api.vk.com/method"
 
 
 class VKStats:
-    def __init__(self, vk_api_key, group_id):
+    def __init__(self, vk_api_key, group_id, api_url=None):
         """
         Конструктор для VKStats
 
         :param vk_api_key: API ключ для VK
         :param group_id: ID группы VK
+        :param api_url: Базовый URL VK API (например, локальный тестовый сервер)
         :return: None
         """
         self.vk_api_key = vk_api_key
         self.group_id = group_id
+        self.api_url = api_url or VK_API_URL
+        self.session = get_vk_session()
 
     def get_stats(self, start_date, end_date):
         """
@@ -27,49 +28,48 @@ class VKStats:
         :param start_date: Начальная дата в формате "YYYY-MM-DD"
         :param end_date: Конечная дата в формате "YYYY-MM-DD"
         :return: Ответ от VK API
-        :raises Exception: Если VK API возвращает ошибку
+        :raises VKAPIError: Если VK API возвращает ошибку
         """
-        url = "https://api.vk.com/method/stats.get"
-        start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-        end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d")
-
-        start_date = start_date.replace(tzinfo=datetime.timezone.utc)
-        end_date = end_date.replace(tzinfo=datetime.timezone.utc)
-
-        start_unix_time = start_date.timestamp()
-        end_unix_time = end_date.timestamp()
-
-        params = {
-            "access_token": self.vk_api_key,
-            "v": "5.236",
-            "group_id": self.group_id,
-            "timestamp_from": start_unix_time,
-            "timestamp_to": end_unix_time,
-        }
-        response = requests.get(url, params=params).json()
-        if "error" in response:
-            raise Exception(response["error"]["error_msg"])
-        else:
-            return response["response"][0]
+        url = f"{self.api_url}/stats.get"
+        params = dict(
+            self._stats_params(start_date, end_date),
+            access_token=self.vk_api_key,
+            v="5.236",
+        )
+        response = vk_request(self.session, url, params)
+        return response["response"][0]
 
     def get_followers(self):
         """
         Получает количество подписчиков группы.
 
         :return: Количество подписчиков
-        :raises Exception: Если VK API возвращает ошибку
+        :raises VKAPIError: Если VK API возвращает ошибку
         """
-        url = "https://api.vk.com/method/groups.getMembers"
+        url = f"{self.api_url}/groups.getMembers"
         params = {
             "access_token": self.vk_api_key,
             "v": "5.236",
             "group_id": self.group_id,
         }
-        response = requests.get(url, params=params).json()
-        if "error" in response:
-            raise Exception(response["error"]["error_msg"])
-        else:
-            return response["response"]["count"]
+        response = vk_request(self.session, url, params)
+        return response["response"]["count"]
+
+    def get_summary(self, count=100):
+        """
+        Получает число подписчиков и статистику последних постов одним
+        запросом к VK API (через метод execute).
+
+        :param count: Количество постов (макс. 100)
+        :return: Словарь с ключами followers и posts
+        :raises VKAPIError: Если VK API возвращает ошибку
+        """
+        summary = get_summaries(
+            self.vk_api_key, [self.group_id], count=count, api_url=self.api_url
+        )[self.group_id]
+        if isinstance(summary, Exception):
+            raise summary
+        return summary
 
     def get_likes_and_views(self, count=100):
         """
@@ -77,28 +77,117 @@ class VKStats:
 
         :param count: Количество постов для анализа (макс. 100)
         :return: Список словарей с лайками и просмотрами для каждого поста
-        :raises Exception: Если VK API возвращает ошибку
+        :raises VKAPIError: Если VK API возвращает ошибку
+        """
+        result = []
+        for item in self.get_wall_page(offset=0, count=count)["items"]:
+            stats = self.parse_post(item)
+            stats["date"] = stats["date"].strftime("%Y-%m-%d %H:%M:%S")
+            result.append(stats)
+        return result
+
+    def get_wall_page(self, offset=0, count=100):
+        """
+        Получает одну страницу записей со стены группы.
+
+        :param offset: Смещение от самой новой записи
+        :param count: Количество записей (макс. 100)
+        :return: Словарь с ключами count (всего записей) и items (записи VK)
+        :raises VKAPIError: Если VK API возвращает ошибку
         """
-        url = "https://api.vk.com/method/wall.get"
+        url = f"{self.api_url}/wall.get"
         params = {
             "access_token": self.vk_api_key,
             "v": "5.236",
             "owner_id": f"-{self.group_id}",  # отрицательное значение для групп
+            "offset": offset,
             "count": count,
         }
-        response = requests.get(url, params=params).json()
-        if "error" in response:
-            raise Exception(response["error"]["error_msg"])
+        response = vk_request(self.session, url, params)
+        return response["response"]
 
-        result = []
-        for item in response["response"]["items"]:
-            stats = {
-                "post_id": item["id"],
-                "likes": item["likes"]["count"],
-                "views": item["views"]["count"] if "views" in item else 0,
-                "date": datetime.datetime.fromtimestamp(item["date"]).strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                ),
+    def iter_wall(self, page_size=100):
+        """
+        Постранично обходит стену группы от новых записей к старым.
+
+        :param page_size: Размер страницы (макс. 100)
+        :return: Итератор страниц — списков записей VK
+        """
+        offset = 0
+        while True:
+            page = self.get_wall_page(offset=offset, count=page_size)
+            items = page["items"]
+            if not items:
+                return
+            yield items
+            offset += len(items)
+            if offset >= page["count"]:
+                return
+
+    def _stats_params(self, start_date, end_date):
+        start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+
+        start_date = start_date.replace(tzinfo=datetime.timezone.utc)
+        end_date = end_date.replace(tzinfo=datetime.timezone.utc)
+
+        return {
+            "group_id": self.group_id,
+            "timestamp_from": start_date.timestamp(),
+            "timestamp_to": end_date.timestamp(),
+        }
+
+    @staticmethod
+    def parse_post(item):
+        """
+        Извлекает из записи VK лайки, просмотры и дату публикации.
+
+        :param item: Запись из ответа wall.get
+        :return: Словарь с ключами post_id, likes, views, date (datetime
+            в UTC без tzinfo, как все даты в базе)
+        """
+        return {
+            "post_id": item["id"],
+            "likes": item["likes"]["count"],
+            "views": item["views"]["count"] if "views" in item else 0,
+            "date": datetime.datetime.fromtimestamp(
+                item["date"], tz=datetime.timezone.utc
+            ).replace(tzinfo=None),
+        }
+
+
+def get_summaries(vk_api_key, group_ids, count=100, api_url=None):
+    """
+    Получает число подписчиков и статистику последних постов сразу для
+    нескольких групп с одним ключом доступа.
+
+    Вызовы groups.getMembers и wall.get всех групп объединяются в запросы
+    execute по 25 вызовов (12 групп на запрос), поэтому сводка по 50 группам
+    на общем ключе стоит 5 запросов к VK, а не 100.
+
+    :param vk_api_key: Ключ доступа к VK API (общий для всех групп)
+    :param group_ids: Список ID групп VK
+    :param count: Количество постов на группу (макс. 100)
+    :param api_url: Базовый URL VK API
+    :return: Словарь group_id -> словарь с ключами followers и posts
+        или Exception, если запрос для группы завершился ошибкой
+    """
+    with VKExecuteBatch(vk_api_key, api_url=api_url) as batch:
+        futures = {
+            group_id: (
+                batch.add("groups.getMembers", group_id=group_id),
+                batch.add("wall.get", owner_id=f"-{group_id}", offset=0, count=count),
+            )
+            for group_id in group_ids
+        }
+
+    result = {}
+    for group_id, (followers, wall) in futures.items():
+        try:
+            result[group_id] = {
+                "followers": followers.result()["count"],
+                "posts": [VKStats.parse_post(item) for item in wall.result()["items"]],
             }
-            result.append(stats)
-        return result
+        except Exception as e:
+            result[group_id] = e
+    return result
@@ -0,0 +1,83 @@
+import sys
+import types
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+from benchmarks.fakes import FakeOpenAI, FakeTelegram, FakeVK
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    Приложение на временной базе SQLite: схема создается миграциями, задачи
+    не выполняются в фоне (JOBS_BACKEND = "external"), планировщик выключен.
+    Ошибки лимита не повторяются внутри call_limited, чтобы их видели
+    планировщик и FanOutDispatcher.
+    """
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+            "DB_AUTO_MIGRATE": True,
+            "JOBS_BACKEND": "external",
+            "SCHEDULER_ENABLED": False,
+            "PASSWORD_HASH_WORKERS": 0,
+            "IMAGE_STORE_DIR": str(tmp_path / "images"),
+            "RATE_LIMIT_MAX_RETRIES": 0,
+            "VK_REQUESTS_PER_SECOND": 1000,
+            "TELEGRAM_REQUESTS_PER_SECOND": 1000,
+        }
+    )
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def user(app):
+    user = User(username="tester", password="x", vk_api_id="vk-token", vk_group_id="1")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def fake_vk():
+    server = FakeVK(wall_size=10)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fake_telegram():
+    server = FakeTelegram()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """
+    FakeOpenAI и фиктивный config.py с ключом: клиенты OpenAI читают адрес
+    API из OPENAI_BASE_URL.
+    """
+    server = FakeOpenAI(completion_words=20)
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{server.start()}/v1")
+    monkeypatch.setitem(
+        sys.modules, "config", types.SimpleNamespace(openai_key="sk-test")
+    )
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def session_cookie(app, user):
+    """
+    Cookie сессии Flask вошедшего пользователя user.
+    """
+    serializer = app.session_interface.get_signing_serializer(app)
+    return {app.config["SESSION_COOKIE_NAME"]: serializer.dumps({"user_id": user.id})}
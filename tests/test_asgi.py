@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import httpx
+
+from app.asgi import create_asgi_app
+
+
+def events(text):
+    """
+    :return: Список пар (событие, данные) из потока Server-Sent Events
+    """
+    result = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        result.append((lines["event"], json.loads(lines["data"])))
+    return result
+
+
+def asgi_get(app, path, cookies=None, **options):
+    async def get():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=create_asgi_app(app)),
+            base_url="http://test",
+            cookies=cookies,
+        ) as client:
+            return await client.get(path, **options)
+
+    return asyncio.run(get())
+
+
+def test_stream_is_served_natively(app, fake_openai, session_cookie):
+    response = asgi_get(
+        app,
+        "/smm/post-generator/stream",
+        cookies=session_cookie,
+        params={"tone": "дружелюбный", "topic": "Новости"},
+        headers={"Accept": "text/event-stream"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    stream = events(response.text)
+    tokens = [data["token"] for event, data in stream if event == "token"]
+    assert len(tokens) > 1
+    assert stream[-1] == ("done", {"post_content": "".join(tokens), "job_id": None})
+    # Запрос обработала корутина, а не Flask-приложение в потоке.
+    assert fake_openai.requests == 1
+
+
+def test_stream_matches_flask_route(app, fake_openai, session_cookie):
+    params = {"tone": "дружелюбный", "topic": "Новости"}
+    native = asgi_get(
+        app, "/smm/post-generator/stream", cookies=session_cookie, params=params
+    )
+    client = app.test_client()
+    client.set_cookie(*next(iter(session_cookie.items())))
+    flask = client.get("/smm/post-generator/stream", query_string=params)
+
+    # Второй запрос получает текст из кэша генераций одним фрагментом.
+    assert events(native.text)[-1] == events(flask.get_data(as_text=True))[-1]
+    assert fake_openai.requests == 1
+
+
+def test_stream_requires_login(app, fake_openai):
+    response = asgi_get(
+        app,
+        "/smm/post-generator/stream",
+        params={"tone": "дружелюбный", "topic": "Новости"},
+    )
+
+    assert response.status_code == 401
+    assert fake_openai.requests == 0
+
+
+def test_stream_requires_topic(app, fake_openai, session_cookie):
+    response = asgi_get(
+        app,
+        "/smm/post-generator/stream",
+        cookies=session_cookie,
+        params={"tone": "дружелюбный"},
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {"error": "Missing parameter: topic"}
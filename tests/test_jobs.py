@@ -0,0 +1,134 @@
+import datetime
+import threading
+
+from app import db
+from app.jobs import (
+    JOB_HANDLERS,
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_QUEUED,
+    STATUS_RUNNING,
+    claim_job,
+    enqueue_job,
+    requeue_expired_jobs,
+    run_job,
+)
+from app.models import Job
+
+
+def expire_lease(job):
+    job.lease_expires_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_claim_takes_oldest_queued_job_and_leases_it(user):
+    first = enqueue_job(user.id, "stats_sync", {})
+    enqueue_job(user.id, "stats_sync", {})
+
+    job = claim_job()
+
+    assert job.id == first.id
+    assert job.status == STATUS_RUNNING
+    assert job.attempts == 1
+    assert job.lease_expires_at > datetime.datetime.utcnow()
+
+
+def test_claim_returns_none_for_empty_queue(user):
+    assert claim_job() is None
+
+
+def test_concurrent_workers_never_claim_the_same_job(app, user):
+    ids = [enqueue_job(user.id, "stats_sync", {}).id for _ in range(30)]
+    db.session.remove()
+    claimed = []
+    lock = threading.Lock()
+
+    def worker():
+        with app.app_context():
+            while True:
+                job = claim_job()
+                if job is None:
+                    break
+                with lock:
+                    claimed.append(job.id)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == ids
+
+
+def test_run_job_saves_result(monkeypatch, user):
+    monkeypatch.setitem(JOB_HANDLERS, "stats_sync", lambda job: {"changed": 3})
+    enqueue_job(user.id, "stats_sync", {})
+    job = claim_job()
+
+    run_job(job)
+
+    job = db.session.get(Job, job.id)
+    assert job.status == STATUS_DONE
+    assert job.result == {"changed": 3}
+    assert job.lease_expires_at is None
+
+
+def test_run_job_marks_failed_job(monkeypatch, user):
+    def fail(job):
+        raise RuntimeError("VK is down")
+
+    monkeypatch.setitem(JOB_HANDLERS, "stats_sync", fail)
+    enqueue_job(user.id, "stats_sync", {})
+    job = claim_job()
+
+    run_job(job)
+
+    job = db.session.get(Job, job.id)
+    assert job.status == STATUS_FAILED
+    assert job.error == "VK is down"
+    assert job.lease_expires_at is None
+
+
+def test_job_with_expired_lease_is_claimed_again(user):
+    job = enqueue_job(user.id, "stats_sync", {})
+    claim_job()
+    expire_lease(job)
+
+    reclaimed = claim_job()
+
+    assert reclaimed.id == job.id
+    assert reclaimed.status == STATUS_RUNNING
+    assert reclaimed.attempts == 2
+
+
+def test_job_with_live_lease_is_not_requeued(user):
+    job = enqueue_job(user.id, "stats_sync", {})
+    claim_job()
+
+    assert requeue_expired_jobs() == 0
+    assert db.session.get(Job, job.id).status == STATUS_RUNNING
+
+
+def test_job_interrupted_too_many_times_fails(app, user):
+    app.config["JOBS_MAX_ATTEMPTS"] = 2
+    job = enqueue_job(user.id, "stats_sync", {})
+    for _ in range(2):
+        claim_job()
+        expire_lease(job)
+
+    assert claim_job() is None
+    db.session.refresh(job)
+    assert job.status == STATUS_FAILED
+    assert job.error == "Job was interrupted too many times"
+
+
+def test_job_without_lease_is_requeued(user):
+    # Задача, которую забрал процесс до появления аренды (миграция 5).
+    job = enqueue_job(user.id, "stats_sync", {})
+    job.status = STATUS_RUNNING
+    db.session.commit()
+
+    assert requeue_expired_jobs() == 1
+    assert db.session.get(Job, job.id).status == STATUS_QUEUED
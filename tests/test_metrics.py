@@ -0,0 +1,43 @@
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    def make(**config):
+        return create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+                "DB_AUTO_MIGRATE": True,
+                "JOBS_BACKEND": "external",
+                "SCHEDULER_ENABLED": False,
+                **config,
+            }
+        )
+
+    return make
+
+
+def test_metrics_are_hidden_by_default(make_app):
+    client = make_app().test_client()
+
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_require_token(make_app):
+    client = make_app(METRICS_TOKEN="secret").test_client()
+
+    assert client.get("/metrics").status_code == 401
+    wrong = {"Authorization": "Bearer wrong"}
+    assert client.get("/metrics", headers=wrong).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+
+def test_public_metrics(make_app):
+    client = make_app(METRICS_PUBLIC=True).test_client()
+
+    assert client.get("/metrics").status_code == 200
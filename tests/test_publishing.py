@@ -0,0 +1,170 @@
+import pytest
+
+from benchmarks.fakes import FakeTelegram
+from social_publishers.dispatcher import FanOutDispatcher, failure_message, published
+from social_publishers.telegram_publisher import (
+    CAPTION_LIMIT,
+    MESSAGE_LIMIT,
+    TelegramPublisher,
+    _split_text,
+    _utf16_len,
+)
+from social_publishers.vk_publisher import VKPublisher
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+# Текст не помещается в подпись к фото и отправляется тремя сообщениями.
+LONG_CONTENT = "а" * (MESSAGE_LIMIT * 2 + 100)
+
+
+class FlakyTelegram(FakeTelegram):
+    """
+    FakeTelegram, который отвечает 429 на заданные по порядку вызовы методов
+    и записывает все принятые вызовы.
+    """
+
+    def __init__(self, fail_on=(), **options):
+        """
+        :param fail_on: Номера вызовов (с 1), на которые ответить 429
+        """
+        super().__init__(**options)
+        self.fail_on = set(fail_on)
+        self.calls = []
+        self.delivered = []
+
+    def handle(self, path, params, body):
+        method = path.rsplit("/", 1)[-1]
+        self.calls.append(method)
+        if len(self.calls) in self.fail_on:
+            return self.rate_limit_response()
+        self.delivered.append(method)
+        return super().handle(path, params, body)
+
+
+@pytest.fixture
+def dispatcher():
+    return FanOutDispatcher(timeout=10, max_attempts=3, backoff=0.01)
+
+
+@pytest.fixture
+def vk_publisher(fake_vk):
+    return VKPublisher("vk-token", "1", api_url=f"{fake_vk.url}/method")
+
+
+def start(server):
+    server.start()
+    return server
+
+
+def test_one_failed_platform_does_not_stop_the_others(
+    app, dispatcher, vk_publisher, fake_telegram
+):
+    fake_telegram.error_rate = 1.0
+    telegram = TelegramPublisher("bot", "@channel", api_url=fake_telegram.url)
+
+    results = dispatcher.publish(
+        {"vk": vk_publisher, "telegram": telegram}, "Новости", [PNG], guid="post-1"
+    )
+
+    assert results["vk"]["status"] == "published"
+    assert results["vk"]["post_id"] is not None
+    # Ошибка 500: сообщение могло быть отправлено, поэтому повтора нет.
+    assert results["telegram"]["status"] == "failed"
+    assert results["telegram"]["attempts"] == 1
+    assert published(results)
+    assert failure_message(results) == "telegram: Internal Server Error"
+
+
+def test_rate_limited_platform_is_retried(app, dispatcher, vk_publisher):
+    server = start(FlakyTelegram(fail_on={1}))
+    try:
+        telegram = TelegramPublisher("bot", "@channel", api_url=server.url)
+        results = dispatcher.publish(
+            {"vk": vk_publisher, "telegram": telegram}, "Новости", guid="post-2"
+        )
+    finally:
+        server.stop()
+
+    assert results["telegram"]["status"] == "published"
+    assert results["telegram"]["attempts"] == 2
+    assert results["vk"]["attempts"] == 1
+    assert server.delivered == ["sendMessage"]
+
+
+def test_retry_after_partial_delivery_sends_only_remaining_messages(
+    app, dispatcher, vk_publisher
+):
+    # Фото и первая часть текста доставлены, вторая часть получила 429.
+    server = start(FlakyTelegram(fail_on={3}))
+    try:
+        telegram = TelegramPublisher("bot", "@channel", api_url=server.url)
+        results = dispatcher.publish(
+            {"vk": vk_publisher, "telegram": telegram},
+            LONG_CONTENT,
+            [PNG],
+            guid="post-3",
+        )
+    finally:
+        server.stop()
+
+    assert results["telegram"]["status"] == "published"
+    assert results["telegram"]["attempts"] == 2
+    assert server.calls == [
+        "sendPhoto",
+        "sendMessage",
+        "sendMessage",
+        "sendMessage",
+        "sendMessage",
+    ]
+    assert server.delivered == [
+        "sendPhoto",
+        "sendMessage",
+        "sendMessage",
+        "sendMessage",
+    ]
+    # Результат — первое сообщение поста (фото), а не сообщение повтора.
+    assert results["telegram"]["post_id"] == 1
+    assert results["vk"]["status"] == "published"
+
+
+def test_published_post_is_forgotten_by_publisher(app, fake_telegram):
+    telegram = TelegramPublisher("bot", "@channel", api_url=fake_telegram.url)
+
+    first = telegram.publish("Новости", guid="post-4")
+    second = telegram.publish("Новости", guid="post-4")
+
+    # Повторная публикация после успеха — новый пост, а не продолжение.
+    assert second != first
+    assert telegram._sent == {}
+
+
+def test_emoji_text_is_measured_and_split_in_utf16(app):
+    # Эмодзи — одна кодовая точка, но две кодовые единицы UTF-16: по len()
+    # подпись и сообщение помещаются в лимиты, по счету Telegram — нет.
+    caption = "Праздник 🎉🎉 " * 80
+    assert len(caption) < CAPTION_LIMIT < _utf16_len(caption)
+    paragraphs = "\n\n".join([" ".join(["слово🎉🎉"] * 50)] * 10)
+    assert len(paragraphs) < MESSAGE_LIMIT < _utf16_len(paragraphs)
+
+    server = start(FlakyTelegram())
+    try:
+        telegram = TelegramPublisher("bot", "@channel", api_url=server.url)
+        telegram.publish(caption, [PNG], guid="post-5")
+    finally:
+        server.stop()
+    assert server.calls == ["sendPhoto", "sendMessage"]
+
+    parts = _split_text(paragraphs, MESSAGE_LIMIT)
+    assert len(parts) == 2
+    assert all(_utf16_len(part) <= MESSAGE_LIMIT for part in parts)
+    # Части разрезаны между абзацами, поэтому ни одно слово не разорвано.
+    assert "\n\n".join(parts) == paragraphs
+    assert all(part.endswith("🎉") for part in parts)
+
+
+def test_text_without_paragraphs_is_split_between_words():
+    text = " ".join(["🎉слово"] * 2000)
+
+    parts = _split_text(text, MESSAGE_LIMIT)
+
+    assert all(_utf16_len(part) <= MESSAGE_LIMIT for part in parts)
+    assert " ".join(parts) == text
@@ -0,0 +1,63 @@
+import httpx
+import openai
+import pytest
+
+from core.clients import run_async
+from core.ratelimit import acall_limited, call_limited, configure_limits
+
+
+def rate_limit_error(error_type):
+    body = {"message": "Rate limit", "type": error_type, "code": error_type}
+    response = httpx.Response(
+        429,
+        headers={"retry-after-ms": "1"},
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"),
+        json={"error": body},
+    )
+    return openai.RateLimitError("Rate limit", response=response, body=body)
+
+
+@pytest.fixture
+def retries(app):
+    configure_limits(max_retries=3, backoff_base=0.001, openai=1000)
+
+
+def failing(error_type, calls):
+    def request():
+        calls.append(error_type)
+        raise rate_limit_error(error_type)
+
+    return request
+
+
+def test_rate_limited_request_is_retried(retries):
+    calls = []
+
+    with pytest.raises(openai.RateLimitError):
+        call_limited("openai", "sk-test:gpt-4o-mini", failing("requests", calls))
+
+    assert len(calls) == 4
+
+
+def test_insufficient_quota_fails_immediately(retries):
+    calls = []
+
+    with pytest.raises(openai.RateLimitError):
+        call_limited(
+            "openai", "sk-test:gpt-4o-mini", failing("insufficient_quota", calls)
+        )
+
+    assert len(calls) == 1
+
+
+def test_insufficient_quota_fails_immediately_in_async_call(retries):
+    calls = []
+    request = failing("insufficient_quota", calls)
+
+    async def arequest():
+        return request()
+
+    with pytest.raises(openai.RateLimitError):
+        run_async(acall_limited("openai", "sk-test:gpt-4o-mini", arequest))
+
+    assert len(calls) == 1
@@ -0,0 +1,28 @@
+from app.response_cache import ResponseCache
+
+
+def test_versions_are_remembered_until_invalidated():
+    cache = ResponseCache(version_ttl=60)
+    cache.remember_versions({"user:1": 3, "group:10": 5}, cache.generation)
+
+    assert cache.versions(["user:1", "group:10"]) == {"user:1": 3, "group:10": 5}
+
+    cache.invalidate(user_id=1)
+    assert cache.versions(["user:1", "group:10"]) == {"group:10": 5}
+
+
+def test_expired_versions_are_read_again():
+    cache = ResponseCache(version_ttl=0)
+    cache.remember_versions({"user:1": 3}, cache.generation)
+
+    assert cache.versions(["user:1"]) == {}
+
+
+def test_version_read_before_invalidate_is_not_remembered():
+    cache = ResponseCache(version_ttl=60)
+    generation = cache.generation
+    # Версия прочитана из базы, затем этот процесс увеличил ее.
+    cache.invalidate(group_id=10)
+    cache.remember_versions({"group:10": 5}, generation)
+
+    assert cache.versions(["group:10"]) == {}
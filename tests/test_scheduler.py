@@ -0,0 +1,140 @@
+import datetime
+
+import pytest
+
+from app import db
+from app.models import ScheduledPost
+from app.scheduler import (
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_PUBLISHED,
+    STATUS_PUBLISHING,
+    PublishScheduler,
+    recover_interrupted,
+    schedule_post,
+)
+
+NOW = datetime.datetime(2024, 5, 1, 12, 0)
+
+
+@pytest.fixture
+def scheduler(app, fake_vk):
+    return PublishScheduler(
+        app, max_attempts=3, backoff_base=30, api_url=f"{fake_vk.url}/method"
+    )
+
+
+def test_due_post_is_published(scheduler, user):
+    post = schedule_post(user, "Новости компании", NOW, idempotency_key="guid-1")
+
+    assert scheduler.run_once(NOW) == 1
+
+    db.session.refresh(post)
+    assert post.status == STATUS_PUBLISHED
+    assert post.vk_post_id is not None
+    assert post.attempts == 1
+
+
+def test_future_post_is_not_claimed(scheduler, user):
+    schedule_post(user, "Новости компании", NOW + datetime.timedelta(minutes=5))
+
+    assert scheduler.run_once(NOW) == 0
+
+
+def test_republishing_interrupted_post_does_not_duplicate_it(scheduler, user, fake_vk):
+    post = schedule_post(user, "Новости компании", NOW, idempotency_key="guid-1")
+    scheduler.run_once(NOW)
+    db.session.refresh(post)
+    vk_post_id = post.vk_post_id
+
+    # Процесс упал после ответа VK, но до сохранения статуса: пост снова
+    # в статусе publishing и после перезапуска публикуется повторно.
+    post.status = STATUS_PUBLISHING
+    db.session.commit()
+    assert recover_interrupted() == 1
+    scheduler.run_once(NOW)
+
+    db.session.refresh(post)
+    assert post.status == STATUS_PUBLISHED
+    assert post.vk_post_id == vk_post_id
+    assert fake_vk.requests == 2
+    assert len(fake_vk._posts) == 1
+
+
+def test_failed_attempts_back_off_exponentially(scheduler, user, fake_vk):
+    fake_vk.error_rate = 1.0
+    post = schedule_post(user, "Новости компании", NOW)
+
+    scheduler.run_once(NOW)
+    db.session.refresh(post)
+    assert post.status == STATUS_PENDING
+    assert post.attempts == 1
+    assert post.last_error == "Internal server error"
+    assert post.next_attempt_at == NOW + datetime.timedelta(seconds=30)
+
+    # До следующей попытки пост не выбирается.
+    assert scheduler.run_once(NOW + datetime.timedelta(seconds=29)) == 0
+
+    retry_at = post.next_attempt_at
+    scheduler.run_once(retry_at)
+    db.session.refresh(post)
+    assert post.attempts == 2
+    assert post.next_attempt_at == retry_at + datetime.timedelta(seconds=60)
+
+    scheduler.run_once(post.next_attempt_at)
+    db.session.refresh(post)
+    assert post.status == STATUS_FAILED
+    assert post.attempts == 3
+
+
+def test_retry_after_error_keeps_idempotency_key(scheduler, user, fake_vk):
+    fake_vk.error_rate = 1.0
+    post = schedule_post(user, "Новости компании", NOW, idempotency_key="guid-2")
+    scheduler.run_once(NOW)
+
+    fake_vk.error_rate = 0.0
+    db.session.refresh(post)
+    scheduler.run_once(post.next_attempt_at)
+
+    post = db.session.get(ScheduledPost, post.id)
+    assert post.status == STATUS_PUBLISHED
+    assert post.idempotency_key == "guid-2"
+    assert list(fake_vk._posts) == ["guid-2"]
+
+
+def test_live_claim_is_not_recovered_by_another_process(scheduler, user):
+    post = schedule_post(user, "Новости компании", NOW)
+    scheduler.claim_due(NOW)
+
+    # Другой процесс запускает планировщик, пока пост публикуется.
+    assert recover_interrupted(timeout=900, now=NOW) == 0
+    db.session.refresh(post)
+    assert post.status == STATUS_PUBLISHING
+
+    later = NOW + datetime.timedelta(seconds=901)
+    assert recover_interrupted(timeout=900, now=later) == 1
+    db.session.refresh(post)
+    assert post.status == STATUS_PENDING
+    assert post.claimed_at is None
+
+
+def test_post_of_deleted_user_is_marked_failed(scheduler, user):
+    post = schedule_post(user, "Новости компании", NOW)
+    db.session.delete(user)
+    db.session.commit()
+
+    assert scheduler.run_once(NOW) == 1
+
+    db.session.refresh(post)
+    assert post.status == STATUS_FAILED
+    assert post.last_error == "User not found"
+
+
+def test_publish_time_with_timezone_is_stored_in_utc(user):
+    moscow = datetime.timezone(datetime.timedelta(hours=3))
+    post = schedule_post(
+        user, "Новости компании", datetime.datetime(2024, 5, 1, 15, 0, tzinfo=moscow)
+    )
+
+    assert post.publish_at == NOW
+    assert post.next_attempt_at == NOW
@@ -0,0 +1,115 @@
+import datetime
+import time
+
+import numpy as np
+import pytest
+
+from app import db
+from app.migrations import post_stat_posted_at_utc
+from app.models import PostStat
+from app.stats_sync import upsert_post_stats
+from social_stats.aggregator import StatsAggregator
+from social_stats.analytics import PostMetrics
+from social_stats.vk_stats import VKStats
+
+
+def test_groups_sharing_a_token_are_batched_into_execute(app, fake_vk):
+    aggregator = StatsAggregator(posts_per_group=5, api_url=f"{fake_vk.url}/method")
+    groups = [
+        {"name": f"Группа {i}", "group_id": i, "vk_api_key": "shared"}
+        for i in range(1, 31)
+    ]
+    groups.append({"name": "Своя", "group_id": 100, "vk_api_key": "own"})
+
+    result = aggregator.aggregate(groups)
+
+    # 30 групп x 2 метода = 60 вызовов: 3 execute на общем ключе и 1 на своем.
+    assert fake_vk.requests == 4
+    assert [row["name"] for row in result["groups"]] == [g["name"] for g in groups]
+    assert all(row["error"] is None for row in result["groups"])
+    assert all(row["followers"] == 12345 for row in result["groups"])
+    assert all(row["posts"] == 5 for row in result["groups"])
+    assert result["totals"]["followers"] == 12345 * 31
+
+
+def test_cached_groups_are_not_requested_again(app, fake_vk):
+    aggregator = StatsAggregator(posts_per_group=5, api_url=f"{fake_vk.url}/method")
+    first = [{"name": "Первая", "group_id": 1, "vk_api_key": "shared"}]
+    aggregator.aggregate(first)
+
+    second = first + [{"name": "Вторая", "group_id": 2, "vk_api_key": "shared"}]
+    result = aggregator.aggregate(second)
+
+    assert fake_vk.requests == 2
+    assert [row["posts"] for row in result["groups"]] == [5, 5]
+
+
+def test_failed_token_is_reported_per_group(app, fake_vk):
+    fake_vk.error_rate = 1.0
+    aggregator = StatsAggregator(api_url=f"{fake_vk.url}/method")
+
+    result = aggregator.aggregate(
+        [{"name": "Первая", "group_id": 1, "vk_api_key": "shared"}]
+    )
+
+    assert result["groups"][0]["error"] == "Internal server error"
+    assert result["groups"][0]["followers"] == 0
+
+
+@pytest.fixture
+def vladivostok(monkeypatch):
+    """
+    Часовой пояс процесса UTC+10: даты не должны зависеть от него.
+    """
+    monkeypatch.setenv("TZ", "Asia/Vladivostok")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_post_date_is_stored_in_utc_on_non_utc_server(app, vladivostok, user):
+    posted = datetime.datetime(2024, 5, 1, 23, 30)
+    timestamp = int(posted.replace(tzinfo=datetime.timezone.utc).timestamp())
+    item = {"id": 1, "date": timestamp, "likes": {"count": 5}, "views": {"count": 50}}
+
+    post = VKStats.parse_post(item)
+    upsert_post_stats("1", [post])
+
+    assert post["date"] == posted
+    rows = db.session.execute(
+        db.select(
+            PostStat.group_id,
+            PostStat.post_id,
+            PostStat.posted_at,
+            PostStat.likes,
+            PostStat.views,
+        )
+    ).all()
+    metrics = PostMetrics.from_rows(rows)
+    # 23:30 UTC — еще 1 мая, хотя во Владивостоке уже 2 мая.
+    assert list(metrics.daily()["days"]) == [np.datetime64("2024-05-01")]
+    assert metrics.best_time_heatmap()["counts"][2][23] == 1
+
+
+def test_migration_converts_local_post_dates_to_utc(app, vladivostok, user):
+    local = datetime.datetime(2024, 5, 2, 9, 30)
+    db.session.add(
+        PostStat(
+            group_id="1",
+            post_id=1,
+            posted_at=local,
+            likes=0,
+            views=0,
+            updated_at=local,
+        )
+    )
+    db.session.commit()
+
+    with db.engine.begin() as connection:
+        post_stat_posted_at_utc(connection)
+
+    db.session.expire_all()
+    assert db.session.execute(db.select(PostStat.posted_at)).scalar() == (
+        datetime.datetime(2024, 5, 1, 23, 30)
+    )
@@ -0,0 +1,28 @@
+import pytest
+import requests
+
+from social_publishers.streaming import ImageSource
+
+
+class RecordingSession(requests.Session):
+    """
+    Сессия requests, которая запоминает полученные ответы.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.responses = []
+
+    def get(self, url, **kwargs):
+        response = super().get(url, **kwargs)
+        self.responses.append(response)
+        return response
+
+
+def test_failed_image_download_is_closed(app, fake_telegram):
+    session = RecordingSession()
+
+    with pytest.raises(requests.HTTPError):
+        ImageSource(f"{fake_telegram.url}/missing.png", session=session)
+
+    assert session.responses[0].raw.closed
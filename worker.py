@@ -0,0 +1,12 @@
+from app import create_app
+from app.jobs import JobWorker
+
+app = create_app()
+
+if __name__ == "__main__":
+    # Отдельный процесс-воркер: забирает задачи из общей базы данных.
+    # В веб-процессе при этом можно выставить JOBS_BACKEND = "external".
+    # Планировщик публикаций запускается здесь же (если не включен в create_app).
+    app.extensions["publish_scheduler"].start()
+    worker = JobWorker(app, workers=app.config["JOBS_WORKERS"])
+    worker.run_forever()